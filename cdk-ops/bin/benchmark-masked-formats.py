@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""Compares gzipped TSV and Parquet as the format of masked access logs.
+
+Writes synthetic CloudFront access log records in both formats in the same
+way as ``mask-access-logs``, and reports the CPU time to write, the size of
+the output, and the time to load the output locally into typed columns.
+
+Run this script in the ``cdk-ops`` folder with pyarrow installed,
+
+.. code-block:: sh
+
+    python bin/benchmark-masked-formats.py --records 100000
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(__file__),
+    '..',
+    'lambda',
+    'libdatawarehouse',
+    'src',
+))
+from libdatawarehouse import columnar, tables
+import pyarrow.parquet
+
+
+# fields of the CloudFront standard log file.
+FIELD_NAMES = [
+    'date', 'time', 'x-edge-location', 'sc-bytes', 'c-ip', 'cs-method',
+    'cs(Host)', 'cs-uri-stem', 'sc-status', 'cs(Referer)', 'cs(User-Agent)',
+    'cs-uri-query', 'cs(Cookie)', 'x-edge-result-type', 'x-edge-request-id',
+    'x-host-header', 'cs-protocol', 'cs-bytes', 'time-taken',
+    'x-forwarded-for', 'ssl-protocol', 'ssl-cipher',
+    'x-edge-response-result-type', 'cs-protocol-version', 'fle-status',
+    'fle-encrypted-fields', 'c-port', 'time-to-first-byte',
+    'x-edge-detailed-result-type', 'sc-content-type', 'sc-content-len',
+    'sc-range-start', 'sc-range-end',
+]
+
+# columns of pre-encoded IDs appended by ``mask-access-logs``.
+ID_COLUMN_NAMES = [
+    'edge_location_id', 'page_id', 'referer_id', 'user_agent_id',
+    'result_type_id',
+]
+
+COLUMN_NAMES = ['row_num'] + FIELD_NAMES + ID_COLUMN_NAMES
+
+# number of rows in a row group; same as ``mask-access-logs``.
+ROW_GROUP_SIZE = 50000
+
+PATHS = ['/', '/index.html', '/blog/', '/blog/0001/', '/css/main.css']
+
+USER_AGENTS = [
+    'Mozilla/5.0%20(Macintosh;%20Intel%20Mac%20OS%20X%2010_15_7)',
+    'Mozilla/5.0%20(Windows%20NT%2010.0;%20Win64;%20x64)',
+    'Googlebot/2.1',
+]
+
+
+def generate_rows(rand: random.Random, count: int) -> List[Dict[str, str]]:
+    """Generates synthetic access log records on a single day.
+    """
+    rows = []
+    for i in range(count):
+        seconds = i * 86400 // count
+        result_type = rand.choice(['Hit', 'Miss', 'RefreshHit'])
+        rows.append(dict(zip(COLUMN_NAMES, [
+            str(i + 1),
+            '2022-10-01',
+            f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}'
+            f':{seconds % 60:02d}',
+            rand.choice(['NRT57-P1', 'NRT20-C3', 'KIX56-P1']),
+            str(rand.randint(200, 200000)),
+            f'{rand.randint(1, 223)}.0.0.0',
+            'GET',
+            'd1234567890.cloudfront.net',
+            rand.choice(PATHS),
+            rand.choice(['200', '200', '200', '304', '404']),
+            rand.choice(['-', 'https://www.google.com/']),
+            rand.choice(USER_AGENTS),
+            '-',
+            '-',
+            result_type,
+            f'{rand.getrandbits(256):064x}'[:54] + '==',
+            'codemonger.io',
+            'https',
+            str(rand.randint(100, 1000)),
+            f'{rand.uniform(0.001, 1.0):.3f}',
+            '-',
+            'TLSv1.3',
+            'TLS_AES_128_GCM_SHA256',
+            result_type,
+            'HTTP/2.0',
+            '-',
+            '-',
+            str(rand.randint(1024, 65535)),
+            f'{rand.uniform(0.001, 1.0):.3f}',
+            result_type,
+            'text/html',
+            str(rand.randint(200, 200000)),
+            '-',
+            '-',
+            # no pre-encoded IDs
+            *([columnar.NULL_VALUE] * len(ID_COLUMN_NAMES)),
+        ])))
+    return rows
+
+
+def write_tsv(rows: List[Dict[str, str]]) -> bytes:
+    """Writes given rows in a gzipped TSV file.
+    """
+    out = io.BytesIO()
+    with gzip.open(out, mode='wt') as gzipped:
+        tsv_writer = csv.DictWriter(
+            gzipped,
+            fieldnames=COLUMN_NAMES,
+            delimiter='\t',
+        )
+        tsv_writer.writeheader()
+        for row in rows:
+            tsv_writer.writerow(row)
+    return out.getvalue()
+
+
+def write_parquet(rows: List[Dict[str, str]]) -> bytes:
+    """Writes given rows in a Parquet file.
+    """
+    out = io.BytesIO()
+    buffer = columnar.RowGroupBuffer(tables.RAW_ACCESS_LOG_TABLE)
+    writer = pyarrow.parquet.ParquetWriter(
+        out,
+        buffer.schema,
+        compression='snappy',
+    )
+    for row in rows:
+        buffer.append([row[name] for name in COLUMN_NAMES])
+        if len(buffer) >= ROW_GROUP_SIZE:
+            writer.write_table(buffer.flush())
+    if len(buffer) > 0:
+        writer.write_table(buffer.flush())
+    writer.close()
+    return out.getvalue()
+
+
+def load_tsv(data: bytes) -> int:
+    """Parses a gzipped TSV file into typed values as COPY does.
+
+    :returns: number of loaded rows.
+    """
+    columns = tables.RAW_ACCESS_LOG_TABLE.columns
+    count = 0
+    with gzip.open(io.BytesIO(data), mode='rt') as gzipped:
+        tsv_reader = csv.reader(gzipped, delimiter='\t')
+        next(tsv_reader) # header
+        for values in tsv_reader:
+            for column, value in zip(columns, values):
+                columnar.parse_value(column.data_type, value)
+            count += 1
+    return count
+
+
+def load_parquet(data: bytes) -> int:
+    """Reads a Parquet file into typed columns.
+
+    :returns: number of loaded rows.
+    """
+    return pyarrow.parquet.read_table(io.BytesIO(data)).num_rows
+
+
+def measure(func: Callable, *args) -> Tuple[float, object]:
+    """Runs a given function and returns the CPU time in milliseconds and the
+    result.
+    """
+    start_time = time.process_time()
+    result = func(*args)
+    return (time.process_time() - start_time) * 1000.0, result
+
+
+def main():
+    """Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(
+        description='compares gzipped TSV and Parquet for masked access logs',
+    )
+    parser.add_argument(
+        '--records',
+        type=int,
+        default=100000,
+        help='number of records',
+    )
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    rows = generate_rows(random.Random(args.seed), args.records)
+    print(f'records: {args.records}')
+    for name, write, load in [
+        ('TSV (gzip)', write_tsv, load_tsv),
+        ('Parquet (snappy)', write_parquet, load_parquet),
+    ]:
+        write_ms, data = measure(write, rows)
+        load_ms, count = measure(load, data)
+        assert count == args.records
+        print(
+            f'{name}: write {write_ms:.1f} ms CPU,'
+            f' {len(data)} bytes,'
+            f' load {load_ms:.1f} ms CPU',
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""Checks the import time of the Lambda functions against budgets.
+
+Imports ``index`` of every Lambda function under ``lambda`` in a fresh
+Python process with ``-X importtime``, and fails if the cumulative import
+time, which includes the initialization at the module level, exceeds the
+budget of the function.
+
+Run this script in the ``cdk-ops`` folder with boto3 installed,
+
+.. code-block:: sh
+
+    python bin/check-import-time.py
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict
+
+
+LAMBDA_DIR = 'lambda'
+
+LIBDATAWAREHOUSE_SRC_DIR = os.path.join(LAMBDA_DIR, 'libdatawarehouse', 'src')
+
+# budgets of the import time in milliseconds.
+IMPORT_TIME_BUDGETS_MS = {
+    'delete-access-logs': 300.0,
+    'load-access-logs': 500.0,
+    'mask-access-logs': 300.0,
+    'populate-dw-database': 400.0,
+    'vacuum-table': 400.0,
+}
+
+# pattern of a line reported by -X importtime.
+# import time: self [us] | cumulative | imported package
+IMPORT_TIME_PATTERN = re.compile(
+    r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$',
+)
+
+# pattern of an environment variable read by a Lambda function.
+ENVIRONMENT_VARIABLE_PATTERN = re.compile(r"os\.environ\['(\w+)'\]")
+
+# dummy values of environment variables validated at the module level.
+DUMMY_ENVIRONMENT_VALUES = {
+    'OUTPUT_FORMAT': 'tsv',
+    'PARTITION_GRANULARITY': 'day',
+}
+
+
+def get_dummy_environment(function_dir: str) -> Dict[str, str]:
+    """Returns the environment to import a given Lambda function.
+
+    Assigns a dummy value, which can also be parsed as a number, to every
+    environment variable the function reads, except for variables in
+    ``DUMMY_ENVIRONMENT_VALUES``.
+    """
+    with open(os.path.join(function_dir, 'index.py'), encoding='utf-8') as f:
+        names = ENVIRONMENT_VARIABLE_PATTERN.findall(f.read())
+    env = os.environ.copy()
+    env.update({
+        name: DUMMY_ENVIRONMENT_VALUES.get(name, '0') for name in names
+    })
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.abspath(LIBDATAWAREHOUSE_SRC_DIR)] +
+        ([env['PYTHONPATH']] if 'PYTHONPATH' in env else []),
+    )
+    # caches bytecode as a deployed Lambda function does
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def measure_import_time(function_dir: str) -> float:
+    """Imports a given Lambda function and returns the cumulative import time
+    in milliseconds.
+
+    :raises RuntimeError: if the function cannot be imported.
+    """
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import index'],
+        cwd=function_dir,
+        env=get_dummy_environment(function_dir),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=False,
+    )
+    if res.returncode != 0:
+        raise RuntimeError(f'failed to import {function_dir}:\n{res.stderr}')
+    for line in res.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        # the top-level entry of index is not indented
+        if match is not None and match.group(3) == ' ' \
+            and match.group(4) == 'index':
+            return int(match.group(2)) * 0.001 # us → ms
+    raise RuntimeError(f'no import time of index in {function_dir}')
+
+
+def main():
+    """Runs the check.
+    """
+    parser = argparse.ArgumentParser(
+        description='checks the import time of the Lambda functions',
+    )
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=5,
+        help='number of imports measured per function',
+    )
+    parser.add_argument(
+        '--budget-ms',
+        type=float,
+        help='overrides the budgets of all the functions in milliseconds',
+    )
+    args = parser.parse_args()
+    exceeded = []
+    for function_name, budget in sorted(IMPORT_TIME_BUDGETS_MS.items()):
+        if args.budget_ms is not None:
+            budget = args.budget_ms
+        function_dir = os.path.join(LAMBDA_DIR, function_name)
+        measure_import_time(function_dir) # compiles bytecode
+        import_time = statistics.median(
+            measure_import_time(function_dir) for _ in range(args.runs)
+        )
+        status = 'OK' if import_time <= budget else 'EXCEEDED'
+        print(
+            f'{function_name}: {import_time:.1f} ms'
+            f' (budget {budget:.1f} ms) {status}',
+        )
+        if import_time > budget:
+            exceeded.append(function_name)
+    if len(exceeded) > 0:
+        print(f'import time exceeded the budget: {", ".join(exceeded)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
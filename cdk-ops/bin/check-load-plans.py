@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""Checks query plans of ``load-access-logs`` against recorded plans.
+
+Captures plans by invoking ``LoadAccessLogs`` with ``explainDate``, and
+compares them with the plans recorded in the repository.
+Flags statements whose plans have more broadcast, redistribution, or
+nested-loop joins, or whose estimated costs have grown beyond a threshold;
+please refer to ``libdatawarehouse.plans``.
+Exits with status 1 if any statement is flagged.
+
+Run this script in the ``cdk-ops`` folder,
+
+.. code-block:: sh
+
+    aws lambda invoke --function-name $LOAD_ACCESS_LOGS_FUNCTION_NAME \\
+        --cli-binary-format raw-in-base64-out \\
+        --payload '{"explainDate": "2023-01-31"}' \\
+        plans.json
+    python bin/check-load-plans.py plans.json
+
+Give ``--update`` to record the captured plans after reviewing them.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(__file__),
+    '..',
+    'lambda',
+    'libdatawarehouse',
+    'src',
+))
+from libdatawarehouse import plans
+
+
+# recorded plans of the statements of ``load-access-logs``.
+DEFAULT_RECORDED_PLANS_PATH = os.path.join(
+    os.path.dirname(__file__),
+    '..',
+    'plans',
+    'load-access-logs.json',
+)
+
+
+def read_captured_plans(path: str) -> Dict[str, plans.Plan]:
+    """Reads plans in the output of ``LoadAccessLogs``.
+    """
+    with open(path, mode='r', encoding='utf-8') as f:
+        output = json.load(f)
+    if 'plans' not in output:
+        raise ValueError(f'no plans in {path}: {output}')
+    return plans.load_plans(json.dumps(output['plans']))
+
+
+def print_differences(
+    recorded_plans: Dict[str, plans.Plan],
+    captured_plans: Dict[str, plans.Plan],
+):
+    """Prints statements added, removed, or re-planned since the recording.
+    """
+    for label in captured_plans.keys() - recorded_plans.keys():
+        print(f'new statement: {label}')
+    for label in recorded_plans.keys() - captured_plans.keys():
+        print(f'removed statement: {label}')
+    for label, captured in captured_plans.items():
+        recorded = recorded_plans.get(label)
+        if recorded is not None and recorded.lines != captured.lines:
+            print(f'plan changed: {label}')
+
+
+def main():
+    """Compares the plans.
+    """
+    parser = argparse.ArgumentParser(
+        description='checks query plans of load-access-logs',
+    )
+    parser.add_argument(
+        'captured',
+        help='output of LoadAccessLogs invoked with explainDate',
+    )
+    parser.add_argument(
+        '--recorded',
+        default=DEFAULT_RECORDED_PLANS_PATH,
+        help='JSON file of the recorded plans',
+    )
+    parser.add_argument(
+        '--cost-threshold',
+        type=float,
+        default=plans.DEFAULT_COST_THRESHOLD,
+        help='ratio of the growth of an estimated cost to be flagged',
+    )
+    parser.add_argument(
+        '--update',
+        action='store_true',
+        help='records the captured plans instead of comparing them',
+    )
+    args = parser.parse_args()
+    captured_plans = read_captured_plans(args.captured)
+    if args.update:
+        os.makedirs(os.path.dirname(args.recorded), exist_ok=True)
+        with open(args.recorded, mode='w', encoding='utf-8') as f:
+            f.write(plans.dump_plans(captured_plans))
+        print(f'recorded {len(captured_plans)} plans in {args.recorded}')
+        return
+    if not os.path.exists(args.recorded):
+        print(f'no recorded plans: {args.recorded}; run with --update')
+        sys.exit(1)
+    with open(args.recorded, mode='r', encoding='utf-8') as f:
+        recorded_plans = plans.load_plans(f.read())
+    print_differences(recorded_plans, captured_plans)
+    regressions = plans.compare_plans(
+        recorded_plans,
+        captured_plans,
+        args.cost_threshold,
+    )
+    for regression in regressions:
+        print(f'FLAGGED {regression}')
+    if len(regressions) > 0:
+        sys.exit(1)
+    print(f'no regressions in {len(captured_plans)} plans')
+
+
+if __name__ == '__main__':
+    main()
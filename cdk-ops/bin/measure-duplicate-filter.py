@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+"""Measures the size and false positive rate of the duplicate filter on
+synthetic access logs.
+
+Adds synthetic ``x-edge-request-id`` values of a day to a Bloom filter
+created in the same way as ``mask-access-logs``, and counts false positives
+over as many other synthetic values.
+
+Run this script in the ``cdk-ops`` folder,
+
+.. code-block:: sh
+
+    python bin/measure-duplicate-filter.py --records 100000
+"""
+
+import argparse
+import base64
+import gzip
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(__file__),
+    '..',
+    'lambda',
+    'libdatawarehouse',
+    'src',
+))
+from libdatawarehouse import bloom
+
+
+def generate_request_id(rand: random.Random) -> str:
+    """Generates a synthetic value of ``x-edge-request-id``.
+
+    CloudFront gives a 56-character Base64 string.
+    """
+    data = rand.getrandbits(320).to_bytes(40, 'big')
+    return base64.urlsafe_b64encode(data).decode('ascii')[:54] + '=='
+
+
+def main():
+    """Runs the measurement.
+    """
+    parser = argparse.ArgumentParser(
+        description='measures the size and false positive rate of the'
+            ' duplicate filter',
+    )
+    parser.add_argument(
+        '--records',
+        type=int,
+        default=100000,
+        help='number of records per day',
+    )
+    parser.add_argument(
+        '--capacity',
+        type=int,
+        help='capacity of the filter. defaults to --records',
+    )
+    parser.add_argument(
+        '--false-positive-rate',
+        type=float,
+        default=0.001,
+        help='false positive rate of the filter',
+    )
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    rand = random.Random(args.seed)
+    bloom_filter = bloom.create_bloom_filter(
+        args.capacity or args.records,
+        args.false_positive_rate,
+    )
+    added = set()
+    while len(added) < args.records:
+        request_id = generate_request_id(rand)
+        if request_id not in added:
+            added.add(request_id)
+            bloom_filter.add(request_id)
+    false_positives = 0
+    tested = 0
+    while tested < args.records:
+        request_id = generate_request_id(rand)
+        if request_id in added:
+            continue
+        tested += 1
+        if request_id in bloom_filter:
+            false_positives += 1
+    data = bloom_filter.to_bytes()
+    print(f'records: {args.records}')
+    print(f'bits: {bloom_filter.num_bits}, hashes: {bloom_filter.num_hashes}')
+    print(f'size: {len(data)} bytes ({len(gzip.compress(data))} gzipped)')
+    print(
+        'false positive rate:'
+        f' {false_positives / tested:.6f} measured,'
+        f' {bloom_filter.estimate_false_positive_rate():.6f} estimated,'
+        f' {args.false_positive_rate:.6f} configured',
+    )
+
+
+if __name__ == '__main__':
+    main()
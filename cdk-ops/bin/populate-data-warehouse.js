@@ -19,15 +19,26 @@ yargs(hideBin(process.argv))
         describe: 'deployment stage of the data warehouse',
         choices: ['development', 'production'],
       });
+      _yargs.option('compare-compression', {
+        describe: 'compares the compression encodings of the tables with ' +
+          'ones suggested by ANALYZE COMPRESSION instead of populating',
+        type: 'boolean',
+        default: false,
+      });
     },
     run,
   )
   .help()
   .argv;
 
-async function run({ stage }) {
+async function run({ stage, compareCompression }) {
   console.log('obtaining populate function for', stage);
   const functionArn = await getPopulateFunctionArn(stage);
+  if (compareCompression) {
+    console.log('comparing compression encodings for', stage);
+    await runCompareCompression(functionArn);
+    return;
+  }
   console.log('running populate function for', stage);
   await runPopulate(functionArn);
   console.log('populated the data warehouse for', stage);
@@ -74,3 +85,34 @@ async function runPopulate(functionArn) {
     throw new Error('failed to populate the data warehouse');
   }
 }
+
+// runs a given populate function to compare the compression encodings of the
+// tables, and prints columns whose encodings differ.
+async function runCompareCompression(functionArn) {
+  const client = new LambdaClient({});
+  const command = new InvokeCommand({
+    FunctionName: functionArn,
+    Payload: JSON.stringify({ compareCompression: true }),
+  });
+  const results = await client.send(command);
+  const decoder = new TextDecoder();
+  const payload = decoder.decode(results.Payload);
+  if (results.StatusCode !== 200 || results.FunctionError != null) {
+    console.error('failed to compare compression encodings', payload);
+    throw new Error('failed to compare compression encodings');
+  }
+  const { comparisons } = JSON.parse(payload);
+  const mismatches = comparisons.filter(c => c.mismatched);
+  if (mismatches.length === 0) {
+    console.log('all the columns have the suggested encodings');
+    return;
+  }
+  console.table(mismatches.map(c => ({
+    table: c.tableName,
+    column: c.column,
+    defined: c.defined,
+    current: c.current,
+    suggested: c.suggested,
+    'reduction (%)': c.estimatedReduction,
+  })));
+}
@@ -0,0 +1,958 @@
+# -*- coding: utf-8 -*-
+
+"""Replays a day of CloudFront access logs through the access logs ETL.
+
+Runs ``mask-access-logs``, ``delete-access-logs``, and ``load-access-logs``
+in this process against local stand-ins for S3, SQS, and the Redshift Data
+API, and reports,
+* end-to-end latency per access logs file from its arrival to masking,
+  deletion of the original, and loading
+* number of S3 requests by stage and operation
+* CPU time per stage
+
+The stand-ins deliver S3 notifications to queues in the same way as the
+``AccessLogsETL`` stack, and each queue invokes its handler with batches of
+``--batch-size`` messages.
+Masked access logs are loaded by a micro-batch run every ``--load-interval``
+files, and by a daily run at the end.
+The Data API stand-in runs no SQL but keeps track of loaded objects, so the
+``load`` stage covers the work of the Lambda function but not of Redshift.
+
+Replays a synthetic day by default, or gzipped access logs files recorded in
+a folder specified to ``--source-dir``.
+Latency is measured in wall-clock time of this process, so it includes time
+waiting in queues and behind other files but no network time.
+
+Run this script in the ``cdk-ops`` folder with the dependencies of the
+Lambda functions installed,
+
+.. code-block:: sh
+
+    python bin/replay-etl.py --objects 288 --records 200 --load-interval 12
+"""
+
+import argparse
+import collections
+import datetime
+import gzip
+import importlib.util
+import io
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import uuid
+import zlib
+from types import ModuleType, SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(__file__),
+    '..',
+    'lambda',
+    'libdatawarehouse',
+    'src',
+))
+from botocore.exceptions import ClientError
+from libdatawarehouse import (
+    columnar,
+    integrity,
+    partitions,
+    profiling,
+    tables,
+)
+
+
+LAMBDA_DIR = os.path.join(os.path.dirname(__file__), '..', 'lambda')
+
+SOURCE_BUCKET_NAME = 'access-logs'
+MASKED_BUCKET_NAME = 'masked-access-logs'
+QUERY_CACHE_BUCKET_NAME = 'query-cache'
+MASKED_KEY_PREFIX = 'masked/'
+
+# environment variables of the Lambda functions; same as ``AccessLogsETL``
+# except for names and ARNs.
+MASK_ENVIRONMENT = {
+    'SOURCE_BUCKET_NAME': SOURCE_BUCKET_NAME,
+    'DESTINATION_BUCKET_NAME': MASKED_BUCKET_NAME,
+    'DESTINATION_KEY_PREFIX': MASKED_KEY_PREFIX,
+    'QUARANTINE_KEY_PREFIX': 'quarantine/',
+    'DUPLICATE_FILTER_KEY_PREFIX': 'duplicate-filters/',
+    'DUPLICATE_FILTER_CAPACITY': '100000',
+    'DUPLICATE_FALSE_POSITIVE_RATE': '0.001',
+    'PROFILE_BUCKET_NAME': MASKED_BUCKET_NAME,
+    'PROFILE_KEY_PREFIX': 'profiles/',
+    'PROFILE_SAMPLE_RATE': '0',
+    # the local Data API cannot export the dimension tables
+    'DIMENSION_SNAPSHOT_KEY': '',
+}
+DELETE_ENVIRONMENT = {
+    'SOURCE_BUCKET_NAME': SOURCE_BUCKET_NAME,
+    'DESTINATION_BUCKET_NAME': MASKED_BUCKET_NAME,
+    'DESTINATION_KEY_PREFIX': MASKED_KEY_PREFIX,
+}
+LOAD_ENVIRONMENT = {
+    'SOURCE_BUCKET_NAME': MASKED_BUCKET_NAME,
+    'SOURCE_KEY_PREFIX': MASKED_KEY_PREFIX,
+    'MANIFEST_KEY_PREFIX': 'manifests/',
+    'LATE_ARRIVAL_DAYS': '3',
+    'REDSHIFT_WORKGROUP_NAME': 'replay',
+    'COPY_ROLE_ARN': 'arn:aws:iam::123456789012:role/replay',
+    'VACUUM_WORKFLOW_ARN':
+        'arn:aws:states:us-east-1:123456789012:stateMachine:replay',
+    'QUERY_CACHE_BUCKET_NAME': QUERY_CACHE_BUCKET_NAME,
+    'PROFILE_BUCKET_NAME': MASKED_BUCKET_NAME,
+    'PROFILE_KEY_PREFIX': 'profiles/',
+    'PROFILE_SAMPLE_RATE': '0',
+    'RETENTION_MONTHS': '0',
+    # the local Data API cannot export the dimension tables
+    'DIMENSION_SNAPSHOT_KEY': '',
+}
+
+# remaining time that the stand-in of the Lambda context reports.
+REMAINING_TIME_IN_MILLIS = 15 * 60 * 1000
+
+# maximum number of keys in a page of ListObjectsV2.
+MAX_KEYS_PER_PAGE = 1000
+
+# fields of the CloudFront standard log file.
+FIELD_NAMES = [
+    'date', 'time', 'x-edge-location', 'sc-bytes', 'c-ip', 'cs-method',
+    'cs(Host)', 'cs-uri-stem', 'sc-status', 'cs(Referer)', 'cs(User-Agent)',
+    'cs-uri-query', 'cs(Cookie)', 'x-edge-result-type', 'x-edge-request-id',
+    'x-host-header', 'cs-protocol', 'cs-bytes', 'time-taken',
+    'x-forwarded-for', 'ssl-protocol', 'ssl-cipher',
+    'x-edge-response-result-type', 'cs-protocol-version', 'fle-status',
+    'fle-encrypted-fields', 'c-port', 'time-to-first-byte',
+    'x-edge-detailed-result-type', 'sc-content-type', 'sc-content-len',
+    'sc-range-start', 'sc-range-end',
+]
+
+PATHS = ['/', '/index.html', '/blog/', '/blog/0001/', '/css/main.css']
+
+USER_AGENTS = [
+    'Mozilla/5.0%20(Macintosh;%20Intel%20Mac%20OS%20X%2010_15_7)',
+    'Mozilla/5.0%20(Windows%20NT%2010.0;%20Win64;%20x64)',
+    'Googlebot/2.1',
+]
+
+# pattern of the table in which a run records its S3 objects.
+RUN_OBJECT_TABLE_PATTERN = re.compile(
+    r'INSERT INTO load_run_object_([0-9a-f]+)',
+)
+
+# pattern of an S3 object recorded by a run in its table.
+RUN_OBJECT_PATTERN = re.compile(
+    r"\('((?:[^'\\]|''|\\\\)*)', '\d{4}-\d{2}-\d{2}'\)",
+)
+
+# pattern of a checkpoint recorded in ``load_checkpoint``.
+CHECKPOINT_PATTERN = re.compile(r"VALUES \('([0-9a-f]+)', '(\w+)',")
+
+# last stage of a run of ``load-access-logs``.
+LOADED_STAGE = 'loaded'
+
+
+class NoSuchKey(ClientError):
+    """Error that the S3 stand-in raises for a missing object.
+    """
+    def __init__(self, operation_name: str):
+        super().__init__(
+            {
+                'Error': {
+                    'Code': 'NoSuchKey',
+                    'Message': 'The specified key does not exist.',
+                },
+            },
+            operation_name,
+        )
+
+
+class LocalQueue:
+    """Stand-in for an SQS queue that invokes a handler with batches of
+    messages.
+    """
+    def __init__(self, name: str, batch_size: int):
+        self.name = name
+        self.batch_size = batch_size
+        self.messages: collections.deque = collections.deque()
+
+
+    def send_message(self, body: str):
+        """Enqueues a given message.
+        """
+        self.messages.append({
+            'messageId': str(uuid.uuid4()),
+            'body': body,
+        })
+
+
+    def receive_batches(self, flush: bool) -> Iterator[Dict]:
+        """Dequeues full batches of messages as SQS events.
+
+        :param bool flush: whether a partial batch is also dequeued, as a
+        batching window elapses.
+        """
+        while len(self.messages) >= self.batch_size \
+                or (flush and len(self.messages) > 0):
+            count = min(self.batch_size, len(self.messages))
+            yield {
+                'Records': [self.messages.popleft() for _ in range(count)],
+            }
+
+
+class LocalS3:
+    """Stand-in for the S3 client that keeps objects in memory.
+
+    Counts requests by ``stage`` and operation, and sends object-creation
+    notifications to queues added by ``add_notification`` and to listeners
+    added by ``add_listener``.
+    Thread-safe because ``load-access-logs`` runs batches in threads.
+    """
+    def __init__(self):
+        self.buckets: Dict[str, Dict[str, Dict]] = collections.defaultdict(
+            dict,
+        )
+        self.uploads: Dict[str, Dict] = {}
+        self.notifications: List[Tuple[str, str, LocalQueue]] = []
+        self.listeners: List[Callable[[str, str], None]] = []
+        self.request_counts: Dict[Tuple[str, str], int] = collections.Counter()
+        self.stage = 'replay'
+        self.lock = threading.Lock()
+        self.exceptions = SimpleNamespace(NoSuchKey=NoSuchKey)
+
+
+    def add_notification(self, bucket_name: str, prefix: str, queue):
+        """Notifies a given queue of objects created in a given bucket with a
+        given prefix.
+        """
+        self.notifications.append((bucket_name, prefix, queue))
+
+
+    def add_listener(self, listener: Callable[[str, str], None]):
+        """Calls a given function with the bucket name and key of every
+        created object.
+        """
+        self.listeners.append(listener)
+
+
+    def count_request(self, operation: str):
+        """Counts a request of a given operation in the current stage.
+        """
+        with self.lock:
+            self.request_counts[(self.stage, operation)] += 1
+
+
+    def store_object(
+        self,
+        bucket_name: str,
+        key: str,
+        body: bytes,
+        metadata: Optional[Dict[str, str]] = None,
+        checksum: Optional[str] = None,
+    ):
+        """Stores a given object and sends notifications.
+
+        :param Optional[str] checksum: additional CRC32 checksum that S3
+        returns.
+        """
+        with self.lock:
+            self.buckets[bucket_name][key] = {
+                'Body': body,
+                'LastModified': datetime.datetime.now(datetime.timezone.utc),
+                'Metadata': metadata or {},
+                'ChecksumCRC32': checksum,
+            }
+        for listener in self.listeners:
+            listener(bucket_name, key)
+        for notified_bucket_name, prefix, queue in self.notifications:
+            if notified_bucket_name == bucket_name and key.startswith(prefix):
+                queue.send_message(json.dumps({
+                    'Records': [
+                        {
+                            'eventName': 'ObjectCreated:Put',
+                            's3': {
+                                'bucket': {'name': bucket_name},
+                                'object': {'key': key, 'size': len(body)},
+                            },
+                        },
+                    ],
+                }))
+
+
+    def get_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Range: Optional[str] = None,
+        **_,
+    ) -> Dict:
+        self.count_request('GetObject')
+        with self.lock:
+            obj = self.buckets[Bucket].get(Key)
+        if obj is None:
+            raise NoSuchKey('GetObject')
+        body = obj['Body']
+        if Range is not None:
+            # only "bytes={start}-{end}" is supported
+            start, end = Range[len('bytes='):].split('-')
+            body = body[int(start):int(end) + 1]
+        return {
+            'Body': io.BytesIO(body),
+            'ContentLength': len(body),
+            'LastModified': obj['LastModified'],
+        }
+
+
+    def head_object(self, Bucket: str, Key: str, **_) -> Dict:
+        self.count_request('HeadObject')
+        with self.lock:
+            obj = self.buckets[Bucket].get(Key)
+        if obj is None:
+            raise ClientError(
+                {'Error': {'Code': '404', 'Message': 'Not Found'}},
+                'HeadObject',
+            )
+        res = {
+            'ContentLength': len(obj['Body']),
+            'LastModified': obj['LastModified'],
+            'Metadata': obj['Metadata'],
+        }
+        if obj['ChecksumCRC32'] is not None:
+            res['ChecksumCRC32'] = obj['ChecksumCRC32']
+        return res
+
+
+    def put_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Body,
+        Metadata: Optional[Dict[str, str]] = None,
+        ChecksumCRC32: Optional[str] = None,
+        **_,
+    ) -> Dict:
+        self.count_request('PutObject')
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        elif not isinstance(Body, bytes):
+            Body = Body.read()
+        if ChecksumCRC32 is not None \
+                and ChecksumCRC32 != integrity.encode_crc32(zlib.crc32(Body)):
+            raise ClientError(
+                {'Error': {'Code': 'BadDigest', 'Message': 'CRC32'}},
+                'PutObject',
+            )
+        self.store_object(Bucket, Key, Body, Metadata, ChecksumCRC32)
+        return {}
+
+
+    def copy_object(
+        self,
+        Bucket: str,
+        Key: str,
+        CopySource: Dict[str, str],
+        Metadata: Optional[Dict[str, str]] = None,
+        ChecksumAlgorithm: Optional[str] = None,
+        **_,
+    ) -> Dict:
+        self.count_request('CopyObject')
+        with self.lock:
+            src = self.buckets[CopySource['Bucket']][CopySource['Key']]
+        checksum = None
+        if ChecksumAlgorithm == 'CRC32':
+            checksum = integrity.encode_crc32(zlib.crc32(src['Body']))
+        self.store_object(Bucket, Key, src['Body'], Metadata, checksum)
+        return {}
+
+
+    def delete_object(self, Bucket: str, Key: str, **_) -> Dict:
+        self.count_request('DeleteObject')
+        with self.lock:
+            self.buckets[Bucket].pop(Key, None)
+        return {}
+
+
+    def create_multipart_upload(
+        self,
+        Metadata: Optional[Dict[str, str]] = None,
+        **_,
+    ) -> Dict:
+        self.count_request('CreateMultipartUpload')
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {'metadata': Metadata, 'parts': {}}
+        return {'UploadId': upload_id}
+
+
+    def upload_part(
+        self,
+        UploadId: str,
+        PartNumber: int,
+        Body: bytes,
+        **_,
+    ) -> Dict:
+        self.count_request('UploadPart')
+        with self.lock:
+            self.uploads[UploadId]['parts'][PartNumber] = bytes(Body)
+        return {'ETag': f'"{UploadId}-{PartNumber}"'}
+
+
+    def complete_multipart_upload(
+        self,
+        Bucket: str,
+        Key: str,
+        UploadId: str,
+        MultipartUpload: Dict,
+        **_,
+    ) -> Dict:
+        self.count_request('CompleteMultipartUpload')
+        with self.lock:
+            upload = self.uploads.pop(UploadId)
+        body = b''.join(
+            upload['parts'][part['PartNumber']]
+                for part in MultipartUpload['Parts']
+        )
+        # S3 returns the checksum of the checksums of the parts
+        checksum = f'composite-{len(MultipartUpload["Parts"])}'
+        self.store_object(Bucket, Key, body, upload['metadata'], checksum)
+        return {}
+
+
+    def abort_multipart_upload(self, UploadId: str, **_) -> Dict:
+        self.count_request('AbortMultipartUpload')
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+
+    def get_paginator(self, operation_name: str):
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(operation_name)
+        return SimpleNamespace(paginate=self.paginate_objects)
+
+
+    def paginate_objects(
+        self,
+        Bucket: str,
+        Prefix: str = '',
+        Delimiter: Optional[str] = None,
+        **_,
+    ) -> Iterator[Dict]:
+        with self.lock:
+            keys = sorted(
+                key for key in self.buckets[Bucket] if key.startswith(Prefix)
+            )
+            objects = {key: self.buckets[Bucket][key] for key in keys}
+        contents = []
+        common_prefixes = []
+        for key in keys:
+            if Delimiter is not None and Delimiter in key[len(Prefix):]:
+                rest = key[len(Prefix):]
+                common_prefix = Prefix + rest[:rest.index(Delimiter) + 1]
+                if common_prefix not in common_prefixes:
+                    common_prefixes.append(common_prefix)
+                continue
+            contents.append({
+                'Key': key,
+                'Size': len(objects[key]['Body']),
+                'LastModified': objects[key]['LastModified'],
+            })
+        entries = [('Contents', obj) for obj in contents] + [
+            ('CommonPrefixes', {'Prefix': prefix})
+                for prefix in common_prefixes
+        ]
+        for i in range(0, max(len(entries), 1), MAX_KEYS_PER_PAGE):
+            self.count_request('ListObjectsV2')
+            page: Dict[str, List[Dict]] = {}
+            for name, entry in entries[i:i + MAX_KEYS_PER_PAGE]:
+                page.setdefault(name, []).append(entry)
+            yield page
+
+
+class LocalDataApi:
+    """Stand-in for the Redshift Data API client that runs no SQL.
+
+    Keeps track of S3 objects that runs of ``load-access-logs`` record in
+    their ``load_run_object_<run-id>`` tables, and marks them loaded when the
+    ``loaded`` stage of the run finishes.
+    Answers the query over ``loaded_object`` and returns no records for other
+    queries.
+    """
+    def __init__(self, on_loaded: Callable[[str], None]):
+        self.on_loaded = on_loaded
+        self.run_objects: Dict[str, List[str]] = {}
+        self.loaded_keys: List[str] = []
+        self.results: Dict[str, List[List[Dict]]] = {}
+        self.num_batches = 0
+        self.num_statements = 0
+        self.lock = threading.Lock()
+
+
+    def execute_statement(self, Sql: str, **_) -> Dict:
+        with self.lock:
+            self.num_statements += 1
+            records = []
+            if Sql.startswith(
+                f'SELECT object_key FROM {tables.LOADED_OBJECT_TABLE_NAME}',
+            ):
+                records = [[{'stringValue': key}] for key in self.loaded_keys]
+            statement_id = uuid.uuid4().hex
+            self.results[statement_id] = records
+        return {'Id': statement_id}
+
+
+    def batch_execute_statement(self, Sqls: List[str], **_) -> Dict:
+        with self.lock:
+            self.num_batches += 1
+            self.num_statements += len(Sqls)
+        for sql in Sqls:
+            self.run_statement(sql)
+        return {'Id': uuid.uuid4().hex}
+
+
+    def run_statement(self, sql: str):
+        """Keeps track of S3 objects of runs in a given statement.
+        """
+        run_match = RUN_OBJECT_TABLE_PATTERN.match(sql)
+        if run_match is not None:
+            run_id = run_match.group(1)
+            for key in RUN_OBJECT_PATTERN.findall(sql):
+                key = key.replace("''", "'").replace('\\\\', '\\')
+                with self.lock:
+                    self.run_objects.setdefault(run_id, []).append(key)
+        elif sql.startswith(
+            f'INSERT INTO {tables.LOAD_CHECKPOINT_TABLE_NAME}',
+        ):
+            match = CHECKPOINT_PATTERN.search(sql)
+            if match is None or match.group(2) != LOADED_STAGE:
+                return
+            with self.lock:
+                keys = self.run_objects.pop(match.group(1), [])
+                self.loaded_keys.extend(keys)
+            for key in keys:
+                self.on_loaded(key)
+
+
+    def describe_statement(self, Id: str) -> Dict:
+        return {
+            'Id': Id,
+            'Status': 'FINISHED',
+            'Duration': 0,
+            'HasResultSet': Id in self.results,
+        }
+
+
+    def get_statement_result(self, Id: str, **_) -> Dict:
+        with self.lock:
+            records = self.results.pop(Id)
+        return {
+            'Records': records,
+            'ColumnMetadata': [{'name': 'object_key', 'typeName': 'varchar'}],
+            'TotalNumRows': len(records),
+        }
+
+
+    def cancel_statement(self, **_) -> Dict:
+        return {'Status': True}
+
+
+class Timeline:
+    """Wall-clock timestamps of access logs files passing through the stages.
+    """
+    def __init__(self):
+        self.arrived: Dict[str, float] = {}
+        self.masked: Dict[str, List[str]] = collections.defaultdict(list)
+        self.masked_at: Dict[str, float] = {}
+        self.deleted_at: Dict[str, float] = {}
+        self.loaded_at: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+
+    def on_created(self, bucket_name: str, key: str):
+        """Records that a masked object of an access logs file is created.
+        """
+        if bucket_name != MASKED_BUCKET_NAME:
+            return
+        src_key = get_source_key(key)
+        if src_key is None:
+            return
+        with self.lock:
+            self.masked[src_key].append(key)
+            self.masked_at[src_key] = time.perf_counter()
+
+
+    def on_deleted(self, masked_keys: List[str]):
+        """Records that the original access logs files of given masked
+        objects are deleted.
+        """
+        now = time.perf_counter()
+        for key in masked_keys:
+            src_key = get_source_key(key)
+            if src_key is not None:
+                self.deleted_at.setdefault(src_key, now)
+
+
+    def on_loaded(self, masked_key: str):
+        """Records that a masked object is loaded.
+        """
+        with self.lock:
+            self.loaded_at[masked_key] = time.perf_counter()
+
+
+    def get_latencies(self) -> Dict[str, List[float]]:
+        """Returns the latencies in milliseconds of access logs files by
+        stage.
+
+        A file is loaded when all of its masked objects are loaded.
+        """
+        latencies: Dict[str, List[float]] = {
+            'masked': [],
+            'deleted': [],
+            'loaded': [],
+        }
+        for src_key, arrived in self.arrived.items():
+            if src_key in self.masked_at:
+                latencies['masked'].append(self.masked_at[src_key] - arrived)
+            if src_key in self.deleted_at:
+                latencies['deleted'].append(self.deleted_at[src_key] - arrived)
+            masked_keys = self.masked.get(src_key, [])
+            if len(masked_keys) > 0 \
+                    and all(key in self.loaded_at for key in masked_keys):
+                latencies['loaded'].append(
+                    max(self.loaded_at[key] for key in masked_keys) - arrived,
+                )
+        return {
+            stage: [latency * 1000.0 for latency in values]
+                for stage, values in latencies.items()
+        }
+
+
+def get_source_key(masked_key: str) -> Optional[str]:
+    """Returns the key of the original access logs file of a given masked
+    object.
+
+    :returns: ``None`` if ``masked_key`` is not of masked access logs.
+    """
+    if not masked_key.startswith(MASKED_KEY_PREFIX):
+        return None
+    partitioned_key = partitions.parse_partitioned_key(
+        masked_key[len(MASKED_KEY_PREFIX):],
+    )
+    if partitioned_key is None:
+        return None
+    name = partitioned_key.name
+    if name.endswith(columnar.PARQUET_SUFFIX):
+        name = name[:-len(columnar.PARQUET_SUFFIX)]
+    return name
+
+
+def list_masked_dates(s3: LocalS3) -> List[datetime.date]:
+    """Lists dates of masked objects in ascending order.
+    """
+    dates = set()
+    for key in list(s3.buckets[MASKED_BUCKET_NAME]):
+        if not key.startswith(MASKED_KEY_PREFIX):
+            continue
+        parsed = partitions.parse_partitioned_key(key[len(MASKED_KEY_PREFIX):])
+        if parsed is not None:
+            dates.add(parsed.partition.date)
+    return sorted(dates)
+
+
+def import_handler(name: str, environment: Dict[str, str]) -> ModuleType:
+    """Imports ``index.py`` of a given Lambda function with given environment
+    variables.
+
+    Every Lambda function reads its environment variables at import.
+    """
+    os.environ.update(environment)
+    spec = importlib.util.spec_from_file_location(
+        name.replace('-', '_'),
+        os.path.join(LAMBDA_DIR, name, 'index.py'),
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_context(function_name: str) -> SimpleNamespace:
+    """Returns a stand-in of the Lambda context.
+    """
+    return SimpleNamespace(
+        function_name=function_name,
+        aws_request_id=str(uuid.uuid4()),
+        get_remaining_time_in_millis=lambda: REMAINING_TIME_IN_MILLIS,
+    )
+
+
+def generate_access_logs(
+    rand: random.Random,
+    date: datetime.date,
+    num_objects: int,
+    num_records: int,
+    num_distributions: int,
+) -> Iterator[Tuple[str, bytes]]:
+    """Generates synthetic access logs files delivered over a given day.
+
+    Files are evenly spaced over the day and distributed to CloudFront
+    distributions in turn.
+
+    :returns: iterator of S3 object keys and gzipped contents.
+    """
+    distribution_ids = [f'E{i + 1:013d}' for i in range(num_distributions)]
+    for i in range(num_objects):
+        start_seconds = i * 86400 // num_objects
+        distribution_id = distribution_ids[i % num_distributions]
+        key = ''.join([
+            f'{distribution_id}.',
+            f'{date.isoformat()}-{start_seconds // 3600:02d}.',
+            f'{rand.getrandbits(32):08x}.gz',
+        ])
+        lines = [
+            '#Version: 1.0',
+            '#Fields: ' + ' '.join(FIELD_NAMES),
+        ]
+        for j in range(num_records):
+            seconds = start_seconds + j * (86400 // num_objects) // num_records
+            result_type = rand.choice(['Hit', 'Miss', 'RefreshHit'])
+            lines.append('\t'.join([
+                date.isoformat(),
+                f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}'
+                f':{seconds % 60:02d}',
+                rand.choice(['NRT57-P1', 'NRT20-C3', 'KIX56-P1']),
+                str(rand.randint(200, 200000)),
+                f'{rand.randint(1, 223)}.{rand.randint(0, 255)}.0.1',
+                'GET',
+                'd1234567890.cloudfront.net',
+                rand.choice(PATHS),
+                rand.choice(['200', '200', '200', '304', '404']),
+                rand.choice(['-', 'https://www.google.com/']),
+                rand.choice(USER_AGENTS),
+                '-',
+                '-',
+                result_type,
+                f'{rand.getrandbits(256):064x}'[:54] + '==',
+                'codemonger.io',
+                'https',
+                str(rand.randint(100, 1000)),
+                f'{rand.uniform(0.001, 1.0):.3f}',
+                '-',
+                'TLSv1.3',
+                'TLS_AES_128_GCM_SHA256',
+                result_type,
+                'HTTP/2.0',
+                '-',
+                '-',
+                str(rand.randint(1024, 65535)),
+                f'{rand.uniform(0.001, 1.0):.3f}',
+                result_type,
+                'text/html',
+                str(rand.randint(200, 200000)),
+                '-',
+                '-',
+            ]))
+        yield key, gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def read_access_logs(source_dir: str) -> Iterator[Tuple[str, bytes]]:
+    """Reads gzipped access logs files in a given folder in order of name.
+
+    :returns: iterator of S3 object keys and gzipped contents.
+    """
+    for name in sorted(os.listdir(source_dir)):
+        if not name.endswith('.gz'):
+            continue
+        with open(os.path.join(source_dir, name), mode='rb') as f:
+            yield name, f.read()
+
+
+def summarize_latencies(values: List[float]) -> str:
+    """Formats the percentiles of given latencies in milliseconds.
+    """
+    if len(values) == 0:
+        return 'none'
+    values = sorted(values)
+
+    def percentile(p: float) -> float:
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    return ''.join([
+        f'{len(values)} files,',
+        f' mean {statistics.mean(values):.1f},',
+        f' p50 {percentile(0.5):.1f},',
+        f' p95 {percentile(0.95):.1f},',
+        f' max {values[-1]:.1f} ms',
+    ])
+
+
+def main():
+    """Runs the replay.
+    """
+    parser = argparse.ArgumentParser(
+        description='replays a day of access logs through the ETL locally',
+    )
+    parser.add_argument(
+        '--source-dir',
+        help='folder of recorded access logs files; synthetic if omitted',
+    )
+    parser.add_argument(
+        '--date',
+        type=datetime.date.fromisoformat,
+        default=datetime.date(2022, 10, 1),
+        help='date of synthetic access logs (yyyy-mm-dd)',
+    )
+    parser.add_argument(
+        '--objects',
+        type=int,
+        default=288,
+        help='number of synthetic access logs files',
+    )
+    parser.add_argument(
+        '--records',
+        type=int,
+        default=200,
+        help='number of records in a synthetic access logs file',
+    )
+    parser.add_argument(
+        '--distributions',
+        type=int,
+        default=1,
+        help='number of CloudFront distributions of synthetic access logs',
+    )
+    parser.add_argument(
+        '--output-format',
+        choices=['tsv', 'parquet'],
+        default='tsv',
+        help='OUTPUT_FORMAT of mask-access-logs',
+    )
+    parser.add_argument(
+        '--partition-granularity',
+        choices=partitions.GRANULARITIES,
+        default=partitions.DAY_GRANULARITY,
+        help='PARTITION_GRANULARITY of mask-access-logs',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=10,
+        help='number of SQS messages in a batch',
+    )
+    parser.add_argument(
+        '--load-interval',
+        type=int,
+        default=0,
+        help='number of files between micro-batch loads; 0 disables them',
+    )
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    mask = import_handler('mask-access-logs', {
+        **MASK_ENVIRONMENT,
+        'OUTPUT_FORMAT': args.output_format,
+        'PARTITION_GRANULARITY': args.partition_granularity,
+    })
+    delete = import_handler('delete-access-logs', DELETE_ENVIRONMENT)
+    load = import_handler('load-access-logs', LOAD_ENVIRONMENT)
+
+    timeline = Timeline()
+    s3 = LocalS3()
+    data_api = LocalDataApi(timeline.on_loaded)
+    new_logs_queue = LocalQueue('NewLogsQueue', args.batch_size)
+    masked_logs_queue = LocalQueue('MaskedLogsQueue', args.batch_size)
+    s3.add_notification(SOURCE_BUCKET_NAME, '', new_logs_queue)
+    s3.add_notification(
+        MASKED_BUCKET_NAME,
+        MASKED_KEY_PREFIX,
+        masked_logs_queue,
+    )
+    s3.add_listener(timeline.on_created)
+    mask.s3 = s3
+    delete.s3 = s3
+    load.s3 = s3
+    load.redshift_data = data_api
+    load.redshift = SimpleNamespace(
+        get_credentials=lambda **_: {'dbUser': 'IAM:replay'},
+    )
+    load.stepfunctions = SimpleNamespace(
+        start_execution=lambda **_: {'executionArn': 'replay'},
+    )
+    profiling.s3 = s3
+
+    cpu_times: Dict[str, float] = collections.Counter()
+    invocations: Dict[str, int] = collections.Counter()
+
+    def invoke(stage: str, handler: Callable, event: Dict):
+        s3.stage = stage
+        start_time = time.process_time()
+        handler(event, make_context(stage))
+        cpu_times[stage] += time.process_time() - start_time
+        invocations[stage] += 1
+        s3.stage = 'replay'
+
+    def pump_queues(flush: bool):
+        for event in new_logs_queue.receive_batches(flush):
+            invoke('mask', mask.lambda_handler, event)
+        for event in masked_logs_queue.receive_batches(flush):
+            invoke('delete', delete.lambda_handler, event)
+            timeline.on_deleted([
+                json.loads(record['body'])['Records'][0]['s3']['object']['key']
+                    for record in event['Records']
+            ])
+
+    if args.source_dir is not None:
+        access_logs = read_access_logs(args.source_dir)
+    else:
+        access_logs = generate_access_logs(
+            random.Random(args.seed),
+            args.date,
+            args.objects,
+            args.records,
+            args.distributions,
+        )
+    for i, (key, body) in enumerate(access_logs):
+        timeline.arrived[key] = time.perf_counter()
+        s3.store_object(SOURCE_BUCKET_NAME, key, body)
+        pump_queues(flush=False)
+        if args.load_interval > 0 and (i + 1) % args.load_interval == 0:
+            # the batching windows elapse before a scheduled load
+            pump_queues(flush=True)
+            masked_dates = list_masked_dates(s3)
+            if len(masked_dates) > 0:
+                invoke('load', load.lambda_handler, {
+                    'time': f'{masked_dates[-1].isoformat()}T23:59:59Z',
+                    'microBatch': True,
+                })
+    pump_queues(flush=True)
+    # backfills every date instead of a daily run so that the dates of
+    # recorded access logs do not matter
+    masked_dates = list_masked_dates(s3)
+    if len(masked_dates) > 0:
+        invoke('load', load.lambda_handler, {
+            'startDate': min(masked_dates).isoformat(),
+            'endDate': max(masked_dates).isoformat(),
+        })
+
+    print(f'files: {len(timeline.arrived)}')
+    for stage, values in timeline.get_latencies().items():
+        print(f'latency to {stage}: {summarize_latencies(values)}')
+    for stage in ['mask', 'delete', 'load']:
+        print(
+            f'{stage}: {cpu_times[stage] * 1000.0:.1f} ms CPU'
+            f' in {invocations[stage]} invocations',
+        )
+    print(
+        f'Data API: {data_api.num_batches} batches,'
+        f' {data_api.num_statements} statements',
+    )
+    print('S3 requests:')
+    for (stage, operation), count in sorted(s3.request_counts.items()):
+        print(f'  {stage:8s} {operation:24s} {count:8d}')
+
+
+if __name__ == '__main__':
+    main()
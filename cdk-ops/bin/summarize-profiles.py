@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""Summarizes profiles of Lambda invocations saved by
+``libdatawarehouse.profiling``.
+
+Aggregates ``.pstats`` files and ``.allocations.json`` files in given
+folders, and prints the hottest functions and the largest allocation sites
+across all the profiles.
+
+Download profiles from the S3 bucket, and run this script in the ``cdk-ops``
+folder,
+
+.. code-block:: sh
+
+    aws s3 sync s3://$BUCKET_NAME/profiles/ profiles/
+    python bin/summarize-profiles.py profiles/
+"""
+
+import argparse
+import json
+import os
+import pstats
+from typing import Dict, List, Tuple
+
+
+# suffixes of the files of a profile; see libdatawarehouse.profiling.
+PSTATS_SUFFIX = '.pstats'
+ALLOCATIONS_SUFFIX = '.allocations.json'
+
+# sort keys of functions accepted by pstats.
+SORT_KEYS = ['tottime', 'cumulative', 'ncalls']
+
+
+def find_files(paths: List[str], suffix: str) -> List[str]:
+    """Finds files with a given suffix in given files or folders.
+    """
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            if path.endswith(suffix):
+                found.append(path)
+            continue
+        for dirpath, _, filenames in os.walk(path):
+            found.extend(
+                os.path.join(dirpath, filename)
+                    for filename in filenames if filename.endswith(suffix)
+            )
+    return sorted(found)
+
+
+def summarize_allocations(
+    allocations_paths: List[str],
+) -> Tuple[List[Tuple[Tuple[str, int], Dict[str, int]]], int]:
+    """Sums up allocation sites in given ``.allocations.json`` files.
+
+    :returns: tuple of the allocation sites sorted in descending order of
+    the total size, and the maximum peak size in bytes.
+    A site is a tuple of ``(filename, lineno)`` and ``dict`` of ``size``,
+    ``count``, and the number of profiles that have the site, ``profiles``.
+    """
+    sites: Dict[Tuple[str, int], Dict[str, int]] = {}
+    max_peak_size = 0
+    for path in allocations_paths:
+        with open(path, mode='r', encoding='utf-8') as f:
+            summary = json.load(f)
+        max_peak_size = max(max_peak_size, summary['peakSize'])
+        for site in summary['sites']:
+            total = sites.setdefault(
+                (site['filename'], site['lineno']),
+                {'size': 0, 'count': 0, 'profiles': 0},
+            )
+            total['size'] += site['size']
+            total['count'] += site['count']
+            total['profiles'] += 1
+    return (
+        sorted(sites.items(), key=lambda item: item[1]['size'], reverse=True),
+        max_peak_size,
+    )
+
+
+def main():
+    """Prints the summary.
+    """
+    parser = argparse.ArgumentParser(
+        description='summarizes profiles of Lambda invocations',
+    )
+    parser.add_argument(
+        'paths',
+        nargs='+',
+        help='profile files or folders containing them',
+    )
+    parser.add_argument(
+        '--sort',
+        choices=SORT_KEYS,
+        default='tottime',
+        help='sort key of functions',
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=20,
+        help='number of functions and allocation sites to print',
+    )
+    args = parser.parse_args()
+    pstats_paths = find_files(args.paths, PSTATS_SUFFIX)
+    if len(pstats_paths) > 0:
+        print(f'# hottest functions in {len(pstats_paths)} profiles')
+        stats = pstats.Stats(*pstats_paths)
+        stats.strip_dirs().sort_stats(args.sort).print_stats(args.limit)
+    allocations_paths = find_files(args.paths, ALLOCATIONS_SUFFIX)
+    if len(allocations_paths) > 0:
+        sites, max_peak_size = summarize_allocations(allocations_paths)
+        print(
+            f'# largest allocation sites in {len(allocations_paths)} profiles'
+            f' (max peak {max_peak_size / 1024:.1f} KiB)',
+        )
+        for (filename, lineno), total in sites[:args.limit]:
+            print(
+                f'{total["size"] / 1024:10.1f} KiB'
+                f' {total["count"]:8d} blocks'
+                f' {total["profiles"]:4d} profiles'
+                f'  {filename}:{lineno}',
+            )
+    if len(pstats_paths) == 0 and len(allocations_paths) == 0:
+        print('no profiles found')
+
+
+if __name__ == '__main__':
+    main()
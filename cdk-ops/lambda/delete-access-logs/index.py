@@ -3,6 +3,10 @@
 """Deletes the original CloudFront access logs file corresponding to a given
 masked access logs file.
 
+Verifies the metadata of the masked access logs file with a HEAD request
+before deleting the original file; please refer to
+``libdatawarehouse.integrity``.
+
 You have to specify the following environment variables,
 * ``SOURCE_BUCKET_NAME``: name of the S3 bucket containing original CloudFront
   access logs files
@@ -15,8 +19,8 @@ You have to specify the following environment variables,
 import json
 import logging
 import os
-import boto3
 from botocore.exceptions import ClientError
+from libdatawarehouse import clients, columnar, integrity, partitions
 
 
 SOURCE_BUCKET_NAME = os.environ['SOURCE_BUCKET_NAME']
@@ -26,8 +30,7 @@ DESTINATION_KEY_PREFIX = os.environ['DESTINATION_KEY_PREFIX']
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
-s3 = boto3.resource('s3')
-source_bucket = s3.Bucket(SOURCE_BUCKET_NAME)
+s3 = clients.LazyClient('s3')
 
 
 def lambda_handler(event, _):
@@ -105,16 +108,60 @@ def process_s3_object(s3_object):
         )
         return
     # key should be like,
-    #   {DESTINATION_KEY_PREFIX}{year}/{month}/{date}/{original_key}
+    #   {DESTINATION_KEY_PREFIX}{distribution}/{yyyy}/{mm}/{dd}/{orig_key}
+    # or if partitioned by hour,
+    #   {DESTINATION_KEY_PREFIX}{distribution}/{yyyy}/{mm}/{dd}/{hh}/{orig_key}
+    # where {distribution}/ is missing in keys written before distributions
+    # were introduced.
     # so the last segment separated by a slash ('/') is the key for the
     # original access logs file.
-    src_key = key.split('/')[-1]
+    # a masked Parquet file has a suffix appended to the original key.
+    partitioned_key = partitions.parse_partitioned_key(
+        key[len(DESTINATION_KEY_PREFIX):],
+    )
+    src_key = partitioned_key.name if partitioned_key is not None else ''
+    if src_key.endswith(columnar.PARQUET_SUFFIX):
+        src_key = src_key[:-len(columnar.PARQUET_SUFFIX)]
     if len(src_key) > 0:
-        src = source_bucket.Object(src_key)
+        if not is_masked_object_verified(key):
+            return
         try:
-            res = src.delete()
+            res = s3.delete_object(Bucket=SOURCE_BUCKET_NAME, Key=src_key)
             LOGGER.debug('deleted object "%s": %s', src_key, str(res))
         except ClientError as exc:
             LOGGER.error('failed to delete object "%s": %s', src_key, str(exc))
     else:
         LOGGER.warning('ignoring invalid key: %s', key)
+
+
+def is_masked_object_verified(key: str) -> bool:
+    """Returns whether a given masked access logs file is verified to be
+    complete.
+
+    Requests only the metadata of the S3 object, and never downloads it.
+    A file written before checksums were introduced is regarded as verified.
+    """
+    try:
+        res = s3.head_object(
+            Bucket=DESTINATION_BUCKET_NAME,
+            Key=key,
+            ChecksumMode='ENABLED',
+        )
+    except ClientError as exc:
+        LOGGER.error('failed to get metadata of "%s": %s', key, str(exc))
+        return False
+    outcome = integrity.check_masked_object(res)
+    if outcome == integrity.PENDING:
+        # the copy with the metadata will notify again
+        LOGGER.debug('metadata of "%s" has not been recorded yet', key)
+        return False
+    if outcome == integrity.MISMATCH:
+        LOGGER.error(
+            'keeping the original of "%s" whose metadata does not match: %s',
+            key,
+            str(res.get('Metadata')),
+        )
+        return False
+    if outcome == integrity.UNCHECKED:
+        LOGGER.warning('"%s" has no checksum to verify', key)
+    return True
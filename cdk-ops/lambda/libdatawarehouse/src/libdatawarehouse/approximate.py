@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+
+"""Answers exploratory queries approximately without scanning access logs.
+
+``load-access-logs`` maintains the following structures alongside the access
+log table in the same transaction, and deletes their rows of the months that
+it drops from the access log table,
+* ``tables.ACCESS_LOG_SAMPLE_TABLE``: 1 in ``SAMPLE_MODULUS`` access logs
+  chosen by the hash of ``seq_num`` and ``datetime``. The same access log is
+  always sampled, so reloading or backfilling reproduces the same sample.
+* ``tables.PAGE_DAILY_SKETCH_TABLE``: HyperLogLog sketches of distinct
+  referers and user agents per day and page. Rows are replaced per day like
+  the daily rollup tables.
+
+Counts and sums are estimated from the sample, whereas distinct counts are
+estimated from the sketches, because the number of distinct values in a
+sample does not scale to the population.
+Distinct pages are counted exactly, because the sketch table has a row for
+every page accessed on a day.
+
+Every estimate comes with its standard error,
+* sample: the sample is treated as a Bernoulli sample with probability
+  ``SAMPLE_RATE``. Estimates are unreliable if few access logs are sampled.
+* sketches: the relative standard error of HyperLogLog is
+  ``1.04 / sqrt(2 ** HLL_PRECISION)``, about 0.6%, which is an upper bound
+  because Redshift counts small cardinalities almost exactly.
+
+Helpers take a function that runs a query and returns the records, so that
+they work with any client; e.g.,
+
+.. code-block:: python
+
+    def run_query(sql):
+        statement_id = session.execute_statement(sql)
+        data_api.wait_for_results(redshift_data, statement_id)
+        return list(data_api.iterate_results(redshift_data, statement_id))
+
+    estimate = approximate_distinct_count(
+        run_query,
+        'user_agent',
+        datetime.date(2023, 1, 23),
+        datetime.date(2023, 1, 30),
+        page_condition="path LIKE '/blog%'",
+    )
+    low, high = estimate.get_interval()
+"""
+
+import datetime
+import math
+from typing import Callable, NamedTuple, Optional, Sequence, Tuple
+from . import tables
+
+
+# 1 in ``SAMPLE_MODULUS`` access logs is sampled.
+SAMPLE_MODULUS = 100
+
+SAMPLE_RATE = 1.0 / SAMPLE_MODULUS
+
+# precision (log2 of the number of registers) of HyperLogLog sketches, which
+# is the default of Redshift.
+HLL_PRECISION = 15
+
+# relative standard error of a HyperLogLog cardinality.
+HLL_RELATIVE_STANDARD_ERROR = 1.04 / math.sqrt(2 ** HLL_PRECISION)
+
+# columns whose distinct values can be counted.
+# maps a column to the column of sketches, or ``None`` if counted exactly.
+DISTINCT_COLUMNS = {
+    'referer': 'referer_sketch',
+    'user_agent': 'user_agent_sketch',
+    'page': None,
+}
+
+# z-score of the default confidence level (95%) of intervals.
+DEFAULT_Z_SCORE = 1.96
+
+# function that runs a given SQL query and returns the records.
+QueryRunner = Callable[[str], Sequence[Tuple]]
+
+
+class Estimate(NamedTuple):
+    """Approximate answer to a query.
+    """
+    value: float
+    standard_error: float
+
+
+    def get_interval(
+        self,
+        z_score: float = DEFAULT_Z_SCORE,
+    ) -> Tuple[float, float]:
+        """Returns the confidence interval at a given z-score.
+
+        The lower end is never negative.
+        """
+        margin = z_score * self.standard_error
+        return max(0.0, self.value - margin), self.value + margin
+
+
+def get_sample_condition() -> str:
+    """Returns an SQL condition that selects sampled access logs.
+
+    ``FNV_HASH`` may be negative, but so is the remainder, so only ``0``
+    selects 1 in ``SAMPLE_MODULUS``.
+    """
+    return ''.join([
+        'MOD(FNV_HASH(seq_num, FNV_HASH(datetime)),',
+        f' {SAMPLE_MODULUS}) = 0',
+    ])
+
+
+def get_insert_sample_statement(source_table_name: str, condition: str) -> str:
+    """Returns an SQL statement that inserts sampled access logs in a given
+    table into the sample table.
+
+    :param str source_table_name: name of a table that has the same columns
+    as the access log table.
+
+    :param str condition: condition on the columns of the source table to
+    select access logs to be sampled.
+    """
+    return ''.join([
+        f'INSERT INTO {tables.ACCESS_LOG_SAMPLE_TABLE_NAME}',
+        f'  SELECT * FROM {source_table_name}',
+        f'  WHERE {condition}',
+        f'    AND {get_sample_condition()}',
+    ])
+
+
+def get_delete_sample_statement(condition: str) -> str:
+    """Returns an SQL statement that deletes access logs from the sample
+    table.
+
+    :param str condition: condition on the columns of the access log table
+    to select access logs to be deleted.
+    """
+    return ''.join([
+        f'DELETE FROM {tables.ACCESS_LOG_SAMPLE_TABLE_NAME}',
+        f'  WHERE {condition}',
+    ])
+
+
+def get_backfill_sample_statement() -> str:
+    """Returns an SQL statement that samples access logs on days missing in
+    the sample table.
+    """
+    return get_insert_sample_statement(
+        tables.ACCESS_LOG_TABLE_NAME,
+        ''.join([
+            'TRUNC(datetime) NOT IN (SELECT DISTINCT TRUNC(datetime)',
+            f' FROM {tables.ACCESS_LOG_SAMPLE_TABLE_NAME})',
+        ]),
+    )
+
+
+def get_delete_sketches_statement(condition: str) -> str:
+    """Returns an SQL statement that deletes rows from the sketch table.
+
+    :param str condition: condition on the ``date`` column of rows to be
+    deleted.
+    """
+    return ''.join([
+        f'DELETE FROM {tables.PAGE_DAILY_SKETCH_TABLE_NAME}',
+        f'  WHERE {condition}',
+    ])
+
+
+def get_insert_sketches_statement(condition: str) -> str:
+    """Returns an SQL statement that creates sketches of the access log table
+    by day and page, and inserts them into the sketch table.
+
+    :param str condition: condition on the columns of the access log table
+    to select rows to be sketched. Must select entire days.
+    """
+    return ''.join([
+        f'INSERT INTO {tables.PAGE_DAILY_SKETCH_TABLE_NAME}',
+        '  (date, page, referer_sketch, user_agent_sketch)',
+        '  SELECT',
+        '    TRUNC(datetime),',
+        '    page,',
+        '    HLL_CREATE_SKETCH(referer),',
+        '    HLL_CREATE_SKETCH(user_agent)',
+        f'  FROM {tables.ACCESS_LOG_TABLE_NAME}',
+        f'  WHERE {condition}',
+        '  GROUP BY 1, 2',
+    ])
+
+
+def get_backfill_sketches_statement() -> str:
+    """Returns an SQL statement that sketches access logs on days missing in
+    the sketch table.
+    """
+    return get_insert_sketches_statement(''.join([
+        'TRUNC(datetime) NOT IN',
+        f' (SELECT DISTINCT date FROM {tables.PAGE_DAILY_SKETCH_TABLE_NAME})',
+    ]))
+
+
+def format_date(date: datetime.date) -> str:
+    """Formats a given date like "2022-10-01".
+    """
+    return f'{date.year:04d}-{date.month:02d}-{date.day:02d}'
+
+
+def get_page_condition(page_condition: Optional[str]) -> str:
+    """Returns an SQL condition on the ``page`` column that selects pages
+    satisfying a given condition on the columns of the page table.
+
+    :returns: ``TRUE`` if ``page_condition`` is ``None``.
+    """
+    if page_condition is None:
+        return 'TRUE'
+    return ''.join([
+        f'page IN (SELECT id FROM {tables.PAGE_TABLE_NAME}',
+        f' WHERE {page_condition})',
+    ])
+
+
+def get_distinct_count_query(
+    column: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    page_condition: Optional[str] = None,
+) -> str:
+    """Returns an SQL query that counts distinct values of a given column of
+    access logs in a given range of dates.
+
+    :param str column: one of ``DISTINCT_COLUMNS``.
+
+    :param datetime.date end_date: exclusive end of the range.
+
+    :param Optional[str] page_condition: condition on the columns of the page
+    table to select pages; e.g., ``path LIKE '/blog%'``.
+
+    :raises ValueError: if ``column`` is not one of ``DISTINCT_COLUMNS``.
+    """
+    if column not in DISTINCT_COLUMNS:
+        raise ValueError(f'distinct {column} cannot be counted')
+    sketch_column = DISTINCT_COLUMNS[column]
+    if sketch_column is None:
+        count = f'COUNT(DISTINCT {column})'
+    else:
+        count = f'HLL_CARDINALITY(HLL_COMBINE({sketch_column}))'
+    return ''.join([
+        f'SELECT {count}',
+        f'  FROM {tables.PAGE_DAILY_SKETCH_TABLE_NAME}',
+        f"  WHERE date >= '{format_date(start_date)}'",
+        f"    AND date < '{format_date(end_date)}'",
+        f'    AND {get_page_condition(page_condition)}',
+    ])
+
+
+def estimate_distinct_count(column: str, count: int) -> Estimate:
+    """Estimates the number of distinct values of a given column from the
+    results of a query given by ``get_distinct_count_query``.
+    """
+    if DISTINCT_COLUMNS[column] is None:
+        return Estimate(float(count), 0.0)
+    return Estimate(float(count), count * HLL_RELATIVE_STANDARD_ERROR)
+
+
+def get_sampled_aggregate_query(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    value: str = '1',
+    condition: Optional[str] = None,
+) -> str:
+    """Returns an SQL query that aggregates sampled access logs in a given
+    range of dates.
+
+    The query returns the number of sampled access logs, and the sum and the
+    sum of squares of ``value``.
+
+    :param datetime.date end_date: exclusive end of the range.
+
+    :param str value: expression over the columns of the access log table to
+    be summed; e.g., ``sc_bytes``.
+
+    :param Optional[str] condition: condition on the columns of the access
+    log table; e.g., ``status = 404``.
+    """
+    return ''.join([
+        'SELECT',
+        '    COUNT(*),',
+        f'    COALESCE(SUM(({value})::FLOAT8), 0),',
+        f'    COALESCE(SUM(({value})::FLOAT8 * ({value})::FLOAT8), 0)',
+        f'  FROM {tables.ACCESS_LOG_SAMPLE_TABLE_NAME}',
+        f"  WHERE datetime >= '{format_date(start_date)}'",
+        f"    AND datetime < '{format_date(end_date)}'",
+        f'    AND {condition or "TRUE"}',
+    ])
+
+
+def estimate_count(sampled_count: int) -> Estimate:
+    """Estimates the number of access logs from the number of sampled ones.
+    """
+    return Estimate(
+        sampled_count / SAMPLE_RATE,
+        math.sqrt(sampled_count * (1.0 - SAMPLE_RATE)) / SAMPLE_RATE,
+    )
+
+
+def estimate_sum(
+    sampled_sum: float,
+    sampled_sum_of_squares: float,
+) -> Estimate:
+    """Estimates the sum of a value over access logs from the sum and the sum
+    of squares of the value over sampled ones.
+    """
+    return Estimate(
+        sampled_sum / SAMPLE_RATE,
+        math.sqrt(sampled_sum_of_squares * (1.0 - SAMPLE_RATE)) / SAMPLE_RATE,
+    )
+
+
+def approximate_distinct_count(
+    run_query: QueryRunner,
+    column: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    page_condition: Optional[str] = None,
+) -> Estimate:
+    """Approximately counts distinct values of a given column of access logs
+    in a given range of dates.
+
+    Please refer to ``get_distinct_count_query`` for the parameters.
+    """
+    records = run_query(get_distinct_count_query(
+        column,
+        start_date,
+        end_date,
+        page_condition,
+    ))
+    return estimate_distinct_count(column, records[0][0] or 0)
+
+
+def approximate_count(
+    run_query: QueryRunner,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    condition: Optional[str] = None,
+) -> Estimate:
+    """Approximately counts access logs in a given range of dates.
+
+    Please refer to ``get_sampled_aggregate_query`` for the parameters.
+    """
+    records = run_query(get_sampled_aggregate_query(
+        start_date,
+        end_date,
+        condition=condition,
+    ))
+    return estimate_count(records[0][0])
+
+
+def approximate_sum(
+    run_query: QueryRunner,
+    value: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    condition: Optional[str] = None,
+) -> Estimate:
+    """Approximately sums a given value over access logs in a given range of
+    dates.
+
+    Please refer to ``get_sampled_aggregate_query`` for the parameters.
+    """
+    records = run_query(get_sampled_aggregate_query(
+        start_date,
+        end_date,
+        value=value,
+        condition=condition,
+    ))
+    _, sampled_sum, sampled_sum_of_squares = records[0]
+    return estimate_sum(float(sampled_sum), float(sampled_sum_of_squares))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""Provides a Bloom filter of strings.
+
+A Bloom filter tells whether a string has probably been added, or has
+definitely not been added.
+The rate of false positives is bounded by the capacity and the false positive
+rate given at creation, as long as no more strings than the capacity are
+added.
+
+.. code-block:: python
+
+    bloom = create_bloom_filter(100000, 0.001)
+    bloom.add('request-id')
+    assert 'request-id' in bloom
+    bloom = load_bloom_filter(bloom.to_bytes())
+"""
+
+import hashlib
+import math
+import struct
+from typing import Iterator, Optional, Tuple
+
+
+# header of a serialized Bloom filter.
+# magic, number of bits, number of hashes, number of added strings.
+HEADER_FORMAT = '>4sQIQ'
+
+HEADER_MAGIC = b'BLM1'
+
+
+class BloomFilter:
+    """Bloom filter of strings.
+    """
+    def __init__(
+        self,
+        num_bits: int,
+        num_hashes: int,
+        bits: Optional[bytearray] = None,
+        count: int = 0,
+    ):
+        """Initializes with the size.
+
+        :param bytearray bits: bits of the filter. An empty filter if omitted.
+
+        :param int count: number of strings that have been added.
+        """
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        if bits is None:
+            bits = bytearray((num_bits + 7) // 8)
+        self.bits = bits
+        self.count = count
+
+
+    def add(self, item: str):
+        """Adds a given string.
+        """
+        for position in self.get_positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+    def __contains__(self, item: str) -> bool:
+        """Returns whether a given string has probably been added.
+        """
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+                for position in self.get_positions(item)
+        )
+
+
+    def get_positions(self, item: str) -> Iterator[int]:
+        """Iterates over the positions of bits for a given string.
+
+        Derives the positions from two halves of a single digest by double
+        hashing.
+        """
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        hash1, hash2 = struct.unpack('>QQ', digest)
+        for i in range(self.num_hashes):
+            yield (hash1 + i * hash2) % self.num_bits
+
+
+    def estimate_false_positive_rate(self) -> float:
+        """Estimates the current false positive rate from the number of added
+        strings.
+        """
+        return (
+            1.0 - math.exp(-self.num_hashes * self.count / self.num_bits)
+        ) ** self.num_hashes
+
+
+    def to_bytes(self) -> bytes:
+        """Serializes the filter.
+        """
+        header = struct.pack(
+            HEADER_FORMAT,
+            HEADER_MAGIC,
+            self.num_bits,
+            self.num_hashes,
+            self.count,
+        )
+        return header + bytes(self.bits)
+
+
+def get_optimal_parameters(
+    capacity: int,
+    false_positive_rate: float,
+) -> Tuple[int, int]:
+    """Returns the number of bits and the number of hashes that minimize the
+    size of a filter for given capacity and false positive rate.
+
+    :returns: tuple of the number of bits and the number of hashes.
+    """
+    num_bits = math.ceil(
+        -capacity * math.log(false_positive_rate) / (math.log(2) ** 2),
+    )
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+    return num_bits, num_hashes
+
+
+def create_bloom_filter(
+    capacity: int,
+    false_positive_rate: float,
+) -> BloomFilter:
+    """Creates an empty Bloom filter.
+
+    :param int capacity: expected maximum number of strings to be added.
+
+    :param float false_positive_rate: false positive rate when ``capacity``
+    strings have been added.
+    """
+    num_bits, num_hashes = get_optimal_parameters(
+        capacity,
+        false_positive_rate,
+    )
+    return BloomFilter(num_bits, num_hashes)
+
+
+def load_bloom_filter(data: bytes) -> BloomFilter:
+    """Deserializes a Bloom filter serialized by ``BloomFilter.to_bytes``.
+
+    :raises ValueError: if ``data`` is not a serialized Bloom filter.
+    """
+    header_size = struct.calcsize(HEADER_FORMAT)
+    if len(data) < header_size:
+        raise ValueError('too short for a Bloom filter')
+    magic, num_bits, num_hashes, count = struct.unpack(
+        HEADER_FORMAT,
+        data[:header_size],
+    )
+    if magic != HEADER_MAGIC:
+        raise ValueError(f'invalid Bloom filter magic: {magic!r}')
+    bits = bytearray(data[header_size:])
+    if len(bits) != (num_bits + 7) // 8:
+        raise ValueError(
+            f'Bloom filter must have {num_bits} bits but {len(bits) * 8}',
+        )
+    return BloomFilter(num_bits, num_hashes, bits=bits, count=count)
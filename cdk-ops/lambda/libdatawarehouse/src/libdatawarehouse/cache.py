@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+
+"""Caches results of analytics queries.
+
+A cached result is keyed on the normalized SQL statement, its parameters,
+and the data version token.
+Since loading access logs bumps the data version token, a load invalidates
+all the cached results without deleting them.
+
+.. code-block:: python
+
+    cache = QueryCache(
+        S3CacheStore(s3, bucket_name, 'results/'),
+        lambda: read_data_version(s3, bucket_name),
+    )
+    records = cache.get_or_execute(
+        sql,
+        parameters,
+        lambda: list(data_api.iterate_results(redshift_data, run(sql))),
+    )
+"""
+
+import base64
+import datetime
+from decimal import Decimal
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+import uuid
+
+
+# key of the S3 object of the data version token.
+DATA_VERSION_KEY = 'data-version'
+
+# data version used before any data version token is saved.
+INITIAL_DATA_VERSION = 'initial'
+
+# default time to live of cached results in seconds.
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+# default maximum total size of cached results in bytes.
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CacheEntry(NamedTuple):
+    """Entry in a cache store.
+    """
+    key: str
+    # size in bytes
+    size: int
+    # time when the entry was saved in seconds since the epoch
+    saved_at: float
+
+
+class LocalCacheStore:
+    """Cache store in a local directory.
+    """
+    def __init__(self, directory: str):
+        """Initializes with the directory to save entries in.
+
+        Creates the directory if it does not exist.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the contents of a given entry.
+
+        :returns: ``None`` if no entry has ``key``.
+        """
+        try:
+            with open(self.get_path(key), mode='rb') as entry_file:
+                return entry_file.read()
+        except FileNotFoundError:
+            return None
+
+
+    def put(self, key: str, contents: bytes):
+        """Saves given contents as an entry.
+
+        Writes a temporary file and renames it so that readers never see a
+        partially written entry.
+        """
+        path = self.get_path(key)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, mode='wb') as entry_file:
+            entry_file.write(contents)
+        os.replace(temp_path, path)
+
+
+    def delete(self, key: str):
+        """Deletes a given entry.
+
+        Does nothing if no entry has ``key``.
+        """
+        try:
+            os.remove(self.get_path(key))
+        except FileNotFoundError:
+            pass
+
+
+    def list_entries(self) -> List[CacheEntry]:
+        """Lists all the entries.
+        """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for dir_entry in it:
+                if not dir_entry.is_file() \
+                    or dir_entry.name.endswith('.tmp'):
+                    continue
+                stat = dir_entry.stat()
+                entries.append(CacheEntry(
+                    key=dir_entry.name,
+                    size=stat.st_size,
+                    saved_at=stat.st_mtime,
+                ))
+        return entries
+
+
+    def get_path(self, key: str) -> str:
+        """Returns the path to the file of a given entry.
+        """
+        return os.path.join(self.directory, key)
+
+
+class S3CacheStore:
+    """Cache store in an S3 bucket.
+    """
+    def __init__(self, s3, bucket_name: str, key_prefix: str = 'results/'):
+        """Initializes with the S3 bucket to save entries in.
+
+        :param S3.Client s3: S3 client.
+
+        :param str key_prefix: prefix of the S3 object keys of entries.
+        """
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.key_prefix = key_prefix
+
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the contents of a given entry.
+
+        :returns: ``None`` if no entry has ``key``.
+        """
+        try:
+            res = self.s3.get_object(
+                Bucket=self.bucket_name,
+                Key=f'{self.key_prefix}{key}',
+            )
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return res['Body'].read()
+
+
+    def put(self, key: str, contents: bytes):
+        """Saves given contents as an entry.
+        """
+        self.s3.put_object(
+            Bucket=self.bucket_name,
+            Key=f'{self.key_prefix}{key}',
+            Body=contents,
+            ContentType='application/json',
+            ContentEncoding='gzip',
+        )
+
+
+    def delete(self, key: str):
+        """Deletes a given entry.
+
+        Does nothing if no entry has ``key``.
+        """
+        self.s3.delete_object(
+            Bucket=self.bucket_name,
+            Key=f'{self.key_prefix}{key}',
+        )
+
+
+    def list_entries(self) -> List[CacheEntry]:
+        """Lists all the entries.
+        """
+        entries = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+            Bucket=self.bucket_name,
+            Prefix=self.key_prefix,
+        )
+        for page in pages:
+            for obj in page.get('Contents', []):
+                entries.append(CacheEntry(
+                    key=obj['Key'][len(self.key_prefix):],
+                    size=obj['Size'],
+                    saved_at=obj['LastModified'].timestamp(),
+                ))
+        return entries
+
+
+class QueryCache:
+    """Cache of query results.
+    """
+    def __init__(
+        self,
+        store,
+        get_data_version: Callable[[], str],
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ):
+        """Initializes with a cache store.
+
+        :param LocalCacheStore|S3CacheStore store: store of cached results.
+
+        :param Callable[[], str] get_data_version: returns the current data
+        version token; e.g., ``read_data_version``.
+
+        :param float ttl_seconds: time to live of cached results in seconds.
+
+        :param int max_size: maximum total size of cached results in bytes.
+        The oldest results are evicted when the total size exceeds this.
+        """
+        self.store = store
+        self.get_data_version = get_data_version
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+
+
+    def get_or_execute(
+        self,
+        sql: str,
+        parameters: Optional[Sequence[Dict]],
+        execute: Callable[[], List[Sequence[Any]]],
+    ) -> List[Sequence[Any]]:
+        """Returns the cached results of a given query, or executes the query
+        and caches the results if they are not cached.
+
+        :param Optional[Sequence[Dict]] parameters: parameters of ``sql`` in
+        the form of ``Parameters`` of ``ExecuteStatement``.
+
+        :param Callable[[], List[Sequence[Any]]] execute: executes the query
+        and returns all the records; e.g., by ``data_api.iterate_results``.
+
+        :returns: list of records. A record is a ``tuple``.
+        """
+        key = get_cache_key(sql, parameters, self.get_data_version())
+        contents = self.store.get(key)
+        if contents is not None:
+            entry = json.loads(
+                gzip.decompress(contents).decode('utf-8'),
+                object_hook=decode_value,
+            )
+            if time.time() - entry['savedAt'] < self.ttl_seconds:
+                LOGGER.debug('cache hit: %s', key)
+                return [tuple(record) for record in entry['records']]
+            LOGGER.debug('cache expired: %s', key)
+            self.store.delete(key)
+        LOGGER.debug('cache miss: %s', key)
+        records = [tuple(record) for record in execute()]
+        contents = gzip.compress(json.dumps(
+            {
+                'savedAt': time.time(),
+                'records': records,
+            },
+            default=encode_value,
+            separators=(',', ':'),
+        ).encode('utf-8'))
+        self.store.put(key, contents)
+        self.evict()
+        return records
+
+
+    def evict(self):
+        """Evicts expired results, and the oldest results while the total size
+        exceeds the maximum.
+        """
+        now = time.time()
+        entries = sorted(
+            self.store.list_entries(),
+            key=lambda entry: entry.saved_at,
+        )
+        total_size = sum(entry.size for entry in entries)
+        for entry in entries:
+            if now - entry.saved_at < self.ttl_seconds \
+                and total_size <= self.max_size:
+                break
+            LOGGER.debug('evicting cache: %s', entry.key)
+            self.store.delete(entry.key)
+            total_size -= entry.size
+
+
+def normalize_sql(sql: str) -> str:
+    """Normalizes a given SQL statement for cache keys.
+
+    Collapses runs of whitespace outside quoted strings and identifiers into
+    single spaces, and removes leading and trailing whitespace and trailing
+    semicolons.
+    Letter case is preserved because it matters in quoted strings.
+    """
+    normalized = []
+    quote = None
+    pending_space = False
+    for char in sql:
+        if quote is not None:
+            normalized.append(char)
+            if char == quote:
+                quote = None
+        elif char.isspace():
+            pending_space = len(normalized) > 0
+        else:
+            if pending_space:
+                normalized.append(' ')
+                pending_space = False
+            normalized.append(char)
+            if char in ("'", '"'):
+                quote = char
+    return ''.join(normalized).rstrip('; ')
+
+
+def get_cache_key(
+    sql: str,
+    parameters: Optional[Sequence[Dict]],
+    data_version: str,
+) -> str:
+    """Returns the cache key of a given query.
+    """
+    source = json.dumps(
+        {
+            'sql': normalize_sql(sql),
+            'parameters': sorted(
+                (p['name'], p['value']) for p in (parameters or [])
+            ),
+            'dataVersion': data_version,
+        },
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def encode_value(value: Any) -> Dict:
+    """Encodes a given value that JSON does not support.
+
+    :raises TypeError: if ``value`` is not supported.
+    """
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'$bytes': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f'unsupported value: {type(value)}')
+
+
+def decode_value(obj: Dict) -> Any:
+    """Decodes a value encoded by ``encode_value``.
+
+    Returns ``obj`` as it is if it is not an encoded value.
+    """
+    if len(obj) == 1:
+        if '$decimal' in obj:
+            return Decimal(obj['$decimal'])
+        if '$datetime' in obj:
+            return datetime.datetime.fromisoformat(obj['$datetime'])
+        if '$date' in obj:
+            return datetime.date.fromisoformat(obj['$date'])
+        if '$bytes' in obj:
+            return base64.b64decode(obj['$bytes'])
+    return obj
+
+
+def read_data_version(s3, bucket_name: str) -> str:
+    """Reads the data version token from a given S3 bucket.
+
+    :param S3.Client s3: S3 client.
+
+    :returns: ``INITIAL_DATA_VERSION`` if no data version token is saved.
+    """
+    try:
+        res = s3.get_object(Bucket=bucket_name, Key=DATA_VERSION_KEY)
+    except s3.exceptions.NoSuchKey:
+        return INITIAL_DATA_VERSION
+    return res['Body'].read().decode('utf-8')
+
+
+def bump_data_version(s3, bucket_name: str) -> str:
+    """Saves a new data version token in a given S3 bucket.
+
+    :param S3.Client s3: S3 client.
+
+    :returns: new data version token.
+    """
+    data_version = uuid.uuid4().hex
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=DATA_VERSION_KEY,
+        Body=data_version.encode('utf-8'),
+        ContentType='text/plain',
+    )
+    return data_version
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""Provides AWS service clients shared by Lambda functions.
+
+A client is created on its first use and cached, so that an invocation does
+not pay for clients it does not need.
+Every client is configured with ``DEFAULT_CONFIG``.
+
+.. code-block:: python
+
+    s3 = LazyClient('s3')
+
+    def lambda_handler(event, _):
+        s3.get_object(Bucket=bucket_name, Key=key) # creates the client here
+"""
+
+import threading
+from typing import Any, Dict
+import boto3
+from botocore.config import Config
+
+
+# maximum number of connections kept in the connection pool of a client.
+MAX_POOL_CONNECTIONS = 10
+
+# maximum number of attempts including the initial request.
+MAX_ATTEMPTS = 5
+
+# timeout in seconds to establish a connection.
+CONNECT_TIMEOUT = 5
+
+# timeout in seconds to read from a connection.
+READ_TIMEOUT = 60
+
+DEFAULT_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    retries={
+        'max_attempts': MAX_ATTEMPTS,
+        'mode': 'standard',
+    },
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT,
+)
+
+_clients: Dict[str, Any] = {}
+# creating clients over the default session is not thread-safe
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name: str):
+    """Returns the client of a given service.
+
+    Creates the client if it has not been created yet.
+    """
+    with _clients_lock:
+        client = _clients.get(service_name)
+        if client is None:
+            client = boto3.client(service_name, config=DEFAULT_CONFIG)
+            _clients[service_name] = client
+        return client
+
+
+class LazyClient:
+    """Client of a service that is created when any of its attributes is
+    accessed for the first time.
+
+    Substitutes for a client created at import time; e.g.,
+    ``s3 = boto3.client('s3')``.
+    """
+    def __init__(self, service_name: str):
+        """Initializes with the name of the service.
+        """
+        self.service_name = service_name
+
+
+    def __getattr__(self, name: str):
+        return getattr(get_client(self.service_name), name)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+"""Converts access log records into typed columns of Apache Arrow to write
+Parquet files, and reads the number of columns in Parquet files.
+
+Requires ``pyarrow``, which is imported only when it is needed.
+Install ``libdatawarehouse`` with the ``arrow`` extra.
+Reading the number of columns does not require ``pyarrow``.
+
+.. code-block:: python
+
+    buffer = RowGroupBuffer(tables.RAW_ACCESS_LOG_TABLE)
+    buffer.append(['1', '2022-10-01', '00:00:00', ...])
+    writer.write_table(buffer.flush())
+"""
+
+import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .tables import Table
+
+
+# suffix of the S3 object key of a Parquet file.
+PARQUET_SUFFIX = '.parquet'
+
+# magic number at the end of a Parquet file.
+PARQUET_MAGIC = b'PAR1'
+
+# size of the tail of a Parquet file, which consists of the length of the
+# file metadata and the magic number.
+PARQUET_TAIL_SIZE = 8
+
+# number of bytes at the beginning of the file metadata of a Parquet file,
+# which are enough to read the number of columns.
+PARQUET_METADATA_HEAD_SIZE = 16
+
+# types of Thrift compact protocol fields that the head of the file metadata
+# of a Parquet file has.
+THRIFT_I32_TYPE = 5
+THRIFT_LIST_TYPE = 9
+THRIFT_STRUCT_TYPE = 12
+
+# text representing NULL in access logs.
+NULL_VALUE = '-'
+
+# Arrow types of column types. Other column types are strings.
+ARROW_TYPE_NAMES = {
+    'SMALLINT': 'int16',
+    'INT': 'int32',
+    'BIGINT': 'int64',
+    'FLOAT4': 'float32',
+    'DATE': 'date32',
+}
+
+# ranges of integer column types.
+INTEGER_RANGES: Dict[str, Tuple[int, int]] = {
+    'SMALLINT': (-2 ** 15, 2 ** 15 - 1),
+    'INT': (-2 ** 31, 2 ** 31 - 1),
+    'BIGINT': (-2 ** 63, 2 ** 63 - 1),
+}
+
+
+def get_base_type(data_type: str) -> str:
+    """Returns a given column type without its length; e.g., ``VARCHAR`` for
+    ``VARCHAR(2048)``.
+    """
+    return data_type.split('(', 1)[0].strip().upper()
+
+
+def parse_value(data_type: str, value: Optional[str]) -> Any:
+    """Parses a text value in access logs into a Python value of a given
+    column type.
+
+    :returns: ``None`` if ``value`` is ``None`` or ``NULL_VALUE``.
+
+    :raises ValueError: if ``value`` is invalid for ``data_type``.
+    """
+    if value is None or value == NULL_VALUE:
+        return None
+    base_type = get_base_type(data_type)
+    if base_type in INTEGER_RANGES:
+        number = int(value)
+        min_value, max_value = INTEGER_RANGES[base_type]
+        if not min_value <= number <= max_value:
+            raise ValueError(f'{number} is out of range of {base_type}')
+        return number
+    if base_type == 'FLOAT4':
+        return float(value)
+    if base_type == 'DATE':
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+def get_arrow_schema(table: Table):
+    """Returns the Arrow schema of a given table.
+
+    :returns: ``pyarrow.Schema``.
+    """
+    import pyarrow
+    fields = []
+    for column in table.columns:
+        type_name = ARROW_TYPE_NAMES.get(
+            get_base_type(column.data_type),
+            'string',
+        )
+        fields.append((column.name, getattr(pyarrow, type_name)()))
+    return pyarrow.schema(fields)
+
+
+class RowGroupBuffer:
+    """Buffers typed rows of a given table to be written as a row group.
+    """
+    def __init__(self, table: Table):
+        """Initializes with the table whose columns rows have.
+        """
+        self.table = table
+        self.schema = get_arrow_schema(table)
+        self.columns: List[List[Any]] = [[] for _ in table.columns]
+
+
+    def __len__(self) -> int:
+        return len(self.columns[0])
+
+
+    def append(self, values: Sequence[Optional[str]]):
+        """Parses and appends a given row of text values.
+
+        Leaves the buffer unchanged if any of ``values`` is invalid.
+
+        :raises ValueError: if the number of ``values`` does not match the
+        columns, or any of ``values`` is invalid.
+        """
+        if len(values) != len(self.table.columns):
+            raise ValueError(
+                f'{len(self.table.columns)} values are expected'
+                f' but {len(values)}',
+            )
+        parsed = [
+            parse_value(column.data_type, value)
+                for column, value in zip(self.table.columns, values)
+        ]
+        for column, value in zip(self.columns, parsed):
+            column.append(value)
+
+
+    def flush(self):
+        """Returns the buffered rows and empties the buffer.
+
+        :returns: ``pyarrow.Table``.
+        """
+        import pyarrow
+        arrow_table = pyarrow.Table.from_arrays(
+            [
+                pyarrow.array(column, type=field.type)
+                    for column, field in zip(self.columns, self.schema)
+            ],
+            schema=self.schema,
+        )
+        self.columns = [[] for _ in self.table.columns]
+        return arrow_table
+
+
+def parse_parquet_tail(tail: bytes) -> int:
+    """Returns the length of the file metadata of a Parquet file from the
+    last ``PARQUET_TAIL_SIZE`` bytes of the file.
+
+    :raises ValueError: if ``tail`` is not the tail of a Parquet file.
+    """
+    if len(tail) != PARQUET_TAIL_SIZE or not tail.endswith(PARQUET_MAGIC):
+        raise ValueError('not a Parquet file')
+    return int.from_bytes(tail[:4], 'little')
+
+
+def parse_parquet_column_count(metadata_head: bytes) -> int:
+    """Returns the number of columns in a Parquet file from the first
+    ``PARQUET_METADATA_HEAD_SIZE`` bytes of the file metadata.
+
+    The file metadata is a ``FileMetaData`` struct serialized with the Thrift
+    compact protocol, which starts with ``version`` (field 1, ``i32``) and
+    ``schema`` (field 2, ``list<SchemaElement>``).
+    ``schema`` has the root element followed by an element per column,
+    because Parquet files written by ``mask-access-logs`` have no nested
+    columns.
+
+    :raises ValueError: if ``metadata_head`` does not start as expected.
+    """
+    try:
+        # version: a field header followed by a zigzag varint
+        if metadata_head[0] != (1 << 4) | THRIFT_I32_TYPE:
+            raise ValueError('file metadata must start with version')
+        _, offset = read_varint(metadata_head, 1)
+        # schema: a field header followed by a list header
+        if metadata_head[offset] != (1 << 4) | THRIFT_LIST_TYPE:
+            raise ValueError('version must be followed by schema')
+        list_header = metadata_head[offset + 1]
+        if list_header & 0x0F != THRIFT_STRUCT_TYPE:
+            raise ValueError('schema must be a list of structs')
+        num_elements = list_header >> 4
+        if num_elements == 0x0F:
+            # the list has 15 or more elements
+            num_elements, _ = read_varint(metadata_head, offset + 2)
+    except IndexError as exc:
+        raise ValueError('file metadata is truncated') from exc
+    if num_elements < 1:
+        raise ValueError('schema must have the root element')
+    return num_elements - 1
+
+
+def read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    """Reads an unsigned varint at a given offset.
+
+    :returns: value and the offset next to the varint.
+
+    :raises IndexError: if the varint is truncated.
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80 == 0:
+            return value, offset
+        shift += 7
+
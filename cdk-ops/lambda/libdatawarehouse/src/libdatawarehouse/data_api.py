@@ -3,12 +3,58 @@
 """Provides utilities to access the Redshift Data API.
 """
 
+import datetime
+from decimal import Decimal
+import logging
 import time
-from typing import Dict, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from botocore.exceptions import ClientError
 
 
 RUNNING_STATUSES = ['SUBMITTED', 'PICKED', 'STARTED']
 
+# column types whose values are represented as strings in exact numbers.
+DECIMAL_TYPE_NAMES = ['numeric', 'decimal']
+
+# column types whose values are timestamps.
+TIMESTAMP_TYPE_NAMES = ['timestamp', 'timestamptz']
+
+# NumPy data types of column types. Other column types are objects.
+NUMPY_DTYPES = {
+    'bool': 'bool',
+    'int2': 'int16',
+    'int4': 'int32',
+    'int8': 'int64',
+    'float4': 'float32',
+    'float8': 'float64',
+}
+
+# Arrow types of column types other than decimals and timestamps.
+ARROW_TYPE_NAMES = {
+    'bool': 'bool_',
+    'int2': 'int16',
+    'int4': 'int32',
+    'int8': 'int64',
+    'float4': 'float32',
+    'float8': 'float64',
+    'date': 'date32',
+    'varbyte': 'binary',
+}
+
+# maximum precision of decimals in Redshift and Arrow ``decimal128``.
+MAX_DECIMAL_PRECISION = 38
+
+# formats of timestamps in results.
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S']
+
+# default number of seconds to keep a session alive after a statement.
+DEFAULT_SESSION_KEEP_ALIVE_SECONDS = 60
+
+# errors raised when a session has expired or is unavailable.
+SESSION_ERROR_CODES = ['ValidationException', 'ResourceNotFoundException']
+
+LOGGER = logging.getLogger(__name__)
+
 
 def wait_for_results(
     client,
@@ -41,3 +87,364 @@ def wait_for_results(
                 client.cancel_statement(Id=statement_id)
             return None, res
         time.sleep(polling_interval)
+
+
+class Session:
+    """Session of the Redshift Data API shared by consecutive statements.
+
+    The first statement opens a session with ``SessionKeepAliveSeconds``, and
+    the following statements reuse the session by ``SessionId`` so that they
+    pay the connection setup only once.
+    If the session has expired, opens a new session and submits the statement
+    again.
+
+    A session runs only one statement at a time, so you have to wait for a
+    statement to finish before you submit the next one.
+    """
+    def __init__(
+        self,
+        client,
+        workgroup_name: str,
+        database_name: str,
+        secret_arn: Optional[str] = None,
+        keep_alive_seconds: int = DEFAULT_SESSION_KEEP_ALIVE_SECONDS,
+        session_id: Optional[str] = None,
+    ):
+        """Initializes with the parameters to open a session.
+
+        :param RedshiftDataAPIService.Client client: Redshift Data API client.
+
+        :param Optional[str] secret_arn: ARN of the secret containing the
+        credentials. Uses the IAM identity of ``client`` if omitted.
+
+        :param int keep_alive_seconds: number of seconds to keep the session
+        alive after a statement finishes.
+
+        :param Optional[str] session_id: ID of an existing session to reuse;
+        e.g., one opened by a previous step of a workflow.
+        """
+        self.client = client
+        self.workgroup_name = workgroup_name
+        self.database_name = database_name
+        self.secret_arn = secret_arn
+        self.keep_alive_seconds = keep_alive_seconds
+        self.session_id = session_id
+
+
+    def execute_statement(self, sql: str, **kwargs) -> str:
+        """Submits a given SQL statement in the session.
+
+        Extra keyword arguments, e.g., ``Parameters``, are passed to
+        ``ExecuteStatement``.
+
+        :returns: ID of the statement.
+        """
+        return self.submit(self.client.execute_statement, Sql=sql, **kwargs)
+
+
+    def batch_execute_statement(self, sqls: Sequence[str]) -> str:
+        """Submits given SQL statements as a single transaction in the
+        session.
+
+        :returns: ID of the batch statement.
+        """
+        return self.submit(self.client.batch_execute_statement, Sqls=sqls)
+
+
+    def submit(self, method, **kwargs) -> str:
+        """Submits a statement by a given method of the client in the session.
+
+        Opens a new session if there is no session, or the session has
+        expired.
+
+        :returns: ID of the statement.
+        """
+        if self.session_id is not None:
+            try:
+                res = method(SessionId=self.session_id, **kwargs)
+                return res['Id']
+            except ClientError as exc:
+                if not is_session_error(exc):
+                    raise
+                LOGGER.warning(
+                    'session %s is unavailable: %s',
+                    self.session_id,
+                    str(exc),
+                )
+                self.session_id = None
+        params = {
+            'WorkgroupName': self.workgroup_name,
+            'Database': self.database_name,
+            'SessionKeepAliveSeconds': self.keep_alive_seconds,
+        }
+        if self.secret_arn is not None:
+            params['SecretArn'] = self.secret_arn
+        res = method(**params, **kwargs)
+        self.session_id = res.get('SessionId')
+        LOGGER.debug('opened session: %s', self.session_id)
+        return res['Id']
+
+
+def is_session_error(exc: ClientError) -> bool:
+    """Returns whether a given error is caused by an expired or unavailable
+    session.
+    """
+    error = exc.response.get('Error', {})
+    return error.get('Code') in SESSION_ERROR_CODES \
+        and 'session' in error.get('Message', '').lower()
+
+
+def iterate_result_pages(client, statement_id: str) -> Iterator[Dict]:
+    """Iterates over pages of the results of a given statement.
+
+    Fetches the next page only when the previous page has been consumed, so
+    memory use does not grow with the size of the results.
+
+    :param RedshiftDataAPIService.Client client: Redshift Data API client.
+
+    :param str statement_id: ID of a finished statement that returns a result
+    set.
+
+    :returns: iterator of ``GetStatementResult`` responses.
+    """
+    next_token = None
+    while True:
+        if next_token is None:
+            page = client.get_statement_result(Id=statement_id)
+        else:
+            page = client.get_statement_result(
+                Id=statement_id,
+                NextToken=next_token,
+            )
+        yield page
+        next_token = page.get('NextToken')
+        if not next_token:
+            return
+
+
+def iterate_result_batches(
+    client,
+    statement_id: str,
+) -> Iterator[List[Tuple]]:
+    """Iterates over batches of decoded records in the results of a given
+    statement.
+
+    Each batch corresponds to a page of ``GetStatementResult``.
+
+    :param RedshiftDataAPIService.Client client: Redshift Data API client.
+
+    :returns: iterator of lists of records. A record is a ``tuple`` of
+    column values decoded by ``decode_field``.
+    """
+    column_metadata = None
+    for page in iterate_result_pages(client, statement_id):
+        # keeps the metadata in case it is omitted from later pages
+        column_metadata = page.get('ColumnMetadata') or column_metadata
+        yield [
+            decode_record(record, column_metadata)
+                for record in page['Records']
+        ]
+
+
+def iterate_results(client, statement_id: str) -> Iterator[Tuple]:
+    """Iterates over decoded records in the results of a given statement.
+
+    :param RedshiftDataAPIService.Client client: Redshift Data API client.
+
+    :returns: iterator of records. A record is a ``tuple`` of column values
+    decoded by ``decode_field``.
+    """
+    for batch in iterate_result_batches(client, statement_id):
+        yield from batch
+
+
+def iterate_column_batches(
+    client,
+    statement_id: str,
+    column_format: str = 'numpy',
+) -> Iterator[Any]:
+    """Iterates over batches of columns in the results of a given statement.
+
+    Requires NumPy if ``column_format`` is ``"numpy"``, or PyArrow if
+    ``column_format`` is ``"arrow"``.
+    Neither is a dependency of this library, and they are imported only when
+    this function is called.
+
+    Column types are chosen from ``ColumnMetadata`` of the results rather
+    than from values, so every batch of the same results has the same types
+    even if a page has only NULLs in a column.
+    NumPy arrays of numbers and booleans are masked arrays whose masks tell
+    NULLs; the other columns are arrays of Python objects where NULLs are
+    ``None``. Please refer to ``get_numpy_dtype`` and ``get_arrow_type``.
+
+    :param RedshiftDataAPIService.Client client: Redshift Data API client.
+
+    :param str column_format: ``"numpy"`` or ``"arrow"``.
+
+    :returns: iterator of batches each of which corresponds to a page of
+    ``GetStatementResult``. A batch is a ``dict`` that maps a column name
+    to a NumPy array if ``column_format`` is ``"numpy"``, or a
+    ``pyarrow.RecordBatch`` if ``column_format`` is ``"arrow"``.
+
+    :raises ValueError: if ``column_format`` is neither ``"numpy"`` nor
+    ``"arrow"``.
+
+    :raises ImportError: if NumPy or PyArrow is not available.
+    """
+    if column_format == 'numpy':
+        import numpy as np
+
+        def get_converter(column_metadata: Sequence[Dict]):
+            names = [metadata['name'] for metadata in column_metadata]
+            dtypes = [
+                get_numpy_dtype(metadata) for metadata in column_metadata
+            ]
+
+            def to_columns(values: Sequence[List]):
+                return {
+                    name: to_numpy_array(np, column, dtype)
+                        for name, column, dtype in zip(names, values, dtypes)
+                }
+            return to_columns
+    elif column_format == 'arrow':
+        import pyarrow as pa
+
+        def get_converter(column_metadata: Sequence[Dict]):
+            schema = pa.schema([
+                (metadata['name'], get_arrow_type(pa, metadata))
+                    for metadata in column_metadata
+            ])
+
+            def to_columns(values: Sequence[List]):
+                return pa.RecordBatch.from_arrays(
+                    [
+                        pa.array(column, type=field.type)
+                            for column, field in zip(values, schema)
+                    ],
+                    schema=schema,
+                )
+            return to_columns
+    else:
+        raise ValueError(f'unsupported column format: {column_format}')
+    column_metadata = None
+    to_columns = None
+    for page in iterate_result_pages(client, statement_id):
+        column_metadata = page.get('ColumnMetadata') or column_metadata
+        if to_columns is None:
+            # the metadata is the same over the pages
+            to_columns = get_converter(column_metadata)
+        values = [[] for _ in column_metadata]
+        for record in page['Records']:
+            for i, field in enumerate(record):
+                values[i].append(decode_field(field, column_metadata[i]))
+        yield to_columns(values)
+
+
+def get_numpy_dtype(metadata: Dict) -> str:
+    """Chooses the NumPy data type of a given column.
+
+    :param Dict metadata: ``ColumnMetadata`` of the column.
+
+    :returns: one of ``NUMPY_DTYPES``, or ``object`` for the other column
+    types.
+    """
+    return NUMPY_DTYPES.get(metadata.get('typeName', '').lower(), 'object')
+
+
+def to_numpy_array(np, values: Sequence[Any], dtype: str):
+    """Converts given column values into a NumPy array of a given data type.
+
+    :param module np: ``numpy`` module.
+
+    :returns: masked array that masks ``None`` unless ``dtype`` is
+    ``object``, in which case ``None`` is kept as it is.
+    """
+    if dtype == 'object':
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    return np.ma.masked_array(
+        [0 if value is None else value for value in values],
+        mask=[value is None for value in values],
+        dtype=dtype,
+    )
+
+
+def get_arrow_type(pa, metadata: Dict):
+    """Chooses the Arrow type of a given column.
+
+    :param module pa: ``pyarrow`` module.
+
+    :param Dict metadata: ``ColumnMetadata`` of the column.
+
+    :returns: ``pyarrow.DataType``. ``string`` for column types not in
+    ``ARROW_TYPE_NAMES``, ``DECIMAL_TYPE_NAMES``, nor
+    ``TIMESTAMP_TYPE_NAMES``.
+    """
+    type_name = metadata.get('typeName', '').lower()
+    if type_name in ARROW_TYPE_NAMES:
+        return getattr(pa, ARROW_TYPE_NAMES[type_name])()
+    if type_name in DECIMAL_TYPE_NAMES:
+        precision = metadata.get('precision', 0)
+        if not 0 < precision <= MAX_DECIMAL_PRECISION:
+            precision = MAX_DECIMAL_PRECISION
+        return pa.decimal128(precision, metadata.get('scale', 0))
+    if type_name == 'timestamp':
+        return pa.timestamp('us')
+    # timestamps with time zones stay strings; please refer to
+    # parse_timestamp
+    return pa.string()
+
+
+def decode_record(
+    record: Sequence[Dict],
+    column_metadata: Sequence[Dict],
+) -> Tuple:
+    """Decodes fields of a given record in ``GetStatementResult``.
+    """
+    return tuple(
+        decode_field(field, metadata)
+            for field, metadata in zip(record, column_metadata)
+    )
+
+
+def decode_field(field: Dict, metadata: Dict) -> Any:
+    """Decodes a given field in ``GetStatementResult`` into a Python value.
+
+    ``NUMERIC`` and ``DECIMAL`` values become ``Decimal``, ``DATE`` values
+    become ``datetime.date``, and ``TIMESTAMP`` values become
+    ``datetime.datetime``.
+    Other values are returned as the Data API represents them.
+
+    :param Dict metadata: ``ColumnMetadata`` of the column of ``field``.
+
+    :returns: ``None`` if ``field`` is null.
+    """
+    if field.get('isNull', False):
+        return None
+    if 'stringValue' not in field:
+        # booleanValue, longValue, doubleValue, or blobValue
+        return next(iter(field.values()))
+    value = field['stringValue']
+    type_name = metadata.get('typeName', '').lower()
+    if type_name in DECIMAL_TYPE_NAMES:
+        return Decimal(value)
+    if type_name == 'date':
+        return datetime.date.fromisoformat(value)
+    if type_name in TIMESTAMP_TYPE_NAMES:
+        return parse_timestamp(value)
+    return value
+
+
+def parse_timestamp(value: str) -> Any:
+    """Parses a given timestamp in results.
+
+    :returns: ``datetime.datetime``. ``value`` as it is if it is not in any
+    of ``TIMESTAMP_FORMATS``; e.g., with a time zone.
+    """
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, timestamp_format)
+        except ValueError:
+            pass
+    return value
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+"""Snapshot of the dimension tables to encode access logs before loading.
+
+``load-access-logs`` exports the dimension tables to a snapshot on S3 and
+updates it after every load.
+``mask-access-logs`` looks up the values in access logs in the snapshot and
+writes their IDs in the columns of pre-encoded IDs of
+``tables.RAW_ACCESS_LOG_TABLE``.
+``load-access-logs`` upserts and joins only values that have no pre-encoded
+IDs.
+Values in the dimension tables never change their IDs and are never deleted,
+so an outdated snapshot only leaves more values to SQL.
+
+A snapshot is a binary file of a header followed by a section per dimension.
+Integers are little endian.
+
+* header: magic ``DIMS``, format version (uint32), and number of sections
+  (uint32).
+* section:
+  * length of the table name (uint32) and the table name in UTF-8.
+  * number of values ``n`` (uint32).
+  * ``n + 1`` offsets of values in the string table (uint32).
+  * ``n`` IDs of values (int64).
+  * string table: values in UTF-8 sorted in byte order and concatenated.
+
+Fixed-width arrays and the sorted string table let a reader look up a value
+by binary search without parsing all the values.
+
+.. code-block:: python
+
+    snapshot = load_dimension_snapshot(data)
+    page_id = snapshot.lookup(tables.PAGE_TABLE_NAME, '/index.html')
+"""
+
+import array
+import struct
+import sys
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from . import tables
+
+
+class Dimension(NamedTuple):
+    """Dimension table of values in access logs.
+    """
+    table_name: str
+    value_column: str
+    """Column of values in the dimension table."""
+    id_column: str
+    """Column of pre-encoded IDs in ``tables.RAW_ACCESS_LOG_TABLE``."""
+
+
+EDGE_LOCATION_DIMENSION = Dimension(
+    tables.EDGE_LOCATION_TABLE_NAME,
+    'code',
+    'edge_location_id',
+)
+PAGE_DIMENSION = Dimension(tables.PAGE_TABLE_NAME, 'path', 'page_id')
+REFERER_DIMENSION = Dimension(tables.REFERER_TABLE_NAME, 'url', 'referer_id')
+USER_AGENT_DIMENSION = Dimension(
+    tables.USER_AGENT_TABLE_NAME,
+    'user_agent',
+    'user_agent_id',
+)
+RESULT_TYPE_DIMENSION = Dimension(
+    tables.RESULT_TYPE_TABLE_NAME,
+    'result_type',
+    'result_type_id',
+)
+
+# in the order of the columns of pre-encoded IDs.
+DIMENSIONS = [
+    EDGE_LOCATION_DIMENSION,
+    PAGE_DIMENSION,
+    REFERER_DIMENSION,
+    USER_AGENT_DIMENSION,
+    RESULT_TYPE_DIMENSION,
+]
+
+MAGIC = b'DIMS'
+FORMAT_VERSION = 1
+HEADER_FORMAT = '<4sII'
+LENGTH_FORMAT = '<I'
+
+# maximum number of looked-up values remembered by a dimension table.
+MAX_MEMO_SIZE = 100000
+
+
+class DimensionTable:
+    """Sorted values of a dimension and their IDs.
+    """
+
+    offsets: array.array
+    ids: array.array
+    strings: memoryview
+    memo: Dict[str, Optional[int]]
+
+
+    def __init__(
+        self,
+        offsets: array.array,
+        ids: array.array,
+        strings: memoryview,
+    ):
+        """Initializes with the offsets of values in a given string table and
+        the IDs of the values.
+        """
+        self.offsets = offsets
+        self.ids = ids
+        self.strings = strings
+        self.memo = {}
+
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+    def get_value(self, index: int) -> bytes:
+        """Returns the value at a given index in UTF-8.
+        """
+        return bytes(
+            self.strings[self.offsets[index]:self.offsets[index + 1]],
+        )
+
+
+    def lookup(self, value: str) -> Optional[int]:
+        """Returns the ID of a given value.
+
+        Remembers looked-up values because values repeat in access logs.
+
+        :returns: ``None`` if ``value`` is not in this table.
+        """
+        if value in self.memo:
+            return self.memo[value]
+        key = value.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_value(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = None
+        if low < len(self) and self.get_value(low) == key:
+            found = self.ids[low]
+        if len(self.memo) >= MAX_MEMO_SIZE:
+            self.memo.clear()
+        self.memo[value] = found
+        return found
+
+
+    def items(self) -> Iterator[Tuple[bytes, int]]:
+        """Iterates over values in UTF-8 and their IDs in the order of
+        values.
+        """
+        for i, value_id in enumerate(self.ids):
+            yield self.get_value(i), value_id
+
+
+    @property
+    def max_id(self) -> int:
+        """Maximum ID in this table. ``0`` if this table is empty.
+        """
+        return max(self.ids, default=0)
+
+
+    def to_bytes(self, table_name: str) -> bytes:
+        """Serializes this table into a section of a snapshot.
+        """
+        name = table_name.encode('utf-8')
+        return b''.join([
+            struct.pack(LENGTH_FORMAT, len(name)),
+            name,
+            struct.pack(LENGTH_FORMAT, len(self)),
+            to_little_endian(self.offsets),
+            to_little_endian(self.ids),
+            self.strings,
+        ])
+
+
+def create_dimension_table(
+    entries: Iterable[Tuple[bytes, int]],
+) -> DimensionTable:
+    """Creates a dimension table of given values in UTF-8 and their IDs.
+
+    A later entry wins if values duplicate.
+    """
+    values: Dict[bytes, int] = dict(entries)
+    offsets = array.array('I', [0])
+    ids = array.array('q')
+    strings: List[bytes] = []
+    for value in sorted(values):
+        strings.append(value)
+        offsets.append(offsets[-1] + len(value))
+        ids.append(values[value])
+    return DimensionTable(offsets, ids, memoryview(b''.join(strings)))
+
+
+class DimensionSnapshot:
+    """Snapshot of the dimension tables.
+    """
+
+    tables: Dict[str, DimensionTable]
+
+
+    def __init__(self, dimension_tables: Dict[str, DimensionTable]):
+        """Initializes with dimension tables keyed by their names.
+        """
+        self.tables = dimension_tables
+
+
+    def lookup(self, table_name: str, value: str) -> Optional[int]:
+        """Returns the ID of a given value in a given dimension table.
+
+        :returns: ``None`` if ``value`` is not in the snapshot.
+        """
+        table = self.tables.get(table_name)
+        if table is None:
+            return None
+        return table.lookup(value)
+
+
+    def to_bytes(self) -> bytes:
+        """Serializes this snapshot.
+        """
+        return b''.join([
+            struct.pack(
+                HEADER_FORMAT,
+                MAGIC,
+                FORMAT_VERSION,
+                len(self.tables),
+            ),
+            *(
+                table.to_bytes(table_name)
+                    for table_name, table in self.tables.items()
+            ),
+        ])
+
+
+def load_dimension_snapshot(data: bytes) -> DimensionSnapshot:
+    """Loads a snapshot from given bytes.
+
+    Does not copy the string tables.
+
+    :raises ValueError: if ``data`` is broken.
+    """
+    view = memoryview(data)
+    try:
+        magic, version, num_tables = struct.unpack_from(HEADER_FORMAT, view)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'unsupported snapshot: {magic} {version}')
+        position = struct.calcsize(HEADER_FORMAT)
+        length_size = struct.calcsize(LENGTH_FORMAT)
+        dimension_tables = {}
+        for _ in range(num_tables):
+            name_size, = struct.unpack_from(LENGTH_FORMAT, view, position)
+            position += length_size
+            name = bytes(view[position:position + name_size]).decode('utf-8')
+            position += name_size
+            num_values, = struct.unpack_from(LENGTH_FORMAT, view, position)
+            position += length_size
+            offsets = from_little_endian(
+                'I',
+                view[position:position + 4 * (num_values + 1)],
+            )
+            position += 4 * (num_values + 1)
+            ids = from_little_endian(
+                'q',
+                view[position:position + 8 * num_values],
+            )
+            position += 8 * num_values
+            if len(offsets) != num_values + 1 or len(ids) != num_values:
+                raise ValueError(f'truncated arrays of {name}')
+            strings = view[position:position + offsets[-1]]
+            if len(strings) != offsets[-1]:
+                raise ValueError(f'truncated string table of {name}')
+            position += offsets[-1]
+            dimension_tables[name] = DimensionTable(offsets, ids, strings)
+    except (struct.error, UnicodeDecodeError, IndexError) as exc:
+        raise ValueError(f'broken snapshot: {exc}') from exc
+    return DimensionSnapshot(dimension_tables)
+
+
+def from_little_endian(typecode: str, data: memoryview) -> array.array:
+    """Reads an array of little-endian integers.
+
+    :raises ValueError: if the size of ``data`` does not match.
+    """
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def to_little_endian(values: array.array) -> bytes:
+    """Writes an array of integers in little endian.
+    """
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
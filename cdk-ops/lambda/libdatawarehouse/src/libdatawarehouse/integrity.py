@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""Integrity of masked access logs files.
+
+``mask-access-logs`` computes the CRC32 checksum of a masked access logs file
+while it writes the file, and sends the checksum to S3 as an additional
+checksum of the S3 object.
+After it has read the original file to the end, which makes ``gzip`` verify
+the trailer of the original file, it records the following user-defined
+metadata of the S3 object,
+* ``rows``: number of records in the file.
+* ``crc32``: CRC32 checksum of the entire file in base64, which is how S3
+  represents additional checksums.
+
+``delete-access-logs`` compares the metadata with the checksum that S3 has
+computed in a single HEAD request, so it never downloads the masked file to
+verify it before deleting the original file.
+
+S3 cannot change the metadata of an S3 object uploaded in multiple parts, so
+such an object has ``rows`` of ``pending`` until ``mask-access-logs`` copies
+the object onto itself with the metadata.
+Objects written before checksums were introduced have no metadata.
+"""
+
+import base64
+from typing import Dict
+
+
+# keys of the user-defined metadata.
+ROWS_METADATA_KEY = 'rows'
+CRC32_METADATA_KEY = 'crc32'
+
+# number of rows of an S3 object whose metadata has not been recorded yet.
+PENDING_ROWS = 'pending'
+
+# outcomes of ``check_masked_object``.
+VERIFIED = 'verified'
+PENDING = 'pending'
+MISMATCH = 'mismatch'
+UNCHECKED = 'unchecked'
+
+
+def encode_crc32(crc32: int) -> str:
+    """Encodes a given CRC32 checksum in the representation of S3.
+    """
+    return base64.b64encode(crc32.to_bytes(4, 'big')).decode('ascii')
+
+
+def get_masked_object_metadata(rows: int, crc32: int) -> Dict[str, str]:
+    """Returns the user-defined metadata of a masked access logs file.
+    """
+    return {
+        ROWS_METADATA_KEY: str(rows),
+        CRC32_METADATA_KEY: encode_crc32(crc32),
+    }
+
+
+def check_masked_object(head_results: Dict) -> str:
+    """Checks the integrity of a masked access logs file.
+
+    :param Dict head_results: results of ``HeadObject`` with
+    ``ChecksumMode=ENABLED``.
+
+    :returns: ``VERIFIED`` if the metadata matches the checksum that S3 has
+    computed, ``PENDING`` if the metadata has not been recorded yet,
+    ``MISMATCH`` if the metadata is broken or does not match the checksum,
+    or ``UNCHECKED`` if the file has no metadata.
+    """
+    metadata = head_results.get('Metadata', {})
+    rows = metadata.get(ROWS_METADATA_KEY)
+    if rows is None:
+        return UNCHECKED
+    if rows == PENDING_ROWS:
+        return PENDING
+    if not rows.isdigit():
+        return MISMATCH
+    crc32 = metadata.get(CRC32_METADATA_KEY)
+    if crc32 is None or crc32 != head_results.get('ChecksumCRC32'):
+        return MISMATCH
+    return VERIFIED
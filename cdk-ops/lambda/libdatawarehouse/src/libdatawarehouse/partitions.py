@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""Layout of masked access logs files on S3.
+
+Masked access logs files are partitioned by the CloudFront distributions
+that they come from, and into time buckets by the timestamps of their
+records.
+The granularity of buckets is either a day,
+
+``{distribution_id}/{year}/{month}/{day}/{name}``
+
+or an hour,
+
+``{distribution_id}/{year}/{month}/{day}/{hour}/{name}``
+
+where ``name`` is the key of the original access logs file, which may have a
+suffix like ``.parquet``.
+Files written before distributions were introduced have no
+``{distribution_id}/``.
+All the layouts may coexist under the same prefix, so readers accept any of
+them.
+"""
+
+import datetime
+import re
+from typing import NamedTuple, Optional
+
+
+# granularity of daily buckets.
+DAY_GRANULARITY = 'day'
+
+# granularity of hourly buckets.
+HOUR_GRANULARITY = 'hour'
+
+GRANULARITIES = [DAY_GRANULARITY, HOUR_GRANULARITY]
+
+# pattern of the ID of a CloudFront distribution.
+DISTRIBUTION_ID_PATTERN = re.compile(r'^[A-Z0-9]+$')
+
+
+class Partition(NamedTuple):
+    """Time bucket of access logs from a CloudFront distribution.
+    """
+    date: datetime.date
+    hour: Optional[int] = None
+    """Hour of the bucket. ``None`` for a daily bucket."""
+    distribution_id: Optional[str] = None
+    """ID of the CloudFront distribution. ``None`` if unknown."""
+
+
+    def get_prefix(self) -> str:
+        """Returns the key prefix of the bucket.
+
+        The prefix ends with a slash (``/``).
+        """
+        prefix = ''
+        if self.distribution_id is not None:
+            prefix += f'{self.distribution_id}/'
+        prefix += ''.join([
+            f'{self.date.year:04d}/',
+            f'{self.date.month:02d}/',
+            f'{self.date.day:02d}/',
+        ])
+        if self.hour is not None:
+            prefix += f'{self.hour:02d}/'
+        return prefix
+
+
+def get_partition(
+    date: datetime.date,
+    hour: int,
+    granularity: str,
+    distribution_id: Optional[str] = None,
+) -> Partition:
+    """Returns the time bucket of records at a given date and hour.
+
+    :param Optional[str] distribution_id: ID of the CloudFront distribution
+    of the records. ``None`` if unknown.
+
+    :raises ValueError: if ``granularity`` is unknown.
+    """
+    if granularity == DAY_GRANULARITY:
+        return Partition(date, None, distribution_id)
+    if granularity == HOUR_GRANULARITY:
+        return Partition(date, hour, distribution_id)
+    raise ValueError(f'unknown partition granularity: {granularity}')
+
+
+def is_distribution_id(value: str) -> bool:
+    """Returns whether a given string is the ID of a CloudFront distribution.
+
+    A string of only digits is not, because it is a year.
+    """
+    return DISTRIBUTION_ID_PATTERN.match(value) is not None \
+        and not value.isdigit()
+
+
+def parse_distribution_id(src_key: str) -> Optional[str]:
+    """Parses the ID of the CloudFront distribution out of a given S3 object
+    key of an original access logs file.
+
+    ``src_key`` is supposed to end with
+    ``{distribution_id}.{yyyy-mm-dd-hh}.{hash}.gz``.
+
+    :returns: ``None`` if ``src_key`` has no distribution ID.
+    """
+    name = src_key.split('/')[-1]
+    if '.' not in name:
+        return None
+    distribution_id = name.split('.', 1)[0]
+    if not is_distribution_id(distribution_id):
+        return None
+    return distribution_id
+
+
+class PartitionedKey(NamedTuple):
+    """S3 object key of masked access logs broken into parts.
+    """
+    partition: Partition
+    name: str
+    """Last segment of the key."""
+
+
+def parse_partitioned_key(key: str) -> Optional[PartitionedKey]:
+    """Parses a given S3 object key of masked access logs.
+
+    ``key`` must not include the prefix before the distribution ID or the
+    year.
+
+    :returns: ``None`` if ``key`` is invalid.
+    """
+    parts = key.split('/')
+    distribution_id = None
+    if is_distribution_id(parts[0]):
+        distribution_id = parts[0]
+        parts = parts[1:]
+    if len(parts) not in (4, 5) or len(parts[-1]) == 0:
+        return None
+    try:
+        date = datetime.date(int(parts[0]), int(parts[1]), int(parts[2]))
+        hour = int(parts[3]) if len(parts) == 5 else None
+    except ValueError:
+        return None
+    if hour is not None and not 0 <= hour <= 23:
+        return None
+    return PartitionedKey(
+        Partition(date, hour, distribution_id),
+        parts[-1],
+    )
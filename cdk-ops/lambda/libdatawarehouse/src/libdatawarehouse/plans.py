@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+"""Captures and compares query plans of SQL statements.
+
+``load-access-logs`` builds its SQL statements by string concatenation, so a
+changed join condition or a missing sort key may silently turn a load into a
+broadcast or nested-loop join.
+A captured plan is the output of ``EXPLAIN`` normalized so that plans of
+different runs and dates can be compared:
+* costs, rows, and widths are removed from the operators.
+* run IDs in table names become ``{run_id}``.
+* string literals become ``'?'``.
+* hints about missing statistics are dropped, because staging tables never
+  have statistics.
+
+Plans are saved in a JSON file keyed by the labels of statements.
+``compare_plans`` flags a statement if its plan has more joins of
+``FLAGGED_JOIN_STRATEGIES`` than the recorded plan, or its estimated cost
+has grown beyond a threshold.
+
+.. code-block:: python
+
+    plan = parse_plan(label, [record[0] for record in records])
+    regressions = compare_plans(recorded_plans, {label: plan})
+"""
+
+import json
+import re
+from typing import Dict, List, NamedTuple, Sequence
+
+
+# join strategies that are flagged if they newly appear in a plan.
+# a broadcast or redistribution of both sides of a join moves the entire
+# table across nodes, and a nested loop joins every pair of rows.
+FLAGGED_JOIN_STRATEGIES = [
+    'DS_BCAST_INNER',
+    'DS_DIST_ALL_INNER',
+    'DS_DIST_BOTH',
+    'Nested Loop',
+]
+
+# join strategies recorded in a plan.
+JOIN_STRATEGIES = [
+    'DS_DIST_NONE',
+    'DS_DIST_ALL_NONE',
+    'DS_DIST_INNER',
+    'DS_DIST_OUTER',
+    *FLAGGED_JOIN_STRATEGIES,
+]
+
+# default ratio of the growth of an estimated cost flagged by
+# ``compare_plans``; e.g., ``1.0`` flags a cost that has doubled.
+DEFAULT_COST_THRESHOLD = 1.0
+
+# estimates of an operator; e.g., ``(cost=0.00..1.23 rows=10 width=20)``.
+ESTIMATES_PATTERN = re.compile(
+    r'\s*\(cost=([0-9.]+)\.\.([0-9.]+) rows=\d+ width=\d+\)',
+)
+
+# run ID generated by ``uuid.uuid4().hex``.
+RUN_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+# string literal that may contain escaped quotes.
+STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+
+# prefix of hints that ``EXPLAIN`` appends to a plan.
+HINT_PREFIX = '-----'
+
+# number of words of an SQL statement in its label.
+LABEL_WORDS = 3
+
+
+class Plan(NamedTuple):
+    """Normalized plan of an SQL statement.
+    """
+    label: str
+    lines: List[str]
+    """Normalized operators indented as ``EXPLAIN`` does."""
+    cost: float
+    """Estimated total cost of the topmost operator."""
+    join_strategies: Dict[str, int]
+    """Number of joins per strategy."""
+
+
+    def to_dict(self) -> Dict:
+        """Returns a JSON-serializable ``dict`` of this plan.
+        """
+        return {
+            'label': self.label,
+            'lines': self.lines,
+            'cost': self.cost,
+            'joinStrategies': self.join_strategies,
+        }
+
+
+    @staticmethod
+    def from_dict(obj: Dict) -> 'Plan':
+        """Creates a plan from a ``dict`` returned by ``to_dict``.
+        """
+        return Plan(
+            obj['label'],
+            obj['lines'],
+            obj['cost'],
+            obj['joinStrategies'],
+        )
+
+
+def normalize_text(text: str) -> str:
+    """Replaces run IDs and string literals in given text.
+    """
+    text = RUN_ID_PATTERN.sub('{run_id}', text)
+    return STRING_LITERAL_PATTERN.sub("'?'", text)
+
+
+def get_statement_label(stage: str, sql: str) -> str:
+    """Returns the label of a given SQL statement in a given stage.
+
+    A label consists of the stage and the first words of the normalized
+    statement; e.g., ``encoded: INSERT INTO page``.
+    Labels are not necessarily unique; please refer to ``label_statements``.
+    """
+    words = normalize_text(sql).split()
+    return f'{stage}: {" ".join(words[:LABEL_WORDS])}'
+
+
+def label_statements(stage: str, sqls: Sequence[str]) -> List[str]:
+    """Returns unique labels of given SQL statements in a given stage.
+
+    Appends ``#2``, ``#3``, ... to the second and later duplicate labels.
+    """
+    counts: Dict[str, int] = {}
+    labels = []
+    for sql in sqls:
+        label = get_statement_label(stage, sql)
+        counts[label] = counts.get(label, 0) + 1
+        if counts[label] > 1:
+            label = f'{label} #{counts[label]}'
+        labels.append(label)
+    return labels
+
+
+def parse_plan(label: str, explain_lines: Sequence[str]) -> Plan:
+    """Parses lines of the output of ``EXPLAIN`` into a normalized plan.
+
+    :raises ValueError: if ``explain_lines`` has no operator with estimates.
+    """
+    lines = []
+    cost = None
+    join_strategies: Dict[str, int] = {}
+    for line in explain_lines:
+        if line.strip().startswith(HINT_PREFIX) or len(line.strip()) == 0:
+            continue
+        match = ESTIMATES_PATTERN.search(line)
+        if match is not None and cost is None:
+            cost = float(match.group(2))
+        operator = normalize_text(ESTIMATES_PATTERN.sub('', line).rstrip())
+        for strategy in JOIN_STRATEGIES:
+            if strategy in operator:
+                join_strategies[strategy] = join_strategies.get(strategy, 0) \
+                    + operator.count(strategy)
+        lines.append(operator)
+    if cost is None:
+        raise ValueError(f'no estimated cost in plan of {label}')
+    return Plan(label, lines, cost, join_strategies)
+
+
+def compare_plans(
+    recorded_plans: Dict[str, Plan],
+    current_plans: Dict[str, Plan],
+    cost_threshold: float = DEFAULT_COST_THRESHOLD,
+) -> List[str]:
+    """Compares current plans with recorded ones.
+
+    Statements that have no recorded plan are not compared.
+
+    :param float cost_threshold: ratio of the growth of an estimated cost to
+    be flagged.
+
+    :returns: messages of the flagged statements. Empty if no statements are
+    flagged.
+    """
+    regressions = []
+    for label, current in current_plans.items():
+        recorded = recorded_plans.get(label)
+        if recorded is None:
+            continue
+        for strategy in FLAGGED_JOIN_STRATEGIES:
+            recorded_count = recorded.join_strategies.get(strategy, 0)
+            current_count = current.join_strategies.get(strategy, 0)
+            if current_count > recorded_count:
+                regressions.append(
+                    f'{label}: {strategy} joins increased from'
+                    f' {recorded_count} to {current_count}',
+                )
+        if current.cost > recorded.cost * (1.0 + cost_threshold):
+            regressions.append(
+                f'{label}: cost grew from {recorded.cost:.2f} to'
+                f' {current.cost:.2f}',
+            )
+    return regressions
+
+
+def dump_plans(plans: Dict[str, Plan]) -> str:
+    """Serializes given plans into JSON.
+    """
+    return json.dumps(
+        [plan.to_dict() for plan in plans.values()],
+        indent=2,
+    ) + '\n'
+
+
+def load_plans(data: str) -> Dict[str, Plan]:
+    """Loads plans serialized by ``dump_plans``.
+
+    :returns: plans keyed by their labels.
+    """
+    return {
+        plan.label: plan for plan in map(Plan.from_dict, json.loads(data))
+    }
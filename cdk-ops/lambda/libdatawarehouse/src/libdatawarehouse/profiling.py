@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""Profiles invocations of Lambda handlers on demand.
+
+A profiled invocation runs under ``cProfile`` and ``tracemalloc``, and saves
+the following S3 objects under
+``{key_prefix}{function_name}/{yyyy}/{mm}/{dd}/``,
+* ``{request_id}.pstats``: statistics of ``cProfile``, which ``pstats.Stats``
+  can load.
+* ``{request_id}.allocations.json``: top allocation sites that
+  ``tracemalloc`` has traced.
+
+.. code-block:: python
+
+    @profiling.profile_handler(BUCKET_NAME, 'profiles/', 0.01)
+    def lambda_handler(event, context):
+        ...
+
+An invocation is profiled at a given sample rate, or if its event has
+``"profile": true``.
+An invocation that is not profiled starts neither profiler.
+"""
+
+import cProfile
+import datetime
+import functools
+import json
+import logging
+import marshal
+import random
+import tracemalloc
+from typing import Any, Callable, Dict
+from botocore.exceptions import ClientError
+from . import clients
+
+
+# suffix of the S3 object key of profiler statistics.
+PSTATS_SUFFIX = '.pstats'
+
+# suffix of the S3 object key of allocation sites.
+ALLOCATIONS_SUFFIX = '.allocations.json'
+
+# number of allocation sites to be saved.
+TOP_ALLOCATION_SITES = 50
+
+# key of the flag in an event that forces profiling.
+PROFILE_EVENT_KEY = 'profile'
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.DEBUG)
+
+s3 = clients.LazyClient('s3')
+
+Handler = Callable[[Any, Any], Any]
+
+
+def profile_handler(
+    bucket_name: str,
+    key_prefix: str,
+    sample_rate: float,
+) -> Callable[[Handler], Handler]:
+    """Returns a decorator that profiles invocations of a Lambda handler.
+
+    :param str bucket_name: name of the S3 bucket where profiles are saved.
+
+    :param str key_prefix: prefix of the S3 object keys of profiles.
+
+    :param float sample_rate: fraction of invocations to be profiled.
+    ``0`` profiles only invocations whose event has the flag.
+    """
+    def decorator(handler: Handler) -> Handler:
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if not should_profile(event, sample_rate):
+                return handler(event, context)
+            return run_profiled(
+                handler,
+                event,
+                context,
+                bucket_name,
+                key_prefix,
+            )
+        return wrapper
+    return decorator
+
+
+def should_profile(event, sample_rate: float) -> bool:
+    """Returns whether an invocation with a given event is to be profiled.
+    """
+    if isinstance(event, dict) and event.get(PROFILE_EVENT_KEY) is True:
+        return True
+    return sample_rate > 0.0 and random.random() < sample_rate
+
+
+def run_profiled(
+    handler: Handler,
+    event,
+    context,
+    bucket_name: str,
+    key_prefix: str,
+):
+    """Runs a given handler under the profilers and saves the profile.
+
+    Saves the profile even if ``handler`` raises an exception.
+    """
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        return handler(event, context)
+    finally:
+        profiler.disable()
+        _, peak_size = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        profiler.create_stats()
+        key_base = get_profile_key_base(key_prefix, context)
+        put_profile_object(
+            bucket_name,
+            f'{key_base}{PSTATS_SUFFIX}',
+            marshal.dumps(profiler.stats),
+        )
+        put_profile_object(
+            bucket_name,
+            f'{key_base}{ALLOCATIONS_SUFFIX}',
+            json.dumps(get_allocation_summary(snapshot, peak_size)).encode(),
+        )
+
+
+def get_profile_key_base(key_prefix: str, context) -> str:
+    """Returns the S3 object key of the profile of a given invocation without
+    the suffix.
+    """
+    now = datetime.datetime.utcnow()
+    return ''.join([
+        key_prefix,
+        f'{context.function_name}/',
+        f'{now.year:04d}/{now.month:02d}/{now.day:02d}/',
+        context.aws_request_id,
+    ])
+
+
+def get_allocation_summary(
+    snapshot: tracemalloc.Snapshot,
+    peak_size: int,
+) -> Dict[str, Any]:
+    """Summarizes the top allocation sites in a given snapshot.
+
+    :returns: ``dict`` with the peak size in bytes, ``peakSize``, and the
+    list of allocation sites, ``sites``, each of which has ``filename``,
+    ``lineno``, ``size`` in bytes, and ``count`` of blocks.
+    """
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+    ])
+    statistics = snapshot.statistics('lineno')[:TOP_ALLOCATION_SITES]
+    return {
+        'peakSize': peak_size,
+        'sites': [
+            {
+                'filename': stat.traceback[0].filename,
+                'lineno': stat.traceback[0].lineno,
+                'size': stat.size,
+                'count': stat.count,
+            } for stat in statistics
+        ],
+    }
+
+
+def put_profile_object(bucket_name: str, key: str, body: bytes):
+    """Puts a given object of a profile.
+
+    Just logs an error if it fails, because profiling must not fail an
+    invocation.
+    """
+    try:
+        s3.put_object(Bucket=bucket_name, Key=key, Body=body)
+        LOGGER.debug('saved profile: %s', key)
+    except ClientError as exc:
+        LOGGER.error('failed to save profile %s: %s', key, str(exc))
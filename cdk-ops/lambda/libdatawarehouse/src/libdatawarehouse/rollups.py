@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""Maintains daily rollup tables that aggregate the access log table.
+
+Rows of a rollup table are replaced per day, because percentiles of
+``time_taken`` cannot be updated incrementally.
+"""
+
+from . import tables
+from .tables import Table
+
+
+def get_key_column(table: Table) -> str:
+    """Returns the name of the column other than ``date`` by which a given
+    daily rollup table aggregates access logs.
+    """
+    return table.columns[1].name
+
+
+def get_delete_rollup_statement(table: Table, condition: str) -> str:
+    """Returns an SQL statement that deletes rows from a given daily rollup
+    table.
+
+    :param str condition: condition on the ``date`` column of rows to be
+    deleted.
+    """
+    return ''.join([
+        f'DELETE FROM {table.name}',
+        f'  WHERE {condition}',
+    ])
+
+
+def get_insert_rollup_statement(table: Table, condition: str) -> str:
+    """Returns an SQL statement that aggregates the access log table by day
+    and inserts the results into a given daily rollup table.
+
+    :param str condition: condition on the columns of the access log table
+    to select rows to be aggregated. Must select entire days.
+    """
+    key_column = get_key_column(table)
+    percentiles = ','.join(
+        ''.join([
+            f'    APPROXIMATE PERCENTILE_DISC({p * 0.01:.2f})',
+            '      WITHIN GROUP (ORDER BY time_taken)',
+        ]) for p in tables.TIME_TAKEN_PERCENTILES
+    )
+    return ''.join([
+        f'INSERT INTO {table.name}',
+        f'  ({", ".join(c.name for c in table.columns)})',
+        '  SELECT',
+        '    TRUNC(datetime),',
+        f'    {key_column},',
+        '    COUNT(*),',
+        '    SUM(sc_bytes),',
+        '    SUM(cs_bytes),',
+        percentiles,
+        f'  FROM {tables.ACCESS_LOG_TABLE_NAME}',
+        f'  WHERE {condition}',
+        '  GROUP BY 1, 2',
+    ])
+
+
+def get_backfill_rollup_statement(table: Table) -> str:
+    """Returns an SQL statement that aggregates access logs on days missing
+    in a given daily rollup table.
+    """
+    return get_insert_rollup_statement(
+        table,
+        f'TRUNC(datetime) NOT IN (SELECT DISTINCT date FROM {table.name})',
+    )
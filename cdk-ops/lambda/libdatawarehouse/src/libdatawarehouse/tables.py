@@ -1,10 +1,57 @@
 # -*- coding: utf-8 -*-
 
 """Tables in the data warehouse.
+
+Also defines the schema of the tables; i.e., the columns, their types, and
+their compression encodings, from which DDL statements are generated.
+
+Hash columns of the dimension tables are nullable, although every row has a
+hash, because Redshift cannot add ``NOT NULL`` to the hash columns that
+populate-dw-database adds to existing tables.
+
+Encodings are chosen by the following rules,
+* leading sort key columns are ``RAW`` so that zone maps stay effective.
+* numeric, date, and time columns are ``AZ64``.
+* floating point columns are ``ZSTD`` because ``AZ64`` does not support them.
+* low-cardinality strings like HTTP methods are ``BYTEDICT``.
+* other strings are ``ZSTD``.
+* HyperLogLog sketches are ``RAW``.
+
+Access logs are sliced into monthly tables like ``access_log_202210``, and
+``access_log`` is a late-binding view that combines them with ``UNION ALL``.
+A monthly table is created on demand by the stored procedure
+``CREATE_ACCESS_LOG_MONTH_PROCEDURE`` after ``ACCESS_LOG_TABLE``, which is an
+empty template, and the procedure also recreates the view.
+Access logs loaded before monthly tables were introduced stay in
+``access_log_legacy``.
 """
 
+import re
+from typing import NamedTuple, Optional, Sequence
+
+
+# view of all the access logs.
 ACCESS_LOG_TABLE_NAME = 'access_log'
 
+# empty table after which monthly access log tables are created.
+ACCESS_LOG_TEMPLATE_TABLE_NAME = 'access_log_template'
+
+# table of access logs loaded before monthly tables were introduced.
+LEGACY_ACCESS_LOG_TABLE_NAME = 'access_log_legacy'
+
+# prefix of the names of monthly access log tables followed by YYYYMM.
+MONTHLY_ACCESS_LOG_TABLE_PREFIX = 'access_log_'
+
+# names of tables combined by the access log view; in the syntax of both
+# Python and Redshift (POSIX) regular expressions.
+ACCESS_LOG_SLICE_TABLE_PATTERN = '^access_log_([0-9]{6}|legacy)$'
+
+# stored procedures to maintain monthly access log tables; created by
+# populate-dw-database.
+CREATE_ACCESS_LOG_MONTH_PROCEDURE = 'create_access_log_month'
+DROP_ACCESS_LOG_MONTHS_PROCEDURE = 'drop_access_log_months_before'
+REFRESH_ACCESS_LOG_VIEW_PROCEDURE = 'refresh_access_log_view'
+
 REFERER_TABLE_NAME = 'referer'
 
 PAGE_TABLE_NAME = 'page'
@@ -14,3 +61,441 @@ USER_AGENT_TABLE_NAME = 'user_agent'
 EDGE_LOCATION_TABLE_NAME = 'edge_location'
 
 RESULT_TYPE_TABLE_NAME = 'result_type'
+
+DISTRIBUTION_TABLE_NAME = 'distribution'
+
+LOADED_OBJECT_TABLE_NAME = 'loaded_object'
+
+PAGE_DAILY_TABLE_NAME = 'page_daily'
+
+REFERER_DAILY_TABLE_NAME = 'referer_daily'
+
+EDGE_LOCATION_DAILY_TABLE_NAME = 'edge_location_daily'
+
+STATUS_DAILY_TABLE_NAME = 'status_daily'
+
+LOAD_CHECKPOINT_TABLE_NAME = 'load_checkpoint'
+
+ACCESS_LOG_SAMPLE_TABLE_NAME = 'access_log_sample'
+
+PAGE_DAILY_SKETCH_TABLE_NAME = 'page_daily_sketch'
+
+CHANGED_ROW_COUNT_TABLE_NAME = 'changed_row_count'
+
+# names of all the tables in the data warehouse.
+TABLE_NAMES = [
+    ACCESS_LOG_TEMPLATE_TABLE_NAME,
+    REFERER_TABLE_NAME,
+    PAGE_TABLE_NAME,
+    USER_AGENT_TABLE_NAME,
+    EDGE_LOCATION_TABLE_NAME,
+    RESULT_TYPE_TABLE_NAME,
+    DISTRIBUTION_TABLE_NAME,
+    LOADED_OBJECT_TABLE_NAME,
+    PAGE_DAILY_TABLE_NAME,
+    REFERER_DAILY_TABLE_NAME,
+    EDGE_LOCATION_DAILY_TABLE_NAME,
+    STATUS_DAILY_TABLE_NAME,
+    LOAD_CHECKPOINT_TABLE_NAME,
+    ACCESS_LOG_SAMPLE_TABLE_NAME,
+    PAGE_DAILY_SKETCH_TABLE_NAME,
+    CHANGED_ROW_COUNT_TABLE_NAME,
+]
+
+# percentiles of time_taken recorded in daily rollup tables.
+TIME_TAKEN_PERCENTILES = [50, 95, 99]
+
+
+class Column(NamedTuple):
+    """Column of a table.
+    """
+    name: str
+    data_type: str
+    # compression encoding
+    encoding: str
+    # additional attributes; e.g., NOT NULL
+    attributes: str = ''
+
+
+class Table(NamedTuple):
+    """Schema of a table.
+    """
+    name: str
+    columns: Sequence[Column]
+    # table constraints; e.g., PRIMARY KEY
+    constraints: Sequence[str] = ()
+    # table attributes following the column definitions; e.g., SORTKEY
+    attributes: str = ''
+
+
+REFERER_TABLE = Table(
+    name=REFERER_TABLE_NAME,
+    columns=[
+        # the distribution key stays on `id` to collocate referers with the
+        # access log table, whereas `url_hash` is the sort key for lookups.
+        Column('id', 'BIGINT', 'AZ64', 'IDENTITY(1, 1) DISTKEY'),
+        Column('url_hash', 'BIGINT', 'RAW', 'SORTKEY'),
+        Column('url', 'VARCHAR(2048)', 'ZSTD', 'NOT NULL UNIQUE'),
+    ],
+    constraints=['PRIMARY KEY (id)'],
+)
+
+PAGE_TABLE = Table(
+    name=PAGE_TABLE_NAME,
+    columns=[
+        Column('id', 'INT', 'AZ64', 'IDENTITY(1, 1)'),
+        Column('path_hash', 'BIGINT', 'RAW', 'DISTKEY SORTKEY'),
+        Column('path', 'VARCHAR(2048)', 'ZSTD', 'NOT NULL UNIQUE'),
+    ],
+    constraints=['PRIMARY KEY (id)'],
+)
+
+EDGE_LOCATION_TABLE = Table(
+    name=EDGE_LOCATION_TABLE_NAME,
+    columns=[
+        Column('id', 'INT', 'AZ64', 'IDENTITY(1, 1)'),
+        Column('code', 'VARCHAR', 'RAW', 'NOT NULL SORTKEY UNIQUE'),
+    ],
+    constraints=['PRIMARY KEY (id)'],
+)
+
+USER_AGENT_TABLE = Table(
+    name=USER_AGENT_TABLE_NAME,
+    columns=[
+        Column('id', 'BIGINT', 'AZ64', 'IDENTITY(1, 1)'),
+        Column(
+            'user_agent_hash',
+            'BIGINT',
+            'RAW',
+            'DISTKEY SORTKEY',
+        ),
+        Column('user_agent', 'VARCHAR(2048)', 'ZSTD', 'NOT NULL UNIQUE'),
+    ],
+    constraints=['PRIMARY KEY (id)'],
+)
+
+RESULT_TYPE_TABLE = Table(
+    name=RESULT_TYPE_TABLE_NAME,
+    columns=[
+        Column('id', 'INT', 'AZ64', 'IDENTITY(1, 1)'),
+        Column('result_type', 'VARCHAR', 'RAW', 'NOT NULL SORTKEY UNIQUE'),
+    ],
+    constraints=['PRIMARY KEY (id)'],
+)
+
+DISTRIBUTION_TABLE = Table(
+    name=DISTRIBUTION_TABLE_NAME,
+    columns=[
+        Column('id', 'INT', 'AZ64', 'IDENTITY(1, 1)'),
+        Column(
+            'distribution_id',
+            'VARCHAR(32)',
+            'RAW',
+            'NOT NULL SORTKEY UNIQUE',
+        ),
+    ],
+    constraints=['PRIMARY KEY (id)'],
+)
+
+# template of monthly access log tables.
+ACCESS_LOG_TABLE = Table(
+    name=ACCESS_LOG_TEMPLATE_TABLE_NAME,
+    columns=[
+        Column('datetime', 'TIMESTAMP', 'RAW', 'NOT NULL'),
+        Column('seq_num', 'INT', 'AZ64', 'NOT NULL'),
+        Column('edge_location', 'INT', 'AZ64', 'NOT NULL'),
+        Column('sc_bytes', 'BIGINT', 'AZ64', 'NOT NULL'),
+        Column('cs_method', 'VARCHAR', 'BYTEDICT', 'NOT NULL'),
+        Column('page', 'INT', 'AZ64', 'NOT NULL'),
+        Column('status', 'SMALLINT', 'AZ64', 'NOT NULL'),
+        Column('referer', 'BIGINT', 'AZ64', 'DISTKEY'),
+        Column('user_agent', 'BIGINT', 'AZ64', 'NOT NULL'),
+        Column('cs_protocol', 'VARCHAR', 'BYTEDICT', 'NOT NULL'),
+        Column('cs_bytes', 'BIGINT', 'AZ64', 'NOT NULL'),
+        Column('time_taken', 'FLOAT4', 'ZSTD', 'NOT NULL'),
+        Column('edge_response_result_type', 'INT', 'AZ64', 'NOT NULL'),
+        Column('time_to_first_byte', 'FLOAT4', 'ZSTD', 'NOT NULL'),
+        # comes last so that adding it to an existing table keeps the order.
+        # NULL for access logs loaded before distributions were introduced.
+        Column('distribution', 'INT', 'AZ64'),
+    ],
+    constraints=[
+        f'FOREIGN KEY (edge_location) REFERENCES {EDGE_LOCATION_TABLE_NAME}',
+        f'FOREIGN KEY (page) REFERENCES {PAGE_TABLE_NAME}',
+        f'FOREIGN KEY (referer) REFERENCES {REFERER_TABLE_NAME}',
+        f'FOREIGN KEY (user_agent) REFERENCES {USER_AGENT_TABLE_NAME}',
+        ''.join([
+            'FOREIGN KEY (edge_response_result_type)',
+            f' REFERENCES {RESULT_TYPE_TABLE_NAME}',
+        ]),
+        f'FOREIGN KEY (distribution) REFERENCES {DISTRIBUTION_TABLE_NAME}',
+    ],
+    attributes='SORTKEY (datetime, seq_num)',
+)
+
+# deterministic sample of access logs; please refer to
+# ``libdatawarehouse.approximate``.
+ACCESS_LOG_SAMPLE_TABLE = Table(
+    name=ACCESS_LOG_SAMPLE_TABLE_NAME,
+    columns=ACCESS_LOG_TABLE.columns,
+    constraints=ACCESS_LOG_TABLE.constraints,
+    attributes=ACCESS_LOG_TABLE.attributes,
+)
+
+LOADED_OBJECT_TABLE = Table(
+    name=LOADED_OBJECT_TABLE_NAME,
+    columns=[
+        Column('object_key', 'VARCHAR(1024)', 'ZSTD', 'NOT NULL'),
+        Column('date', 'DATE', 'RAW', 'NOT NULL'),
+        Column('loaded_at', 'TIMESTAMP', 'AZ64', 'NOT NULL'),
+    ],
+    constraints=['PRIMARY KEY (object_key)'],
+    attributes='SORTKEY (date, object_key)',
+)
+
+
+# stages that a run of loading access logs has finished.
+# a row is appended every time a run finishes a stage, so that concurrent
+# runs never update the same rows.
+LOAD_CHECKPOINT_TABLE = Table(
+    name=LOAD_CHECKPOINT_TABLE_NAME,
+    columns=[
+        Column('run_id', 'VARCHAR(32)', 'RAW', 'NOT NULL'),
+        Column('stage', 'VARCHAR(16)', 'BYTEDICT', 'NOT NULL'),
+        Column('manifest_key', 'VARCHAR(1024)', 'ZSTD', 'NOT NULL'),
+        Column('finished_at', 'TIMESTAMP', 'AZ64', 'NOT NULL'),
+    ],
+    constraints=['PRIMARY KEY (run_id, stage)'],
+    attributes='SORTKEY (run_id)',
+)
+
+# numbers of rows that loads have changed per table since the table was last
+# analyzed.
+# a row is appended after every load including micro-batch loads, and
+# analyzing a table deletes its rows.
+CHANGED_ROW_COUNT_TABLE = Table(
+    name=CHANGED_ROW_COUNT_TABLE_NAME,
+    columns=[
+        Column('table_name', 'VARCHAR(128)', 'ZSTD', 'NOT NULL'),
+        Column('changed_rows', 'BIGINT', 'AZ64', 'NOT NULL'),
+        Column('recorded_at', 'TIMESTAMP', 'AZ64', 'NOT NULL'),
+    ],
+    attributes='SORTKEY (table_name, recorded_at)',
+)
+
+
+def get_daily_rollup_table(
+    table_name: str,
+    key_column: Column,
+    referenced_table_name: Optional[str] = None,
+) -> Table:
+    """Returns the schema of a table that aggregates access logs by day and
+    a given column.
+
+    :param Column key_column: column to aggregate access logs by, which has
+    the same name as the column of the access log table.
+
+    :param Optional[str] referenced_table_name: name of the dimension table
+    that ``key_column`` references. ``None`` if ``key_column`` references
+    no table.
+    """
+    columns = [
+        Column('date', 'DATE', 'RAW', 'NOT NULL'),
+        key_column,
+        Column('hits', 'BIGINT', 'AZ64', 'NOT NULL'),
+        Column('sc_bytes', 'BIGINT', 'AZ64', 'NOT NULL'),
+        Column('cs_bytes', 'BIGINT', 'AZ64', 'NOT NULL'),
+    ]
+    columns.extend(
+        Column(f'time_taken_p{p}', 'FLOAT4', 'ZSTD', 'NOT NULL')
+            for p in TIME_TAKEN_PERCENTILES
+    )
+    constraints = [f'PRIMARY KEY (date, {key_column.name})']
+    if referenced_table_name is not None:
+        constraints.append(''.join([
+            f'FOREIGN KEY ({key_column.name})',
+            f' REFERENCES {referenced_table_name}',
+        ]))
+    return Table(
+        name=table_name,
+        columns=columns,
+        constraints=constraints,
+        attributes=f'SORTKEY (date, {key_column.name})',
+    )
+
+
+PAGE_DAILY_TABLE = get_daily_rollup_table(
+    PAGE_DAILY_TABLE_NAME,
+    Column('page', 'INT', 'AZ64', 'NOT NULL'),
+    PAGE_TABLE_NAME,
+)
+
+REFERER_DAILY_TABLE = get_daily_rollup_table(
+    REFERER_DAILY_TABLE_NAME,
+    Column('referer', 'BIGINT', 'AZ64', 'NOT NULL'),
+    REFERER_TABLE_NAME,
+)
+
+EDGE_LOCATION_DAILY_TABLE = get_daily_rollup_table(
+    EDGE_LOCATION_DAILY_TABLE_NAME,
+    Column('edge_location', 'INT', 'AZ64', 'NOT NULL'),
+    EDGE_LOCATION_TABLE_NAME,
+)
+
+STATUS_DAILY_TABLE = get_daily_rollup_table(
+    STATUS_DAILY_TABLE_NAME,
+    Column('status', 'SMALLINT', 'AZ64', 'NOT NULL'),
+)
+
+# daily rollup tables.
+DAILY_ROLLUP_TABLES = [
+    PAGE_DAILY_TABLE,
+    REFERER_DAILY_TABLE,
+    EDGE_LOCATION_DAILY_TABLE,
+    STATUS_DAILY_TABLE,
+]
+
+# HyperLogLog sketches of distinct referers and user agents per day and page;
+# please refer to ``libdatawarehouse.approximate``.
+# sketches of pages combine into sketches of any set of pages without losing
+# accuracy.
+PAGE_DAILY_SKETCH_TABLE = Table(
+    name=PAGE_DAILY_SKETCH_TABLE_NAME,
+    columns=[
+        Column('date', 'DATE', 'RAW', 'NOT NULL'),
+        Column('page', 'INT', 'AZ64', 'NOT NULL'),
+        Column('referer_sketch', 'HLLSKETCH', 'RAW'),
+        Column('user_agent_sketch', 'HLLSKETCH', 'RAW'),
+    ],
+    constraints=[
+        'PRIMARY KEY (date, page)',
+        f'FOREIGN KEY (page) REFERENCES {PAGE_TABLE_NAME}',
+    ],
+    attributes='SORTKEY (date, page)',
+)
+
+# schemas of all the tables in the data warehouse.
+# a table comes after the tables that it references.
+TABLES = [
+    REFERER_TABLE,
+    PAGE_TABLE,
+    EDGE_LOCATION_TABLE,
+    USER_AGENT_TABLE,
+    RESULT_TYPE_TABLE,
+    DISTRIBUTION_TABLE,
+    ACCESS_LOG_TABLE,
+    LOADED_OBJECT_TABLE,
+    *DAILY_ROLLUP_TABLES,
+    LOAD_CHECKPOINT_TABLE,
+    ACCESS_LOG_SAMPLE_TABLE,
+    PAGE_DAILY_SKETCH_TABLE,
+    CHANGED_ROW_COUNT_TABLE,
+]
+
+# temporary table to which raw CloudFront access logs are loaded.
+# columns are in the order of the CloudFront standard log file fields
+# followed by the IDs of dimensions pre-encoded by mask-access-logs.
+RAW_ACCESS_LOG_TABLE = Table(
+    name='#raw_access_log',
+    columns=[
+        Column('seq_num', 'INT', 'AZ64'),
+        Column('date', 'DATE', 'RAW'),
+        # text is enough because it is concatenated with date, and
+        # Parquet files written by mask-access-logs have it as a string.
+        Column('time', 'VARCHAR(8)', 'ZSTD'),
+        Column('edge_location', 'VARCHAR', 'BYTEDICT'),
+        Column('sc_bytes', 'BIGINT', 'AZ64'),
+        Column('c_ip', 'VARCHAR', 'ZSTD'),
+        Column('cs_method', 'VARCHAR', 'BYTEDICT'),
+        Column('cs_host', 'VARCHAR', 'BYTEDICT'),
+        Column('cs_uri_stem', 'VARCHAR(2048)', 'ZSTD'),
+        Column('status', 'SMALLINT', 'AZ64'),
+        Column('referer', 'VARCHAR(2048)', 'ZSTD'),
+        Column('user_agent', 'VARCHAR(2048)', 'ZSTD'),
+        Column('cs_uri_query', 'VARCHAR', 'ZSTD'),
+        Column('cs_cookie', 'VARCHAR', 'ZSTD'),
+        Column('edge_result_type', 'VARCHAR', 'BYTEDICT'),
+        Column('edge_request_id', 'VARCHAR', 'ZSTD'),
+        Column('host_header', 'VARCHAR', 'BYTEDICT'),
+        Column('cs_protocol', 'VARCHAR', 'BYTEDICT'),
+        Column('cs_bytes', 'BIGINT', 'AZ64'),
+        Column('time_taken', 'FLOAT4', 'ZSTD'),
+        Column('forwarded_for', 'VARCHAR', 'ZSTD'),
+        Column('ssl_protocol', 'VARCHAR', 'BYTEDICT'),
+        Column('ssl_cipher', 'VARCHAR', 'BYTEDICT'),
+        Column('edge_response_result_type', 'VARCHAR', 'BYTEDICT'),
+        Column('cs_protocol_version', 'VARCHAR', 'BYTEDICT'),
+        Column('fle_status', 'VARCHAR', 'BYTEDICT'),
+        Column('fle_encrypted_fields', 'VARCHAR', 'ZSTD'),
+        Column('c_port', 'INT', 'AZ64'),
+        Column('time_to_first_byte', 'FLOAT4', 'ZSTD'),
+        Column('edge_detailed_result_type', 'VARCHAR', 'BYTEDICT'),
+        Column('sc_content_type', 'VARCHAR', 'BYTEDICT'),
+        Column('sc_content_len', 'BIGINT', 'AZ64'),
+        Column('sc_range_start', 'BIGINT', 'AZ64'),
+        Column('sc_range_end', 'BIGINT', 'AZ64'),
+        # NULL if not pre-encoded, or missing in files written before
+        # pre-encoding was introduced. see libdatawarehouse.dimensions
+        Column('edge_location_id', 'INT', 'AZ64'),
+        Column('page_id', 'INT', 'AZ64'),
+        Column('referer_id', 'BIGINT', 'AZ64'),
+        Column('user_agent_id', 'BIGINT', 'AZ64'),
+        Column('result_type_id', 'INT', 'AZ64'),
+    ],
+    attributes='SORTKEY (date, time, seq_num)',
+)
+
+
+def get_column_definition(column: Column) -> str:
+    """Returns the definition of a given column in a ``CREATE TABLE``
+    statement.
+    """
+    definition = f'{column.name} {column.data_type}'
+    if column.attributes:
+        definition += f' {column.attributes}'
+    return f'{definition} ENCODE {column.encoding}'
+
+
+def get_create_table_statement(
+    table: Table,
+    if_not_exists: bool = True,
+) -> str:
+    """Returns an SQL statement that creates a given table.
+
+    :param bool if_not_exists: whether the statement does nothing if the
+    table already exists.
+    """
+    definitions = [get_column_definition(c) for c in table.columns]
+    definitions.extend(table.constraints)
+    return ''.join([
+        'CREATE TABLE',
+        ' IF NOT EXISTS' if if_not_exists else '',
+        f' {table.name} (',
+        ','.join(f'  {d}' for d in definitions),
+        ')',
+        f' {table.attributes}' if table.attributes else '',
+    ])
+
+
+def get_monthly_access_log_table_name(year: int, month: int) -> str:
+    """Returns the name of the access log table of a given month.
+    """
+    return f'{MONTHLY_ACCESS_LOG_TABLE_PREFIX}{year:04d}{month:02d}'
+
+
+def is_access_log_slice_table_name(table_name: str) -> bool:
+    """Returns whether a given table is combined by the access log view;
+    i.e., a monthly or the legacy access log table.
+    """
+    return re.match(ACCESS_LOG_SLICE_TABLE_PATTERN, table_name) is not None
+
+
+def find_table(table_name: str) -> Table:
+    """Finds the schema of a given table in the data warehouse.
+
+    :raises KeyError: if no table has ``table_name``.
+    """
+    for table in TABLES:
+        if table.name == table_name:
+            return table
+    raise KeyError(f'no such table: {table_name}')
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""Tests reading the number of columns in Parquet files with
+``libdatawarehouse.columnar``.
+"""
+
+import io
+import pytest
+from libdatawarehouse import columnar, tables
+
+
+def read_column_count(data: bytes) -> int:
+    """Reads the number of columns in a given Parquet file as the load
+    function does.
+    """
+    tail = data[-columnar.PARQUET_TAIL_SIZE:]
+    start = len(data) - columnar.PARQUET_TAIL_SIZE \
+        - columnar.parse_parquet_tail(tail)
+    return columnar.parse_parquet_column_count(
+        data[start:start + columnar.PARQUET_METADATA_HEAD_SIZE],
+    )
+
+
+@pytest.mark.parametrize('num_columns', [1, 14, 15, 35, 40, 200])
+def test_read_column_count_of_parquet_file(num_columns):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    schema = pa.schema([
+        (f'column_{i}', pa.int32()) for i in range(num_columns)
+    ])
+    buffer = io.BytesIO()
+    writer = pq.ParquetWriter(buffer, schema)
+    writer.write_table(pa.Table.from_pylist(
+        [{ f'column_{i}': i for i in range(num_columns) }],
+        schema=schema,
+    ))
+    writer.close()
+    assert read_column_count(buffer.getvalue()) == num_columns
+
+
+def test_read_column_count_of_masked_access_logs():
+    pq = pytest.importorskip('pyarrow.parquet')
+    schema = columnar.get_arrow_schema(tables.RAW_ACCESS_LOG_TABLE)
+    buffer = io.BytesIO()
+    pq.ParquetWriter(buffer, schema).close()
+    assert read_column_count(buffer.getvalue()) == \
+        len(tables.RAW_ACCESS_LOG_TABLE.columns)
+
+
+@pytest.mark.parametrize('metadata_head, expected', [
+    # version 1, 3 elements
+    (bytes([0x15, 0x02, 0x19, 0x3C]), 2),
+    # version 2, 41 elements in a varint
+    (bytes([0x15, 0x04, 0x19, 0xFC, 0x29]), 40),
+    # 300 elements in a multi-byte varint
+    (bytes([0x15, 0x04, 0x19, 0xFC, 0xAC, 0x02]), 299),
+])
+def test_parse_parquet_column_count(metadata_head, expected):
+    assert columnar.parse_parquet_column_count(metadata_head) == expected
+
+
+@pytest.mark.parametrize('metadata_head', [
+    # no version
+    bytes([0x19, 0x3C]),
+    # schema is not a list of structs
+    bytes([0x15, 0x02, 0x19, 0x35]),
+    # no root element
+    bytes([0x15, 0x02, 0x19, 0x0C]),
+    # truncated
+    bytes([0x15, 0x02, 0x19, 0xFC]),
+])
+def test_parse_parquet_column_count_rejects_unexpected_metadata(
+    metadata_head,
+):
+    with pytest.raises(ValueError):
+        columnar.parse_parquet_column_count(metadata_head)
+
+
+def test_parse_parquet_tail_rejects_other_files():
+    with pytest.raises(ValueError):
+        columnar.parse_parquet_tail(b'\x10\x00\x00\x00GZIP')
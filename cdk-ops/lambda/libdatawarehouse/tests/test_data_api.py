@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+"""Tests ``libdatawarehouse.data_api`` against a fake Redshift Data API
+client.
+"""
+
+import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+import pytest
+from libdatawarehouse import data_api
+
+
+COLUMN_METADATA = [
+    { 'name': 'id', 'typeName': 'int8' },
+    { 'name': 'ratio', 'typeName': 'float8' },
+    { 'name': 'path', 'typeName': 'varchar' },
+    { 'name': 'date', 'typeName': 'date' },
+    { 'name': 'datetime', 'typeName': 'timestamp' },
+]
+
+
+def make_record(
+    record_id: int,
+    ratio: Optional[float],
+    path: Optional[str],
+    date: str,
+    timestamp: str,
+) -> List[Dict]:
+    """Makes a record in ``GetStatementResult`` of ``COLUMN_METADATA``.
+    """
+    return [
+        { 'longValue': record_id },
+        { 'isNull': True } if ratio is None else { 'doubleValue': ratio },
+        { 'isNull': True } if path is None else { 'stringValue': path },
+        { 'stringValue': date },
+        { 'stringValue': timestamp },
+    ]
+
+
+PAGES = [
+    {
+        'ColumnMetadata': COLUMN_METADATA,
+        'Records': [
+            make_record(1, 0.5, '/', '2023-01-23', '2023-01-23 01:02:03'),
+            make_record(
+                2,
+                None,
+                '/blog/',
+                '2023-01-24',
+                '2023-01-24 04:05:06.789',
+            ),
+        ],
+        'TotalNumRows': 4,
+        'NextToken': 'token-1',
+    },
+    {
+        # later pages may omit the column metadata
+        'Records': [
+            make_record(3, 1.5, None, '2023-01-25', '2023-01-25 07:08:09'),
+        ],
+        'TotalNumRows': 4,
+        'NextToken': 'token-2',
+    },
+    {
+        'ColumnMetadata': [],
+        'Records': [
+            make_record(
+                4,
+                2.5,
+                '/about/',
+                '2023-01-26',
+                '2023-01-26 10:11:12',
+            ),
+        ],
+        'TotalNumRows': 4,
+    },
+]
+
+
+class FakeClient:
+    """Fake Redshift Data API client that returns ``PAGES``.
+    """
+
+    def __init__(self, pages: List[Dict]):
+        self.pages = pages
+        self.calls: List[Dict] = []
+
+
+    def get_statement_result(self, **kwargs) -> Dict:
+        """Returns the page that ``NextToken`` points to.
+        """
+        self.calls.append(kwargs)
+        next_token = kwargs.get('NextToken')
+        if next_token is None:
+            return self.pages[0]
+        for i, page in enumerate(self.pages):
+            if page.get('NextToken') == next_token:
+                return self.pages[i + 1]
+        raise ValueError(f'unknown next token: {next_token}')
+
+
+def test_iterate_result_pages_follows_next_tokens():
+    client = FakeClient(PAGES)
+    pages = list(data_api.iterate_result_pages(client, 'statement-1'))
+    assert pages == PAGES
+    assert client.calls == [
+        { 'Id': 'statement-1' },
+        { 'Id': 'statement-1', 'NextToken': 'token-1' },
+        { 'Id': 'statement-1', 'NextToken': 'token-2' },
+    ]
+
+
+def test_iterate_result_pages_fetches_pages_lazily():
+    client = FakeClient(PAGES)
+    pages = data_api.iterate_result_pages(client, 'statement-1')
+    next(pages)
+    assert len(client.calls) == 1
+
+
+def test_iterate_results_decodes_every_page():
+    client = FakeClient(PAGES)
+    records = list(data_api.iterate_results(client, 'statement-1'))
+    assert records == [
+        (
+            1,
+            0.5,
+            '/',
+            datetime.date(2023, 1, 23),
+            datetime.datetime(2023, 1, 23, 1, 2, 3),
+        ),
+        (
+            2,
+            None,
+            '/blog/',
+            datetime.date(2023, 1, 24),
+            datetime.datetime(2023, 1, 24, 4, 5, 6, 789000),
+        ),
+        (
+            3,
+            1.5,
+            None,
+            datetime.date(2023, 1, 25),
+            datetime.datetime(2023, 1, 25, 7, 8, 9),
+        ),
+        (
+            4,
+            2.5,
+            '/about/',
+            datetime.date(2023, 1, 26),
+            datetime.datetime(2023, 1, 26, 10, 11, 12),
+        ),
+    ]
+
+
+def test_iterate_result_batches_yields_a_batch_per_page():
+    client = FakeClient(PAGES)
+    batches = list(data_api.iterate_result_batches(client, 'statement-1'))
+    assert [len(batch) for batch in batches] == [2, 1, 1]
+
+
+@pytest.mark.parametrize('field, metadata, expected', [
+    ({ 'isNull': True }, { 'typeName': 'int8' }, None),
+    ({ 'isNull': True }, { 'typeName': 'date' }, None),
+    ({ 'longValue': 123 }, { 'typeName': 'int8' }, 123),
+    ({ 'doubleValue': 0.25 }, { 'typeName': 'float8' }, 0.25),
+    ({ 'booleanValue': True }, { 'typeName': 'bool' }, True),
+    ({ 'stringValue': 'abc' }, { 'typeName': 'varchar' }, 'abc'),
+    ({ 'stringValue': '1.50' }, { 'typeName': 'numeric' }, Decimal('1.50')),
+    (
+        { 'stringValue': '2023-01-23' },
+        { 'typeName': 'date' },
+        datetime.date(2023, 1, 23),
+    ),
+    (
+        { 'stringValue': '2023-01-23 01:02:03' },
+        { 'typeName': 'timestamp' },
+        datetime.datetime(2023, 1, 23, 1, 2, 3),
+    ),
+    (
+        { 'stringValue': '2023-01-23 01:02:03.5' },
+        { 'typeName': 'timestamp' },
+        datetime.datetime(2023, 1, 23, 1, 2, 3, 500000),
+    ),
+    (
+        # time zones are not parsed
+        { 'stringValue': '2023-01-23 01:02:03+09' },
+        { 'typeName': 'timestamptz' },
+        '2023-01-23 01:02:03+09',
+    ),
+])
+def test_decode_field(field, metadata, expected):
+    assert data_api.decode_field(field, metadata) == expected
+
+
+def test_iterate_column_batches_numpy():
+    np = pytest.importorskip('numpy')
+    client = FakeClient(PAGES)
+    batches = list(data_api.iterate_column_batches(
+        client,
+        'statement-1',
+        column_format='numpy',
+    ))
+    assert len(batches) == 3
+    first, second, _ = batches
+    assert list(first.keys()) == [c['name'] for c in COLUMN_METADATA]
+    assert first['id'].dtype == np.dtype('int64')
+    assert first['id'].tolist() == [1, 2]
+    # nulls are masked
+    assert first['ratio'].dtype == np.dtype('float64')
+    assert first['ratio'].mask.tolist() == [False, True]
+    assert first['ratio'].tolist() == [0.5, None]
+    assert first['date'].tolist() == [
+        datetime.date(2023, 1, 23),
+        datetime.date(2023, 1, 24),
+    ]
+    assert second['ratio'].dtype == np.dtype('float64')
+    assert second['path'].tolist() == [None]
+
+
+def test_iterate_column_batches_arrow():
+    pa = pytest.importorskip('pyarrow')
+    client = FakeClient(PAGES)
+    batches = list(data_api.iterate_column_batches(
+        client,
+        'statement-1',
+        column_format='arrow',
+    ))
+    assert [batch.num_rows for batch in batches] == [2, 1, 1]
+    first = batches[0]
+    assert first.schema.names == [c['name'] for c in COLUMN_METADATA]
+    assert first.column('id').type == pa.int64()
+    assert first.column('ratio').to_pylist() == [0.5, None]
+    assert first.column('date').type == pa.date32()
+    assert first.column('datetime').type == pa.timestamp('us')
+    assert batches[1].column('path').null_count == 1
+
+
+def test_iterate_column_batches_rejects_unknown_format():
+    client = FakeClient(PAGES)
+    with pytest.raises(ValueError):
+        next(data_api.iterate_column_batches(
+            client,
+            'statement-1',
+            column_format='csv',
+        ))
+    assert client.calls == []
+
+
+# pages whose first page has only NULLs in every column but the ID.
+NULL_FIRST_PAGES = [
+    {
+        'ColumnMetadata': COLUMN_METADATA,
+        'Records': [
+            [
+                { 'longValue': 1 },
+                { 'isNull': True },
+                { 'isNull': True },
+                { 'isNull': True },
+                { 'isNull': True },
+            ],
+        ],
+        'NextToken': 'token-1',
+    },
+    {
+        'Records': [
+            make_record(2, 0.5, '/', '2023-01-23', '2023-01-23 01:02:03'),
+        ],
+    },
+]
+
+
+def test_iterate_column_batches_numpy_types_from_metadata():
+    np = pytest.importorskip('numpy')
+    client = FakeClient(NULL_FIRST_PAGES)
+    first, second = data_api.iterate_column_batches(
+        client,
+        'statement-1',
+        column_format='numpy',
+    )
+    for name in first:
+        assert first[name].dtype == second[name].dtype
+    assert first['ratio'].dtype == np.dtype('float64')
+    assert first['ratio'].mask.tolist() == [True]
+    assert first['path'].dtype == np.dtype('object')
+    assert first['path'].tolist() == [None]
+
+
+def test_iterate_column_batches_arrow_types_from_metadata():
+    pa = pytest.importorskip('pyarrow')
+    client = FakeClient(NULL_FIRST_PAGES)
+    batches = list(data_api.iterate_column_batches(
+        client,
+        'statement-1',
+        column_format='arrow',
+    ))
+    assert batches[0].schema == batches[1].schema
+    assert batches[0].schema.field('ratio').type == pa.float64()
+    assert batches[0].schema.field('path').type == pa.string()
+    table = pa.Table.from_batches(batches)
+    assert table.column('ratio').to_pylist() == [None, 0.5]
+    assert table.column('date').to_pylist() == [
+        None,
+        datetime.date(2023, 1, 23),
+    ]
+
+
+def test_get_arrow_type_of_decimals():
+    pa = pytest.importorskip('pyarrow')
+    assert data_api.get_arrow_type(
+        pa,
+        { 'typeName': 'numeric', 'precision': 10, 'scale': 2 },
+    ) == pa.decimal128(10, 2)
+    # unconstrained precision
+    assert data_api.get_arrow_type(
+        pa,
+        { 'typeName': 'numeric', 'precision': 0, 'scale': 0 },
+    ) == pa.decimal128(38, 0)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""Tests ``libdatawarehouse.plans`` with recorded outputs of ``EXPLAIN``.
+
+``data/plans`` has outputs of ``EXPLAIN`` over statements of
+``load-access-logs`` and the plans recorded from them in ``recorded.json``.
+Files with a suffix like ``-broadcast`` are outputs of the same statements
+that have regressed.
+"""
+
+import os
+from typing import Dict
+from libdatawarehouse import plans
+
+
+PLANS_DIR = os.path.join(os.path.dirname(__file__), 'data', 'plans')
+
+ENCODED_LABEL = 'encoded: CREATE TABLE access_log_encoded_{run_id}'
+
+LOADED_LABEL = 'loaded: INSERT INTO access_log_template'
+
+# maps labels to the files of the outputs of EXPLAIN recorded in
+# ``recorded.json``.
+RECORDED_FILES = {
+    ENCODED_LABEL: 'encoded-create-table.txt',
+    LOADED_LABEL: 'loaded-insert-into-access-log-template.txt',
+}
+
+# maps labels to the files of the outputs of EXPLAIN that have regressed.
+REGRESSED_FILES = {
+    ENCODED_LABEL: 'encoded-create-table-broadcast.txt',
+    LOADED_LABEL: 'loaded-insert-into-access-log-template-nested-loop.txt',
+}
+
+
+def read_explain_lines(filename: str):
+    """Reads the lines of a given output of ``EXPLAIN``.
+    """
+    with open(os.path.join(PLANS_DIR, filename), encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def parse_files(files: Dict[str, str]) -> Dict[str, plans.Plan]:
+    """Parses given outputs of ``EXPLAIN`` keyed by labels.
+    """
+    return {
+        label: plans.parse_plan(label, read_explain_lines(filename))
+            for label, filename in files.items()
+    }
+
+
+def read_recorded_plans() -> Dict[str, plans.Plan]:
+    """Reads ``recorded.json``.
+    """
+    path = os.path.join(PLANS_DIR, 'recorded.json')
+    with open(path, encoding='utf-8') as f:
+        return plans.load_plans(f.read())
+
+
+def test_parse_plan_normalizes_explain_output():
+    plan = plans.parse_plan(
+        LOADED_LABEL,
+        read_explain_lines('loaded-insert-into-access-log-template.txt'),
+    )
+    assert plan.cost == 2525.06
+    assert plan.join_strategies == { 'DS_DIST_INNER': 1 }
+    assert plan.lines[0] == 'XN Hash Anti Join DS_DIST_INNER'
+    assert '  ->  XN Seq Scan on access_log_encoded_{run_id}' in plan.lines
+    assert "        Filter: (datetime >= '?'::timestamp without time zone)" \
+        in plan.lines
+    # hints about missing statistics are dropped
+    assert all(not line.startswith('-----') for line in plan.lines)
+
+
+def test_parse_plan_counts_flagged_joins():
+    plan = plans.parse_plan(
+        ENCODED_LABEL,
+        read_explain_lines('encoded-create-table-broadcast.txt'),
+    )
+    assert plan.join_strategies == {
+        'DS_DIST_ALL_NONE': 2,
+        'DS_BCAST_INNER': 1,
+    }
+
+
+def test_recorded_plans_match_explain_outputs():
+    # plans of different runs and dates are normalized into the same plans
+    assert read_recorded_plans() == parse_files(RECORDED_FILES)
+
+
+def test_dump_plans_round_trip():
+    recorded_plans = read_recorded_plans()
+    assert plans.load_plans(plans.dump_plans(recorded_plans)) == \
+        recorded_plans
+
+
+def test_compare_plans_accepts_same_plans():
+    assert plans.compare_plans(
+        read_recorded_plans(),
+        parse_files(RECORDED_FILES),
+    ) == []
+
+
+def test_compare_plans_flags_regressions():
+    regressions = plans.compare_plans(
+        read_recorded_plans(),
+        parse_files(REGRESSED_FILES),
+    )
+    assert regressions == [
+        f'{ENCODED_LABEL}: DS_BCAST_INNER joins increased from 0 to 1',
+        f'{ENCODED_LABEL}: cost grew from 1460.31 to 240001460.31',
+        f'{LOADED_LABEL}: DS_BCAST_INNER joins increased from 0 to 1',
+        f'{LOADED_LABEL}: Nested Loop joins increased from 0 to 1',
+        f'{LOADED_LABEL}: cost grew from 2525.06 to 480002525.06',
+    ]
+
+
+def test_compare_plans_ignores_statements_without_recorded_plans():
+    current_plans = parse_files(REGRESSED_FILES)
+    assert plans.compare_plans({}, current_plans) == []
+
+
+def test_compare_plans_cost_threshold():
+    recorded_plans = read_recorded_plans()
+    current = recorded_plans[LOADED_LABEL]._replace(cost=4000.0)
+    current_plans = { LOADED_LABEL: current }
+    assert plans.compare_plans(recorded_plans, current_plans) == []
+    assert plans.compare_plans(
+        recorded_plans,
+        current_plans,
+        cost_threshold=0.5,
+    ) == [f'{LOADED_LABEL}: cost grew from 2525.06 to 4000.00']
+
+
+def test_label_statements_numbers_duplicates():
+    labels = plans.label_statements('loaded', [
+        'INSERT INTO access_log_template  SELECT 1',
+        'INSERT INTO access_log_template  SELECT 2',
+        'DELETE FROM page_daily  WHERE TRUE',
+    ])
+    assert labels == [
+        LOADED_LABEL,
+        f'{LOADED_LABEL} #2',
+        'loaded: DELETE FROM page_daily',
+    ]
@@ -6,178 +6,1310 @@ You have to specify the following environment variables,
 * ``SOURCE_BUCKET_NAME``: name of the S3 bucket containing access logs to be
   loaded.
 * ``SOURCE_OBJECT_KEY_PREFIX``: prefix of the S3 object keys to be loaded.
+* ``MANIFEST_KEY_PREFIX``: prefix of the S3 object keys of COPY manifests.
+  Manifests are saved in the bucket specified by ``SOURCE_BUCKET_NAME``.
+* ``LATE_ARRIVAL_DAYS``: number of days to look back for access logs that
+  arrive late.
 * ``REDSHIFT_WORKGROUP_NAME``: name of the Redshift Serverless workgroup.
 * ``COPY_ROLE_ARN``: ARN of the IAM role to COPY data from the S3 object.
+* ``VACUUM_WORKFLOW_ARN``: ARN of the Step Functions state machine that runs
+  VACUUM over the tables.
+* ``QUERY_CACHE_BUCKET_NAME``: name of the S3 bucket of the query cache,
+  which has the data version token bumped after every load.
+* ``PROFILE_BUCKET_NAME``: name of the S3 bucket where profiles of
+  invocations are saved.
+* ``PROFILE_KEY_PREFIX``: prefix of the S3 object keys of profiles.
+* ``PROFILE_SAMPLE_RATE``: fraction of invocations to be profiled. ``0``
+  profiles only invocations whose event has ``"profile": true``.
+* ``RETENTION_MONTHS``: number of months of access logs to retain, including
+  the current month. A daily run drops the monthly access log tables of
+  older months, and deletes the rows of those months from the rollup,
+  sample, and sketch tables. ``0`` retains all the access logs.
+* ``DIMENSION_SNAPSHOT_KEY``: key of the S3 object of the snapshot of the
+  dimension tables in the bucket specified by ``SOURCE_BUCKET_NAME``. An
+  empty string disables the snapshot.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import itertools
 import json
 import logging
 import os
-import boto3
-from libdatawarehouse import ACCESS_LOGS_DATABASE_NAME, data_api, tables
+import re
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+import uuid
+from botocore.exceptions import ClientError
+from libdatawarehouse import (
+    ACCESS_LOGS_DATABASE_NAME,
+    approximate,
+    cache,
+    clients,
+    columnar,
+    data_api,
+    dimensions,
+    partitions,
+    plans,
+    profiling,
+    rollups,
+    tables,
+)
 from libdatawarehouse.exceptions import DataWarehouseException
 
 
 SOURCE_BUCKET_NAME = os.environ['SOURCE_BUCKET_NAME']
 SOURCE_KEY_PREFIX = os.environ['SOURCE_KEY_PREFIX']
+MANIFEST_KEY_PREFIX = os.environ['MANIFEST_KEY_PREFIX']
+LATE_ARRIVAL_DAYS = int(os.environ['LATE_ARRIVAL_DAYS'])
 REDSHIFT_WORKGROUP_NAME = os.environ['REDSHIFT_WORKGROUP_NAME']
 COPY_ROLE_ARN = os.environ['COPY_ROLE_ARN']
 VACUUM_WORKFLOW_ARN = os.environ['VACUUM_WORKFLOW_ARN']
+QUERY_CACHE_BUCKET_NAME = os.environ['QUERY_CACHE_BUCKET_NAME']
+PROFILE_BUCKET_NAME = os.environ['PROFILE_BUCKET_NAME']
+PROFILE_KEY_PREFIX = os.environ['PROFILE_KEY_PREFIX']
+PROFILE_SAMPLE_RATE = float(os.environ['PROFILE_SAMPLE_RATE'])
+RETENTION_MONTHS = int(os.environ['RETENTION_MONTHS'])
+DIMENSION_SNAPSHOT_KEY = os.environ['DIMENSION_SNAPSHOT_KEY']
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
-s3 = boto3.client('s3')
+s3 = clients.LazyClient('s3')
 
-redshift = boto3.client('redshift-serverless')
-redshift_data = boto3.client('redshift-data')
-stepfunctions = boto3.client('stepfunctions')
+redshift = clients.LazyClient('redshift-serverless')
+redshift_data = clients.LazyClient('redshift-data')
+stepfunctions = clients.LazyClient('stepfunctions')
 
+# default number of Data API batches running concurrently.
+DEFAULT_MAX_CONCURRENCY = 2
 
-def has_access_logs(date: datetime.datetime) -> bool:
-    """Returns whether there are access logs on a given date.
+# maximum number of S3 objects loaded in a single Data API batch.
+# keeps the statement recording loaded objects well below the Data API limit
+# of 100 KB per statement.
+MAX_OBJECTS_PER_LOAD = 500
+
+# suffix of the S3 object key of a COPY manifest.
+MANIFEST_SUFFIX = '.manifest'
+
+# Lambda remaining time in seconds necessary to start another stage of a load.
+# a stage may take up to the timeout of `data_api.wait_for_results`.
+MIN_REMAINING_TIME_TO_LOAD = 300.0
+
+# names of the temporary tables to aggregate dimensions.
+DIMENSION_STAGE_TABLE_NAMES = [
+    '#referer_stage',
+    '#page_stage',
+    '#edge_location_stage',
+    '#user_agent_stage',
+    '#result_type_stage',
+]
+
+# stages of a run of loading access logs.
+COPIED_STAGE = 'copied'
+UPSERTED_STAGE = 'upserted'
+ENCODED_STAGE = 'encoded'
+LOADED_STAGE = 'loaded'
+LOAD_STAGES = [COPIED_STAGE, UPSERTED_STAGE, ENCODED_STAGE, LOADED_STAGE]
+
+# pseudo stage of a run that has been given up.
+ABANDONED_STAGE = 'abandoned'
+
+# SQL statement that changes rows of a table; the group is the table name.
+DML_STATEMENT_PATTERN = re.compile(
+    r'^(?:INSERT INTO|DELETE FROM|UPDATE)\s+(\w+)',
+)
+
+# SQL statement that inserts into a monthly access log table.
+MONTHLY_INSERT_PATTERN = re.compile(
+    rf'^INSERT INTO {tables.MONTHLY_ACCESS_LOG_TABLE_PREFIX}[0-9]{{6}}\b',
+)
+
+
+def list_access_log_objects(
+    start_date: datetime.datetime,
+    end_date: datetime.datetime,
+) -> List[Dict]:
+    """Lists S3 objects of access logs on dates in a given range.
+
+    Lists objects of every CloudFront distribution, and objects written
+    before distributions were introduced.
+    Lists objects in each month with a paginated listing instead of listing
+    every date.
+
+    :param datetime.datetime start_date: first date in the range.
+
+    :param datetime.datetime end_date: last date in the range (inclusive).
+
+    :returns: S3 objects in the form of ``Contents`` items of the
+    ``ListObjectsV2`` results.
+    """
+    objects = []
+    paginator = s3.get_paginator('list_objects_v2')
+    distribution_prefixes = [''] + [
+        f'{distribution_id}/' for distribution_id in list_distribution_ids()
+    ]
+    for distribution_prefix, (year, month) in itertools.product(
+        distribution_prefixes,
+        iterate_months(start_date, end_date),
+    ):
+        pages = paginator.paginate(
+            Bucket=SOURCE_BUCKET_NAME,
+            Prefix=''.join([
+                SOURCE_KEY_PREFIX,
+                distribution_prefix,
+                f'{year:04d}/{month:02d}/',
+            ]),
+        )
+        for page in pages:
+            for obj in page.get('Contents', []):
+                date = get_date_of_key(obj['Key'])
+                if date is None:
+                    LOGGER.warning('ignoring invalid key: %s', obj['Key'])
+                elif start_date.date() <= date <= end_date.date():
+                    objects.append(obj)
+    return objects
+
+
+def list_distribution_ids() -> List[str]:
+    """Lists the IDs of CloudFront distributions that have access logs.
+    """
+    distribution_ids = []
+    paginator = s3.get_paginator('list_objects_v2')
+    pages = paginator.paginate(
+        Bucket=SOURCE_BUCKET_NAME,
+        Prefix=SOURCE_KEY_PREFIX,
+        Delimiter='/',
+    )
+    for page in pages:
+        for common_prefix in page.get('CommonPrefixes', []):
+            segment = common_prefix['Prefix'][len(SOURCE_KEY_PREFIX):-1]
+            # years of access logs written before distributions were
+            # introduced are also listed
+            if partitions.is_distribution_id(segment):
+                distribution_ids.append(segment)
+    return distribution_ids
+
+
+def iterate_months(
+    start_date: datetime.datetime,
+    end_date: datetime.datetime,
+) -> Iterable[Tuple[int, int]]:
+    """Iterates over (year, month) pairs in a given range.
+    """
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        yield year, month
+        if month == 12:
+            year, month = year + 1, 1
+        else:
+            month += 1
+
+
+def get_date_of_key(key: str) -> Optional[datetime.date]:
+    """Returns the date of a given S3 object key of access logs.
+
+    :returns: ``None`` if ``key`` is invalid.
+    """
+    partition = get_partition_of_key(key)
+    if partition is None:
+        return None
+    return partition.date
+
+
+def get_partition_of_key(key: str) -> Optional[partitions.Partition]:
+    """Returns the partition of a given S3 object key of access logs.
+
+    ``key`` must be like
+    ``{SOURCE_KEY_PREFIX}{distribution_id}/{year}/{month}/{day}/{name}``;
+    please refer to ``libdatawarehouse.partitions`` for other layouts.
+
+    :returns: ``None`` if ``key`` is invalid.
+    """
+    if not key.startswith(SOURCE_KEY_PREFIX):
+        return None
+    partitioned_key = partitions.parse_partitioned_key(
+        key[len(SOURCE_KEY_PREFIX):],
+    )
+    if partitioned_key is None:
+        return None
+    return partitioned_key.partition
+
+
+def get_distribution_id_of_objects(objects: Sequence[Dict]) -> Optional[str]:
+    """Returns the ID of the CloudFront distribution of given S3 objects of
+    access logs.
+
+    ``objects`` must belong to a single distribution.
+
+    :returns: ``None`` if ``objects`` were written before distributions were
+    introduced.
+    """
+    if len(objects) == 0:
+        return None
+    return get_partition_of_key(objects[0]['Key']).distribution_id
+
+
+def execute_statement(sql: str) -> str:
+    """Runs a given SQL statement and waits for it to finish.
+
+    :returns: ID of the statement.
+    """
+    res = redshift_data.execute_statement(
+        WorkgroupName=REDSHIFT_WORKGROUP_NAME,
+        Database=ACCESS_LOGS_DATABASE_NAME,
+        Sql=sql,
+    )
+    statement_id = res['Id']
+    status, res = data_api.wait_for_results(redshift_data, statement_id)
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            LOGGER.error('failed to run statement: %s', str(res))
+        raise DataWarehouseException(
+            f'failed to run statement: {status or "timeout"}',
+        )
+    return statement_id
+
+
+def execute_batch(sqls: Sequence[str]) -> Dict:
+    """Runs given SQL statements in a single transaction and waits for them
+    to finish.
+
+    :returns: ``DescribeStatement`` response of the batch.
+    """
+    res = redshift_data.batch_execute_statement(
+        WorkgroupName=REDSHIFT_WORKGROUP_NAME,
+        Database=ACCESS_LOGS_DATABASE_NAME,
+        Sqls=sqls,
+    )
+    status, res = data_api.wait_for_results(redshift_data, res['Id'])
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            LOGGER.error('failed to run statements: %s', str(res))
+        raise DataWarehouseException(
+            f'failed to run statements: {status or "timeout"}',
+        )
+    return res
+
+
+def execute_query(sql: str) -> Iterator[Tuple]:
+    """Runs a given query and iterates over the records in the results.
+
+    :returns: iterator of records decoded by ``data_api.decode_field``.
+    Pages of the results are fetched as the iterator proceeds.
+    """
+    statement_id = execute_statement(sql)
+    return data_api.iterate_results(redshift_data, statement_id)
+
+
+def list_loaded_keys(
+    start_date: datetime.datetime,
+    end_date: datetime.datetime,
+) -> Set[str]:
+    """Lists S3 object keys of access logs that have already been loaded on
+    dates in a given range.
+
+    :param datetime.datetime start_date: first date in the range.
+
+    :param datetime.datetime end_date: last date in the range (inclusive).
+    """
+    records = execute_query(''.join([
+        f'SELECT object_key FROM {tables.LOADED_OBJECT_TABLE_NAME}',
+        f"  WHERE date BETWEEN '{format_date(start_date)}'",
+        f"    AND '{format_date(end_date)}'",
+    ]))
+    return set(record[0] for record in records)
+
+
+def list_loaded_dates(
+    start_date: datetime.datetime,
+    end_date: datetime.datetime,
+) -> Set[datetime.date]:
+    """Lists dates on which access logs have already been loaded in a given
+    range.
+
+    :param datetime.datetime start_date: first date in the range.
+
+    :param datetime.datetime end_date: last date in the range (inclusive).
+    """
+    next_date = end_date + datetime.timedelta(days=1)
+    records = execute_query(''.join([
+        'SELECT DISTINCT TRUNC("datetime")',
+        f'  FROM {tables.ACCESS_LOG_TABLE_NAME}',
+        f"  WHERE \"datetime\" >= '{format_date(start_date)}'",
+        f"    AND \"datetime\" < '{format_date(next_date)}'",
+    ]))
+    return set(record[0] for record in records)
+
+
+def list_new_access_log_objects(
+    start_date: datetime.datetime,
+    end_date: datetime.datetime,
+) -> List[Dict]:
+    """Lists S3 objects of access logs on dates in a given range that have not
+    been loaded yet.
+
+    Dates that have access logs loaded before loaded objects were recorded are
+    regarded as completely loaded, and their objects are not listed.
+
+    :param datetime.datetime start_date: first date in the range.
+
+    :param datetime.datetime end_date: last date in the range (inclusive).
+    """
+    objects = list_access_log_objects(start_date, end_date)
+    loaded_keys = list_loaded_keys(start_date, end_date)
+    tracked_dates = set(get_date_of_key(key) for key in loaded_keys)
+    untracked_dates = set(
+        get_date_of_key(obj['Key']) for obj in objects
+    ) - tracked_dates
+    legacy_dates = set()
+    if len(untracked_dates) > 0:
+        legacy_dates = untracked_dates & list_loaded_dates(
+            start_date,
+            end_date,
+        )
+        for date in sorted(legacy_dates):
+            LOGGER.warning(
+                'skipping %s loaded before loaded objects were recorded',
+                date,
+            )
+    return [
+        obj for obj in objects
+            if obj['Key'] not in loaded_keys
+                and get_date_of_key(obj['Key']) not in legacy_dates
+    ]
+
+
+def is_parquet_object(obj: Dict) -> bool:
+    """Returns whether a given S3 object is a Parquet file.
     """
-    access_logs_prefix = get_access_logs_prefix(date)
-    res = s3.list_objects_v2(
+    return obj['Key'].endswith(columnar.PARQUET_SUFFIX)
+
+
+def get_parquet_manifest_key(
+    manifest_key: str,
+    column_count: Optional[int] = None,
+) -> str:
+    """Returns the S3 object key of the COPY manifest of Parquet files with
+    a given number of columns accompanying a given COPY manifest.
+
+    :param Optional[int] column_count: number of columns in the Parquet
+    files. ``None`` for the manifest of Parquet files of any number of
+    columns, which runs started before Parquet files were split by the
+    number of columns have saved.
+    """
+    if column_count is None:
+        base_key = manifest_key[:-len(MANIFEST_SUFFIX)]
+        return f'{base_key}.parquet{MANIFEST_SUFFIX}'
+    prefix = get_parquet_manifest_key_prefix(manifest_key)
+    return f'{prefix}{column_count}{MANIFEST_SUFFIX}'
+
+
+def get_parquet_manifest_key_prefix(manifest_key: str) -> str:
+    """Returns the common prefix of the S3 object keys of the COPY manifests
+    of Parquet files by the number of columns accompanying a given COPY
+    manifest.
+    """
+    return f'{manifest_key[:-len(MANIFEST_SUFFIX)]}.parquet-'
+
+
+def get_parquet_column_count(obj: Dict) -> int:
+    """Reads the number of columns in a given Parquet file.
+
+    Reads only the footer of the file with two ranged requests.
+
+    :raises DataWarehouseException: if the file is not a Parquet file, or
+    has more columns than ``tables.RAW_ACCESS_LOG_TABLE``.
+    """
+    size = obj['Size']
+    start = size - columnar.PARQUET_TAIL_SIZE
+    try:
+        metadata_length = columnar.parse_parquet_tail(
+            read_object_range(obj['Key'], start, size),
+        )
+        start -= metadata_length
+        column_count = columnar.parse_parquet_column_count(
+            read_object_range(
+                obj['Key'],
+                start,
+                start + columnar.PARQUET_METADATA_HEAD_SIZE,
+            ),
+        )
+    except ValueError as exc:
+        raise DataWarehouseException(
+            f'failed to read Parquet file {obj["Key"]}: {exc}',
+        ) from exc
+    if column_count > len(tables.RAW_ACCESS_LOG_TABLE.columns):
+        raise DataWarehouseException(
+            f'Parquet file {obj["Key"]} has too many columns: {column_count}',
+        )
+    return column_count
+
+
+def read_object_range(key: str, start: int, end: int) -> bytes:
+    """Reads a given range of an S3 object in the source bucket.
+
+    :param int end: exclusive end of the range.
+    """
+    res = s3.get_object(
         Bucket=SOURCE_BUCKET_NAME,
-        Prefix=access_logs_prefix,
-        MaxKeys=1,
+        Key=key,
+        Range=f'bytes={start}-{end - 1}',
     )
-    return len(res.get('Contents', [])) > 0
+    return res['Body'].read()
+
 
+def add_parquet_column_counts(objects: Sequence[Dict]) -> List[Dict]:
+    """Adds the number of columns as ``ColumnCount`` to Parquet files in
+    given S3 objects.
+
+    Parquet files masked before dimension IDs were pre-encoded lack the
+    columns of the IDs, and COPY of Parquet files requires the columns to
+    match, so Parquet files are loaded separately by the number of columns.
+    Objects that already have ``ColumnCount`` are not read again.
+    """
+    return [
+        {
+            **obj,
+            'ColumnCount': get_parquet_column_count(obj),
+        } if is_parquet_object(obj) and 'ColumnCount' not in obj else obj
+            for obj in objects
+    ]
 
-def execute_load_script(date: datetime.datetime):
+
+def get_parquet_column_counts(objects: Sequence[Dict]) -> List[int]:
+    """Returns the distinct numbers of columns in Parquet files in given S3
+    objects given by ``add_parquet_column_counts``.
+    """
+    return sorted(set(
+        obj['ColumnCount'] for obj in objects if is_parquet_object(obj)
+    ))
+
+
+def save_copy_manifest(run_id: str, objects: Sequence[Dict]) -> str:
+    """Saves COPY manifests of given S3 objects for a given run.
+
+    Gzipped TSV files are listed in the manifest of the returned key, and
+    Parquet files in the manifests of ``get_parquet_manifest_key`` by the
+    number of columns, which are saved only if there are any Parquet files.
+    The manifests are also used to resume the run.
+
+    :param Sequence[Dict] objects: S3 objects given by
+    ``add_parquet_column_counts``.
+
+    :returns: S3 object key of the saved manifest.
+    """
+    manifest_key = f'{MANIFEST_KEY_PREFIX}{run_id}{MANIFEST_SUFFIX}'
+    put_copy_manifest(
+        manifest_key,
+        [obj for obj in objects if not is_parquet_object(obj)],
+    )
+    for column_count in get_parquet_column_counts(objects):
+        put_copy_manifest(
+            get_parquet_manifest_key(manifest_key, column_count),
+            [
+                obj for obj in objects
+                    if is_parquet_object(obj)
+                        and obj['ColumnCount'] == column_count
+            ],
+        )
+    return manifest_key
+
+
+def put_copy_manifest(manifest_key: str, objects: Sequence[Dict]):
+    """Saves a COPY manifest of given S3 objects.
+    """
+    manifest = {
+        'entries': [
+            {
+                'url': f's3://{SOURCE_BUCKET_NAME}/{obj["Key"]}',
+                'mandatory': True,
+                'meta': {
+                    'content_length': obj['Size'],
+                },
+            } for obj in objects
+        ],
+    }
+    s3.put_object(
+        Bucket=SOURCE_BUCKET_NAME,
+        Key=manifest_key,
+        Body=json.dumps(manifest).encode('utf-8'),
+        ContentType='application/json',
+    )
+
+
+def read_copy_manifest(manifest_key: str) -> Optional[List[Dict]]:
+    """Reads S3 objects listed in a given COPY manifest and the accompanying
+    manifests of Parquet files.
+
+    :returns: S3 objects each of which has ``Key`` and ``Size``, and
+    ``ColumnCount`` if it is a Parquet file. ``None`` if the manifest no
+    longer exists.
+    """
+    objects = get_copy_manifest(manifest_key)
+    if objects is None:
+        return None
+    prefix = get_parquet_manifest_key_prefix(manifest_key)
+    paginator = s3.get_paginator('list_objects_v2')
+    pages = paginator.paginate(Bucket=SOURCE_BUCKET_NAME, Prefix=prefix)
+    for page in pages:
+        for obj in page.get('Contents', []):
+            column_count = int(obj['Key'][len(prefix):-len(MANIFEST_SUFFIX)])
+            objects.extend(
+                {
+                    **parquet_obj,
+                    'ColumnCount': column_count,
+                } for parquet_obj in get_copy_manifest(obj['Key']) or []
+            )
+    # runs started before Parquet files were split by the number of columns
+    legacy_objects = get_copy_manifest(get_parquet_manifest_key(manifest_key))
+    if legacy_objects is not None:
+        # the stage script needs the numbers of columns, and the manifests
+        # by the number of columns
+        objects.extend(add_parquet_column_counts(legacy_objects))
+    return objects
+
+
+def get_copy_manifest(manifest_key: str) -> Optional[List[Dict]]:
+    """Reads S3 objects listed in a given COPY manifest.
+
+    :returns: ``None`` if the manifest does not exist.
+    """
+    try:
+        res = s3.get_object(Bucket=SOURCE_BUCKET_NAME, Key=manifest_key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    manifest = json.loads(res['Body'].read().decode('utf-8'))
+    bucket_url = f's3://{SOURCE_BUCKET_NAME}/'
+    return [
+        {
+            'Key': entry['url'][len(bucket_url):],
+            'Size': entry['meta']['content_length'],
+        } for entry in manifest['entries']
+    ]
+
+
+def load_access_log_objects(
+    objects: Sequence[Dict],
+    max_concurrency: int,
+    get_remaining_time: Callable[[], float],
+) -> Dict[str, Any]:
+    """Loads given S3 objects of access logs.
+
+    Splits ``objects`` into batches of at most ``MAX_OBJECTS_PER_LOAD``
+    objects of a single CloudFront distribution, and loads up to
+    ``max_concurrency`` batches at once.
+    Batches overlap except while they update the dimension tables or insert
+    into the access log table; please refer to ``continue_load_run``.
+    Objects are sorted by key so that each batch covers consecutive time
+    buckets and refreshes as few days of the rollup tables as possible.
+    Gives up batches that cannot start before the Lambda function times out.
+
+    :param Callable[[], float] get_remaining_time: returns the remaining time
+    of the Lambda function in seconds.
+
+    :returns: ``dict`` of the numbers of objects, ``loaded``, ``failed``, and
+    ``pending`` (not started or finished in time), the total time in
+    milliseconds spent on loading, ``durationMs``, and the numbers of rows
+    inserted, deleted, or updated per table, ``changedRows``.
+    """
+    distribution_objects: Dict[Optional[str], List[Dict]] = {}
+    for obj in sorted(objects, key=lambda obj: obj['Key']):
+        distribution_id = get_partition_of_key(obj['Key']).distribution_id
+        distribution_objects.setdefault(distribution_id, []).append(obj)
+    batches = [
+        objs[i:i + MAX_OBJECTS_PER_LOAD]
+            for objs in distribution_objects.values()
+                for i in range(0, len(objs), MAX_OBJECTS_PER_LOAD)
+    ]
+
+    def load_batch(
+        batch: Sequence[Dict],
+    ) -> Tuple[Optional[float], Dict[str, int]]:
+        changed_rows: Dict[str, int] = {}
+        try:
+            outcome = execute_load_script(
+                batch,
+                get_remaining_time,
+                changed_rows,
+            )
+        except DataWarehouseException as exc:
+            LOGGER.error('failed to load access logs: %s', exc)
+            outcome = -1.0
+        return outcome, changed_rows
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        outcomes = list(executor.map(load_batch, batches))
+    results = get_empty_load_results()
+    for batch, (outcome, changed_rows) in zip(batches, outcomes):
+        add_load_outcome(results, len(batch), outcome)
+        add_changed_rows(results['changedRows'], changed_rows)
+    return results
+
+
+def get_empty_load_results() -> Dict[str, Any]:
+    """Returns load metrics of no runs.
+    """
+    return {
+        'loaded': 0,
+        'failed': 0,
+        'pending': 0,
+        'durationMs': 0.0,
+        'changedRows': {},
+    }
+
+
+def merge_load_results(results: Dict[str, Any], other: Dict[str, Any]):
+    """Adds given load metrics to other load metrics.
+    """
+    for key, value in other.items():
+        if key == 'changedRows':
+            add_changed_rows(results[key], value)
+        else:
+            results[key] += value
+
+
+def add_changed_rows(changed_rows: Dict[str, int], other: Dict[str, int]):
+    """Adds given numbers of changed rows per table to other numbers.
+    """
+    for table_name, num_rows in other.items():
+        changed_rows[table_name] = changed_rows.get(table_name, 0) + num_rows
+
+
+def add_load_outcome(
+    results: Dict[str, Any],
+    num_objects: int,
+    outcome: Optional[float],
+):
+    """Adds the outcome of a run to given load metrics.
+
+    :param Optional[float] outcome: time in milliseconds spent on the run.
+    ``None`` if the run has not finished in time. Negative if the run has
+    failed.
+    """
+    if outcome is None:
+        results['pending'] += num_objects
+    elif outcome >= 0.0:
+        results['loaded'] += num_objects
+        results['durationMs'] += outcome
+    else:
+        results['failed'] += num_objects
+
+
+def execute_load_script(
+    objects: Sequence[Dict],
+    get_remaining_time: Callable[[], float],
+    changed_rows: Dict[str, int],
+) -> Optional[float]:
     """Executes the script to load CloudFront access logs.
 
-    :param datetime.datetime date: date on which CloudFront access logs are to
-    be loaded.
+    Starts a new run that loads ``objects``; please refer to
+    ``continue_load_run`` for how a run proceeds.
+
+    :param Sequence[Dict] objects: S3 objects of access logs to be loaded.
+
+    :param Callable[[], float] get_remaining_time: returns the remaining time
+    of the Lambda function in seconds.
+
+    :returns: time in milliseconds spent on loading. ``None`` if the run
+    could not finish before the Lambda function times out.
+    """
+    run_id = uuid.uuid4().hex
+    objects = add_parquet_column_counts(objects)
+    manifest_key = save_copy_manifest(run_id, objects)
+    LOGGER.debug(
+        'loading %d objects in run %s with manifest: %s',
+        len(objects),
+        run_id,
+        manifest_key,
+    )
+    return continue_load_run(
+        run_id,
+        manifest_key,
+        objects,
+        None,
+        get_remaining_time,
+        changed_rows,
+    )
+
+
+def continue_load_run(
+    run_id: str,
+    manifest_key: str,
+    objects: Sequence[Dict],
+    last_stage: Optional[str],
+    get_remaining_time: Callable[[], float],
+    changed_rows: Dict[str, int],
+) -> Optional[float]:
+    """Runs the stages of a given run following the last finished stage.
+
+    A run consists of the following stages, each of which is a single
+    transaction that records its end in the checkpoint table,
+    1. ``copied``: COPYs access logs into a staging table of the run, and
+       records ``objects`` in another table of the run.
+    2. ``upserted``: adds new values of the staged access logs to the
+       dimension tables.
+    3. ``encoded``: encodes the foreign keys of the staged access logs into
+       another staging table of the run.
+    4. ``loaded``: inserts the encoded access logs into the access log table
+       and samples them into the sample table, records the loaded objects,
+       and refreshes the daily rollup tables and the sketch table.
+    Staging tables are not temporary so that they outlive the session of a
+    stage.
+    ``copied`` writes only tables of the run and the checkpoint table, so it
+    never waits for other runs.
+    Concurrent runs overlap except for the following stages,
+    * ``upserted`` locks the dimension tables, which blocks ``upserted`` and
+      ``encoded`` of other runs until it finishes.
+    * ``loaded`` locks the loaded object table, so ``loaded`` of runs
+      proceed one after another. Otherwise, a run might refresh the rollups
+      of a day without the access logs that another run is inserting.
+    The last stage inserts nothing if any of ``objects`` has already been
+    loaded by another run, so rerunning a load never duplicates access logs.
+
+    Stops before a stage that cannot start before the Lambda function times
+    out. A later invocation will resume the run.
+
+    Bumps the data version token of the query cache after the last stage so
+    that cached query results are no longer used.
+
+    :param Optional[str] last_stage: last stage that the run has finished.
+    ``None`` if the run has not started.
+
+    :param Dict[str, int] changed_rows: numbers of rows changed per table,
+    to which the rows changed by the stages are added.
+
+    :returns: time in milliseconds spent on the stages. ``None`` if the run
+    could not finish in time.
+    """
+    if last_stage is None:
+        next_stage_index = 0
+    else:
+        next_stage_index = LOAD_STAGES.index(last_stage) + 1
+    duration = 0.0
+    for stage in LOAD_STAGES[next_stage_index:]:
+        if get_remaining_time() < MIN_REMAINING_TIME_TO_LOAD:
+            LOGGER.debug('deferring stage %s of run %s', stage, run_id)
+            return None
+        script = get_stage_script(stage, run_id, manifest_key, objects)
+        duration += execute_stage_script(run_id, stage, script, changed_rows)
+    data_version = cache.bump_data_version(s3, QUERY_CACHE_BUCKET_NAME)
+    LOGGER.debug('bumped data version: %s', data_version)
+    return duration
+
+
+def get_stage_script(
+    stage: str,
+    run_id: str,
+    manifest_key: str,
+    objects: Sequence[Dict],
+) -> List[str]:
+    """Returns SQL statements of a given stage of a given run.
+    """
+    if stage == COPIED_STAGE:
+        return get_copy_stage_script(run_id, manifest_key, objects)
+    if stage == UPSERTED_STAGE:
+        return get_upsert_stage_script(run_id, manifest_key, objects)
+    if stage == ENCODED_STAGE:
+        return get_encode_stage_script(run_id, manifest_key, objects)
+    return get_load_stage_script(run_id, manifest_key, objects)
+
+
+def execute_stage_script(
+    run_id: str,
+    stage: str,
+    script: List[str],
+    changed_rows: Optional[Dict[str, int]] = None,
+) -> float:
+    """Executes the script of a given stage of a run.
+
+    :param Optional[Dict[str, int]] changed_rows: numbers of rows changed per
+    table, to which the rows changed by the stage are added. Only tables in
+    the data warehouse are counted; please refer to ``get_changed_rows``.
+
+    :returns: time in milliseconds spent on the stage.
     """
     batch_res = redshift_data.batch_execute_statement(
         WorkgroupName=REDSHIFT_WORKGROUP_NAME,
         Database=ACCESS_LOGS_DATABASE_NAME,
-        Sqls=[
-            # drops remaining temporary tables just in case
-            get_drop_raw_access_log_table_statement(),
-            get_drop_referer_stage_table_statement(),
-            get_drop_page_stage_table_statement(),
-            get_drop_edge_location_stage_table_statement(),
-            get_drop_user_agent_stage_table_statement(),
-            get_drop_access_log_stage_2_table_statement(),
-            get_drop_access_log_stage_table_statement(),
-
-            get_create_raw_access_log_table_statement(),
-            get_load_access_logs_statement(date),
-            get_create_access_log_stage_table_statement(),
-            get_drop_raw_access_log_table_statement(),
-            get_create_referer_stage_table_statement(),
-            get_delete_existing_referers_statement(),
-            get_insert_referers_statement(),
-            get_drop_referer_stage_table_statement(),
-            get_create_page_stage_table_statement(),
-            get_delete_existing_pages_statement(),
-            get_insert_pages_statement(),
-            get_drop_page_stage_table_statement(),
-            get_create_edge_location_stage_table_statement(),
-            get_delete_existing_edge_locations_statement(),
-            get_insert_edge_locations_statement(),
-            get_drop_edge_location_stage_table_statement(),
-            get_create_user_agent_stage_table_statement(),
-            get_delete_existing_user_agents_statement(),
-            get_insert_user_agents_statement(),
-            get_drop_user_agent_stage_table_statement(),
-            get_create_result_type_stage_table_statement(),
-            get_delete_existing_result_types_statement(),
-            get_insert_result_types_statement(),
-            get_drop_result_type_stage_table_statement(),
-            get_encode_foreign_keys_statement(),
-            get_insert_access_logs_statement(),
-            get_drop_access_log_stage_2_table_statement(),
-            get_drop_access_log_stage_table_statement(),
-        ],
+        Sqls=script,
     )
     statement_id = batch_res['Id']
     status, res = data_api.wait_for_results(redshift_data, statement_id)
     if status != 'FINISHED':
         if status is not None:
             if status == 'FAILED':
-                LOGGER.error('failed to load access logs: %s', str(res))
+                LOGGER.error(
+                    'failed to run stage %s of run %s: %s',
+                    stage,
+                    run_id,
+                    str(res),
+                )
             raise DataWarehouseException(
-                f'failed to load access logs: {status}',
+                f'failed to run stage {stage} of run {run_id}: {status}',
             )
-        raise DataWarehouseException('loading access logs timed out')
+        raise DataWarehouseException(
+            f'stage {stage} of run {run_id} timed out',
+        )
+    duration = res.get('Duration', 0) * 0.001 * 0.001 # ns → ms
+    if changed_rows is not None:
+        add_changed_rows(
+            changed_rows,
+            get_changed_rows(res.get('SubStatements', [])),
+        )
     LOGGER.debug(
-        'loaded access logs in %.3f ms',
-        res.get('Duration', 0) * 0.001 * 0.001, # ns → ms
+        'finished stage %s of run %s in %.3f ms',
+        stage,
+        run_id,
+        duration,
     )
+    return duration
 
 
-def get_create_raw_access_log_table_statement() -> str:
-    """Returns an SQL statement that creates a temporary table to load raw
-    access logs from the S3 bucket.
+def get_changed_rows(sub_statements: Sequence[Dict]) -> Dict[str, int]:
+    """Counts rows changed per table by given sub-statements of a finished
+    batch.
+
+    Counts only tables in ``tables.TABLE_NAMES`` and the monthly access log
+    tables; staging tables are ignored.
+    Stored procedures report no changed rows, so the access log view is
+    never counted.
+    """
+    changed_rows: Dict[str, int] = {}
+    for sub in sub_statements:
+        match = DML_STATEMENT_PATTERN.match(sub.get('QueryString', ''))
+        num_rows = sub.get('ResultRows', -1)
+        if match is None or num_rows <= 0:
+            continue
+        table_name = match.group(1)
+        if table_name in tables.TABLE_NAMES \
+            or tables.is_access_log_slice_table_name(table_name):
+            changed_rows[table_name] = \
+                changed_rows.get(table_name, 0) + num_rows
+    return changed_rows
+
+
+def get_copy_stage_script(
+    run_id: str,
+    manifest_key: str,
+    objects: Sequence[Dict],
+) -> List[str]:
+    """Returns SQL statements of the ``copied`` stage of a given run.
+    """
+    stage_table_name = get_stage_table_name(run_id)
+    run_object_table_name = get_run_object_table_name(run_id)
+    script = [
+        # drops remaining tables just in case
+        get_drop_tables_statement([
+            '#raw_access_log',
+            stage_table_name,
+            run_object_table_name,
+        ]),
+        get_create_raw_access_log_table_statement(),
+    ]
+    if any(not is_parquet_object(obj) for obj in objects):
+        script.append(get_load_access_logs_statement(manifest_key))
+    for column_count in get_parquet_column_counts(objects):
+        script.append(get_load_parquet_access_logs_statement(
+            get_parquet_manifest_key(manifest_key, column_count),
+            column_count,
+        ))
+    return script + [
+        get_create_access_log_stage_table_statement(stage_table_name),
+        get_drop_raw_access_log_table_statement(),
+        # records the objects in a table of the run rather than a table
+        # shared among runs, which the loaded stage would lock.
+        get_create_run_object_table_statement(run_object_table_name),
+        get_insert_run_objects_statement(run_object_table_name, objects),
+        get_insert_checkpoint_statement(run_id, COPIED_STAGE, manifest_key),
+    ]
+
+
+def get_upsert_stage_script(
+    run_id: str,
+    manifest_key: str,
+    objects: Sequence[Dict],
+) -> List[str]:
+    """Returns SQL statements of the ``upserted`` stage of a given run.
+
+    ``objects`` must belong to a single CloudFront distribution.
+    """
+    stage_table_name = get_stage_table_name(run_id)
+    distribution_id = get_distribution_id_of_objects(objects)
+    return [
+        # drops remaining tables just in case.
+        # a single statement to stay within the limit of 40 statements in a
+        # batch.
+        get_drop_tables_statement(DIMENSION_STAGE_TABLE_NAMES),
+        # serializes updates of the dimension tables among concurrent loads,
+        # which otherwise end up with serializable isolation violations.
+        # the lock lasts only for this stage; the following stages read the
+        # dimension tables without locking them, because values never change
+        # their IDs once committed.
+        get_lock_tables_statement([
+            tables.REFERER_TABLE_NAME,
+            tables.PAGE_TABLE_NAME,
+            tables.EDGE_LOCATION_TABLE_NAME,
+            tables.USER_AGENT_TABLE_NAME,
+            tables.RESULT_TYPE_TABLE_NAME,
+            tables.DISTRIBUTION_TABLE_NAME,
+        ]),
+        *(
+            [get_insert_distribution_statement(distribution_id)]
+                if distribution_id is not None else []
+        ),
+        get_create_referer_stage_table_statement(stage_table_name),
+        get_delete_existing_referers_statement(),
+        get_insert_referers_statement(),
+        get_drop_referer_stage_table_statement(),
+        get_create_page_stage_table_statement(stage_table_name),
+        get_delete_existing_pages_statement(),
+        get_insert_pages_statement(),
+        get_drop_page_stage_table_statement(),
+        get_create_edge_location_stage_table_statement(stage_table_name),
+        get_delete_existing_edge_locations_statement(),
+        get_insert_edge_locations_statement(),
+        get_drop_edge_location_stage_table_statement(),
+        get_create_user_agent_stage_table_statement(stage_table_name),
+        get_delete_existing_user_agents_statement(),
+        get_insert_user_agents_statement(),
+        get_drop_user_agent_stage_table_statement(),
+        get_create_result_type_stage_table_statement(stage_table_name),
+        get_delete_existing_result_types_statement(),
+        get_insert_result_types_statement(),
+        get_drop_result_type_stage_table_statement(),
+        get_insert_checkpoint_statement(run_id, UPSERTED_STAGE, manifest_key),
+    ]
+
+
+def get_encode_stage_script(
+    run_id: str,
+    manifest_key: str,
+    objects: Sequence[Dict],
+) -> List[str]:
+    """Returns SQL statements of the ``encoded`` stage of a given run.
+
+    ``objects`` must belong to a single CloudFront distribution.
+    The dimension tables must have had all the values of the staged access
+    logs in the ``upserted`` stage.
+    """
+    stage_table_name = get_stage_table_name(run_id)
+    encoded_table_name = get_encoded_table_name(run_id)
+    distribution_id = get_distribution_id_of_objects(objects)
+    return [
+        # drops remaining tables just in case
+        get_drop_table_statement(encoded_table_name),
+        get_encode_foreign_keys_statement(
+            stage_table_name,
+            encoded_table_name,
+            distribution_id,
+        ),
+        get_drop_table_statement(stage_table_name),
+        get_insert_checkpoint_statement(run_id, ENCODED_STAGE, manifest_key),
+    ]
+
+
+def get_load_stage_script(
+    run_id: str,
+    manifest_key: str,
+    objects: Sequence[Dict],
+) -> List[str]:
+    """Returns SQL statements of the ``loaded`` stage of a given run.
+    """
+    encoded_table_name = get_encoded_table_name(run_id)
+    run_object_table_name = get_run_object_table_name(run_id)
+    months = get_access_log_months(objects)
+    return [
+        # drops remaining tables just in case
+        get_drop_table_statement('#rollup_date'),
+        # serializes this stage among concurrent loads, so that the guard on
+        # loaded objects sees the objects of the other loads, and rollups
+        # are refreshed over all the access logs of a day.
+        # the fact, sample, rollup, and sketch tables are written only while
+        # the loaded object table is locked, so they are not locked; LOCK is
+        # exclusive and would block dashboards reading them.
+        get_lock_tables_statement([tables.LOADED_OBJECT_TABLE_NAME]),
+        *(get_create_access_log_month_statement(month) for month in months),
+        *(
+            get_insert_access_logs_statement(
+                run_id,
+                encoded_table_name,
+                month,
+                is_first=(i == 0),
+                is_last=(i == len(months) - 1),
+            ) for i, month in enumerate(months)
+        ),
+        approximate.get_insert_sample_statement(
+            encoded_table_name,
+            get_no_loaded_run_objects_condition(run_object_table_name),
+        ),
+        get_insert_loaded_objects_statement(run_object_table_name),
+        get_create_rollup_date_table_statement(encoded_table_name, objects),
+        *get_refresh_rollups_script(objects),
+        get_drop_tables_statement([
+            '#rollup_date',
+            encoded_table_name,
+            run_object_table_name,
+        ]),
+        get_insert_checkpoint_statement(run_id, LOADED_STAGE, manifest_key),
+    ]
+
+
+def get_stage_table_name(run_id: str) -> str:
+    """Returns the name of the staging table of a given run to select and
+    format access log columns.
+    """
+    return f'access_log_stage_{run_id}'
+
+
+def get_encoded_table_name(run_id: str) -> str:
+    """Returns the name of the staging table of a given run that has foreign
+    keys of access logs encoded.
+    """
+    return f'access_log_encoded_{run_id}'
+
+
+def get_run_object_table_name(run_id: str) -> str:
+    """Returns the name of the table of a given run that records the S3
+    objects being loaded by the run.
+    """
+    return f'load_run_object_{run_id}'
+
+
+def get_insert_checkpoint_statement(
+    run_id: str,
+    stage: str,
+    manifest_key: str,
+) -> str:
+    """Returns an SQL statement that records a given run has finished a given
+    stage.
+    """
+    return ''.join([
+        f'INSERT INTO {tables.LOAD_CHECKPOINT_TABLE_NAME}',
+        '  (run_id, stage, manifest_key, finished_at)',
+        f"  VALUES ('{run_id}', '{stage}', '{escape_string(manifest_key)}',",
+        '    GETDATE())',
+    ])
+
+
+def get_insert_changed_rows_statement(changed_rows: Dict[str, int]) -> str:
+    """Returns an SQL statement that records given numbers of rows changed
+    per table.
+    """
+    values = ','.join(
+        f"('{table_name}', {num_rows}, GETDATE())"
+            for table_name, num_rows in sorted(changed_rows.items())
+    )
+    return ''.join([
+        f'INSERT INTO {tables.CHANGED_ROW_COUNT_TABLE_NAME}',
+        '  (table_name, changed_rows, recorded_at)',
+        f'  VALUES {values}',
+    ])
+
+
+def get_create_run_object_table_statement(run_object_table_name: str) -> str:
+    """Returns an SQL statement that creates a given table of a run to record
+    S3 objects being loaded by the run.
+    """
+    return ''.join([
+        f'CREATE TABLE {run_object_table_name} (',
+        '  object_key VARCHAR(1024) NOT NULL,',
+        '  date DATE NOT NULL',
+        ')',
+    ])
+
+
+def get_insert_run_objects_statement(
+    run_object_table_name: str,
+    objects: Sequence[Dict],
+) -> str:
+    """Returns an SQL statement that records given S3 objects in a given
+    table of a run.
+    """
+    values = ','.join(
+        f"('{escape_string(obj['Key'])}',"
+        f" '{get_date_of_key(obj['Key']).isoformat()}')"
+            for obj in objects
+    )
+    return ''.join([
+        f'INSERT INTO {run_object_table_name}',
+        '  (object_key, date)',
+        f'  VALUES {values}',
+    ])
+
+
+def get_no_loaded_run_objects_condition(run_object_table_name: str) -> str:
+    """Returns an SQL condition that none of S3 objects in a given table of a
+    run has been loaded.
     """
     return ''.join([
-        'CREATE TABLE #raw_access_log (',
-        '  seq_num INT,',
-        '  date DATE,',
-        '  time TIME,',
-        '  edge_location VARCHAR,',
-        '  sc_bytes BIGINT,',
-        '  c_ip VARCHAR,',
-        '  cs_method VARCHAR,',
-        '  cs_host VARCHAR,',
-        '  cs_uri_stem VARCHAR(2048),',
-        '  status SMALLINT,',
-        '  referer VARCHAR(2048),',
-        '  user_agent VARCHAR(2048),',
-        '  cs_uri_query VARCHAR,',
-        '  cs_cookie VARCHAR,',
-        '  edge_result_type VARCHAR,',
-        '  edge_request_id VARCHAR,',
-        '  host_header VARCHAR,',
-        '  cs_protocol VARCHAR,',
-        '  cs_bytes BIGINT,',
-        '  time_taken FLOAT4,',
-        '  forwarded_for VARCHAR,',
-        '  ssl_protocol VARCHAR,',
-        '  ssl_cipher VARCHAR,',
-        '  edge_response_result_type VARCHAR,',
-        '  cs_protocol_version VARCHAR,',
-        '  fle_status VARCHAR,',
-        '  fle_encrypted_fields VARCHAR,',
-        '  c_port INT,',
-        '  time_to_first_byte FLOAT4,',
-        '  edge_detailed_result_type VARCHAR,',
-        '  sc_content_type VARCHAR,',
-        '  sc_content_len BIGINT,',
-        '  sc_range_start BIGINT,',
-        '  sc_range_end BIGINT',
+        'NOT EXISTS (',
+        '  SELECT 1',
+        f'    FROM {run_object_table_name}',
+        f'    JOIN {tables.LOADED_OBJECT_TABLE_NAME}',
+        '      ON',
+        f'        {run_object_table_name}.object_key',
+        f'        = {tables.LOADED_OBJECT_TABLE_NAME}.object_key',
         ')',
-        'SORTKEY (date, time, seq_num)',
     ])
 
 
-def get_load_access_logs_statement(date: datetime.datetime) -> str:
-    """Returns an SQL statement that loads access logs from the S3 bucket.
+def list_unfinished_runs() -> List[Dict]:
+    """Lists runs that have not finished the last stage.
+
+    :returns: list of ``dict`` with ``runId``, ``manifestKey``, and
+    ``lastStage``.
+    """
+    records = execute_query(''.join([
+        'SELECT run_id, stage, manifest_key',
+        f'  FROM {tables.LOAD_CHECKPOINT_TABLE_NAME}',
+        '  WHERE run_id NOT IN (',
+        '    SELECT run_id',
+        f'      FROM {tables.LOAD_CHECKPOINT_TABLE_NAME}',
+        f"      WHERE stage IN ('{LOADED_STAGE}', '{ABANDONED_STAGE}')",
+        '  )',
+    ]))
+    runs = {}
+    for run_id, stage, manifest_key in records:
+        run = runs.setdefault(run_id, {
+            'runId': run_id,
+            'manifestKey': manifest_key,
+            'lastStage': stage,
+        })
+        if LOAD_STAGES.index(stage) > LOAD_STAGES.index(run['lastStage']):
+            run['lastStage'] = stage
+    return list(runs.values())
+
+
+def resume_unfinished_runs(
+    get_remaining_time: Callable[[], float],
+) -> Dict[str, Any]:
+    """Resumes runs that have not finished the last stage.
+
+    Abandons a run whose COPY manifest has expired; its objects will be
+    loaded by another run because they have not been recorded as loaded.
+
+    :returns: ``dict`` of the load metrics; please refer to
+    ``load_access_log_objects``.
+    """
+    results = get_empty_load_results()
+    for run in list_unfinished_runs():
+        run_id = run['runId']
+        manifest_key = run['manifestKey']
+        objects = read_copy_manifest(manifest_key)
+        if objects is None:
+            LOGGER.warning('abandoning run %s without manifest', run_id)
+            abandon_run(run_id, manifest_key)
+            continue
+        LOGGER.debug(
+            'resuming run %s after stage %s',
+            run_id,
+            run['lastStage'],
+        )
+        try:
+            outcome = continue_load_run(
+                run_id,
+                manifest_key,
+                objects,
+                run['lastStage'],
+                get_remaining_time,
+                results['changedRows'],
+            )
+        except DataWarehouseException as exc:
+            LOGGER.error('failed to resume run %s: %s', run_id, exc)
+            outcome = -1.0
+        add_load_outcome(results, len(objects), outcome)
+    return results
+
+
+def abandon_run(run_id: str, manifest_key: str):
+    """Abandons a given run and drops its staging tables.
+    """
+    execute_stage_script(run_id, ABANDONED_STAGE, [
+        get_drop_tables_statement([
+            get_stage_table_name(run_id),
+            get_encoded_table_name(run_id),
+            get_run_object_table_name(run_id),
+        ]),
+        get_insert_checkpoint_statement(run_id, ABANDONED_STAGE, manifest_key),
+    ])
+
+
+def get_create_raw_access_log_table_statement() -> str:
+    """Returns an SQL statement that creates a temporary table to load raw
+    access logs from the S3 bucket.
+
+    The table is defined in ``libdatawarehouse.tables``.
+    """
+    return tables.get_create_table_statement(
+        tables.RAW_ACCESS_LOG_TABLE,
+        if_not_exists=False,
+    )
+
+
+def get_load_access_logs_statement(manifest_key: str) -> str:
+    """Returns an SQL statement that loads access logs listed in a given COPY
+    manifest from the S3 bucket.
     """
-    access_logs_prefix = get_access_logs_prefix(date)
     return ''.join([
         'COPY #raw_access_log',
-        f" FROM 's3://{SOURCE_BUCKET_NAME}/{access_logs_prefix}'",
+        f" FROM 's3://{SOURCE_BUCKET_NAME}/{manifest_key}'",
         f" IAM_ROLE '{COPY_ROLE_ARN}'",
+        '  MANIFEST',
         '  GZIP',
         "  DELIMITER '\t'",
         '  IGNOREHEADER 1',
         "  NULL AS '-'",
+        # files masked before pre-encoding was introduced have no columns of
+        # pre-encoded IDs
+        '  FILLRECORD',
+        # columns have explicit encodings
+        '  COMPUPDATE OFF',
     ])
 
 
-def get_create_access_log_stage_table_statement() -> str:
-    """Returns an SQL statement that creates a temporary table to select and
-    format access log columns.
+def get_load_parquet_access_logs_statement(
+    manifest_key: str,
+    column_count: int,
+) -> str:
+    """Returns an SQL statement that loads Parquet files of access logs listed
+    in a given COPY manifest from the S3 bucket.
+
+    Columns of the Parquet files must be the first ``column_count`` columns
+    of ``tables.RAW_ACCESS_LOG_TABLE`` in the same order.
+    The other columns are left NULL.
+    """
+    column_names = [
+        column.name
+            for column in tables.RAW_ACCESS_LOG_TABLE.columns[:column_count]
+    ]
+    return ''.join([
+        f'COPY #raw_access_log ({", ".join(column_names)})',
+        f" FROM 's3://{SOURCE_BUCKET_NAME}/{manifest_key}'",
+        f" IAM_ROLE '{COPY_ROLE_ARN}'",
+        '  MANIFEST',
+        '  FORMAT AS PARQUET',
+    ])
+
+
+def get_create_access_log_stage_table_statement(
+    stage_table_name: str,
+) -> str:
+    """Returns an SQL statement that creates a given staging table to select
+    and format access log columns.
     """
     return ''.join([
-        'CREATE TABLE #access_log_stage (',
+        f'CREATE TABLE {stage_table_name} (',
         '  datetime,',
         '  seq_num,',
         '  edge_location,',
@@ -191,7 +1323,15 @@ def get_create_access_log_stage_table_statement() -> str:
         '  cs_bytes,',
         '  time_taken,',
         '  edge_response_result_type,',
-        '  time_to_first_byte',
+        '  time_to_first_byte,',
+        '  referer_hash,',
+        '  page_hash,',
+        '  user_agent_hash,',
+        '  edge_location_id,',
+        '  page_id,',
+        '  referer_id,',
+        '  user_agent_id,',
+        '  result_type_id',
         ')',
         '  SORTKEY ("datetime", seq_num)',
         '  AS SELECT',
@@ -208,7 +1348,15 @@ def get_create_access_log_stage_table_statement() -> str:
         '    cs_bytes,',
         '    time_taken,',
         '    edge_response_result_type,',
-        '    time_to_first_byte',
+        '    time_to_first_byte,',
+        "    FNV_HASH(CASE WHEN referer IS NULL THEN '-' ELSE referer END),",
+        '    FNV_HASH(cs_uri_stem),',
+        "    FNV_HASH(CASE WHEN user_agent IS NULL THEN '-' ELSE user_agent END),",
+        '    edge_location_id,',
+        '    page_id,',
+        '    referer_id,',
+        '    user_agent_id,',
+        '    result_type_id',
         '  FROM #raw_access_log',
     ])
 
@@ -220,14 +1368,25 @@ def get_drop_raw_access_log_table_statement() -> str:
     return get_drop_table_statement('#raw_access_log')
 
 
-def get_create_referer_stage_table_statement() -> str:
+def get_lock_tables_statement(table_names: Sequence[str]) -> str:
+    """Returns an SQL statement that locks given tables until the end of the
+    transaction.
+    """
+    return f'LOCK {", ".join(table_names)}'
+
+
+def get_create_referer_stage_table_statement(
+    stage_table_name: str,
+) -> str:
     """Returns an SQL statement that creates a temporary table to aggregate
-    referers.
+    referers in a given staging table.
     """
     return ''.join([
-        'CREATE TABLE #referer_stage (url)',
-        '  SORTKEY (url)',
-        '  AS SELECT referer FROM #access_log_stage',
+        'CREATE TABLE #referer_stage (url_hash, url)',
+        '  DISTKEY (url_hash)',
+        '  SORTKEY (url_hash)',
+        f'  AS SELECT referer_hash, referer FROM {stage_table_name}',
+        '    WHERE referer_id IS NULL',
     ])
 
 
@@ -239,7 +1398,8 @@ def get_delete_existing_referers_statement() -> str:
         'DELETE FROM #referer_stage',
         f' USING {tables.REFERER_TABLE_NAME}',
         '  WHERE',
-        f'   #referer_stage.url = {tables.REFERER_TABLE_NAME}.url',
+        f'   #referer_stage.url_hash = {tables.REFERER_TABLE_NAME}.url_hash',
+        f'   AND #referer_stage.url = {tables.REFERER_TABLE_NAME}.url',
     ])
 
 
@@ -248,8 +1408,8 @@ def get_insert_referers_statement() -> str:
     table into the referer table.
     """
     return ''.join([
-        f'INSERT INTO {tables.REFERER_TABLE_NAME} (url)',
-        '  SELECT url FROM #referer_stage GROUP BY url',
+        f'INSERT INTO {tables.REFERER_TABLE_NAME} (url_hash, url)',
+        '  SELECT url_hash, url FROM #referer_stage GROUP BY url_hash, url',
     ])
 
 
@@ -260,14 +1420,18 @@ def get_drop_referer_stage_table_statement() -> str:
     return get_drop_table_statement('#referer_stage')
 
 
-def get_create_page_stage_table_statement() -> str:
+def get_create_page_stage_table_statement(
+    stage_table_name: str,
+) -> str:
     """Returns an SQL statement that creates a temporary table to aggregate
-    pages.
+    pages in a given staging table.
     """
     return ''.join([
-        'CREATE TABLE #page_stage (path)',
-        '  SORTKEY (path)',
-        '  AS SELECT cs_uri_stem FROM #access_log_stage',
+        'CREATE TABLE #page_stage (path_hash, path)',
+        '  DISTKEY (path_hash)',
+        '  SORTKEY (path_hash)',
+        f'  AS SELECT page_hash, cs_uri_stem FROM {stage_table_name}',
+        '    WHERE page_id IS NULL',
     ])
 
 
@@ -279,7 +1443,8 @@ def get_delete_existing_pages_statement() -> str:
         'DELETE FROM #page_stage',
         f' USING {tables.PAGE_TABLE_NAME}',
         '  WHERE',
-        f'   #page_stage.path = {tables.PAGE_TABLE_NAME}.path',
+        f'   #page_stage.path_hash = {tables.PAGE_TABLE_NAME}.path_hash',
+        f'   AND #page_stage.path = {tables.PAGE_TABLE_NAME}.path',
     ])
 
 
@@ -288,8 +1453,8 @@ def get_insert_pages_statement() -> str:
     into the stage table.
     """
     return ''.join([
-        f'INSERT INTO {tables.PAGE_TABLE_NAME} (path)',
-        '  SELECT path FROM #page_stage GROUP BY path',
+        f'INSERT INTO {tables.PAGE_TABLE_NAME} (path_hash, path)',
+        '  SELECT path_hash, path FROM #page_stage GROUP BY path_hash, path',
     ])
 
 
@@ -300,14 +1465,17 @@ def get_drop_page_stage_table_statement() -> str:
     return get_drop_table_statement('#page_stage')
 
 
-def get_create_edge_location_stage_table_statement() -> str:
+def get_create_edge_location_stage_table_statement(
+    stage_table_name: str,
+) -> str:
     """Returns an SQL statement that creates a temporary table to aggregate edge
-    locations.
+    locations in a given staging table.
     """
     return ''.join([
         'CREATE TABLE #edge_location_stage (code)',
         '  SORTKEY (code)',
-        '  AS SELECT edge_location FROM #access_log_stage',
+        f'  AS SELECT edge_location FROM {stage_table_name}',
+        '    WHERE edge_location_id IS NULL',
     ])
 
 
@@ -340,14 +1508,18 @@ def get_drop_edge_location_stage_table_statement() -> str:
     return get_drop_table_statement('#edge_location_stage')
 
 
-def get_create_user_agent_stage_table_statement() -> str:
+def get_create_user_agent_stage_table_statement(
+    stage_table_name: str,
+) -> str:
     """Returns an SQL statement that creates a temporary table to aggregate user
-    agents.
+    agents in a given staging table.
     """
     return ''.join([
-        'CREATE TABLE #user_agent_stage (user_agent)',
-        '  SORTKEY (user_agent)',
-        '  AS SELECT user_agent FROM #access_log_stage',
+        'CREATE TABLE #user_agent_stage (user_agent_hash, user_agent)',
+        '  DISTKEY (user_agent_hash)',
+        '  SORTKEY (user_agent_hash)',
+        f'  AS SELECT user_agent_hash, user_agent FROM {stage_table_name}',
+        '    WHERE user_agent_id IS NULL',
     ])
 
 
@@ -359,7 +1531,8 @@ def get_delete_existing_user_agents_statement() -> str:
         'DELETE FROM #user_agent_stage',
         f' USING {tables.USER_AGENT_TABLE_NAME}',
         '  WHERE',
-        f'   #user_agent_stage.user_agent = {tables.USER_AGENT_TABLE_NAME}.user_agent',
+        f'   #user_agent_stage.user_agent_hash = {tables.USER_AGENT_TABLE_NAME}.user_agent_hash',
+        f'   AND #user_agent_stage.user_agent = {tables.USER_AGENT_TABLE_NAME}.user_agent',
     ])
 
 
@@ -368,8 +1541,9 @@ def get_insert_user_agents_statement() -> str:
     into the user agent table.
     """
     return ''.join([
-        f'INSERT INTO {tables.USER_AGENT_TABLE_NAME} (user_agent)',
-        '  SELECT user_agent FROM #user_agent_stage GROUP BY user_agent',
+        f'INSERT INTO {tables.USER_AGENT_TABLE_NAME} (user_agent_hash, user_agent)',
+        '  SELECT user_agent_hash, user_agent FROM #user_agent_stage',
+        '    GROUP BY user_agent_hash, user_agent',
     ])
 
 
@@ -380,14 +1554,17 @@ def get_drop_user_agent_stage_table_statement() -> str:
     return get_drop_table_statement('#user_agent_stage')
 
 
-def get_create_result_type_stage_table_statement() -> str:
+def get_create_result_type_stage_table_statement(
+    stage_table_name: str,
+) -> str:
     """Returns an SQL statement that creates a temporary table to aggregate
-    result types.
+    result types in a given staging table.
     """
     return ''.join([
         'CREATE TABLE #result_type_stage (result_type)',
         '  SORTKEY (result_type)',
-        '  AS SELECT edge_response_result_type FROM #access_log_stage',
+        f'  AS SELECT edge_response_result_type FROM {stage_table_name}',
+        '    WHERE result_type_id IS NULL',
     ])
 
 
@@ -420,12 +1597,41 @@ def get_drop_result_type_stage_table_statement() -> str:
     return get_drop_table_statement('#result_type_stage')
 
 
-def get_encode_foreign_keys_statement() -> str:
-    """Returns an SQL statement that decodes foreign keys in the temporary
-    access log table and creates a temporary second staging table.
+def get_insert_distribution_statement(distribution_id: str) -> str:
+    """Returns an SQL statement that inserts a given CloudFront distribution
+    into the distribution table unless it exists.
     """
     return ''.join([
-        'CREATE TABLE #access_log_stage_2 (',
+        f'INSERT INTO {tables.DISTRIBUTION_TABLE_NAME} (distribution_id)',
+        f"  SELECT '{escape_string(distribution_id)}'",
+        '  WHERE NOT EXISTS (',
+        f'    SELECT 1 FROM {tables.DISTRIBUTION_TABLE_NAME}',
+        f"      WHERE distribution_id = '{escape_string(distribution_id)}'",
+        '  )',
+    ])
+
+
+def get_encode_foreign_keys_statement(
+    stage_table_name: str,
+    encoded_table_name: str,
+    distribution_id: Optional[str],
+) -> str:
+    """Returns an SQL statement that encodes foreign keys of access logs in a
+    given staging table and creates another staging table of encoded access
+    logs.
+
+    :param Optional[str] distribution_id: ID of the CloudFront distribution
+    of the access logs. ``None`` if unknown.
+    """
+    if distribution_id is None:
+        distribution = 'NULL::INT'
+    else:
+        distribution = ''.join([
+            f'(SELECT id FROM {tables.DISTRIBUTION_TABLE_NAME}',
+            f"  WHERE distribution_id = '{escape_string(distribution_id)}')",
+        ])
+    return ''.join([
+        f'CREATE TABLE {encoded_table_name} (',
         '  datetime,',
         '  seq_num,',
         '  edge_location,',
@@ -439,63 +1645,301 @@ def get_encode_foreign_keys_statement() -> str:
         '  cs_bytes,',
         '  time_taken,',
         '  edge_response_result_type,',
-        '  time_to_first_byte',
+        '  time_to_first_byte,',
+        '  distribution',
         ')',
         '  DISTKEY (referer)',
         '  SORTKEY ("datetime", seq_num)',
         '  AS SELECT',
-        '    #access_log_stage.datetime,',
-        '    #access_log_stage.seq_num,',
-        f'   {tables.EDGE_LOCATION_TABLE_NAME}.id,',
-        '    #access_log_stage.sc_bytes,',
-        '    #access_log_stage.cs_method,',
-        f'   {tables.PAGE_TABLE_NAME}.id,',
-        '    #access_log_stage.status,',
-        f'   {tables.REFERER_TABLE_NAME}.id,',
-        f'   {tables.USER_AGENT_TABLE_NAME}.id,',
-        '    #access_log_stage.cs_protocol,',
-        '    #access_log_stage.cs_bytes,',
-        '    #access_log_stage.time_taken,',
-        f'   {tables.RESULT_TYPE_TABLE_NAME}.id,',
-        '    #access_log_stage.time_to_first_byte',
-        '  FROM',
-        '    #access_log_stage,'
-        f'   {tables.EDGE_LOCATION_TABLE_NAME},',
-        f'   {tables.PAGE_TABLE_NAME},',
-        f'   {tables.REFERER_TABLE_NAME},',
-        f'   {tables.USER_AGENT_TABLE_NAME},',
-        f'   {tables.RESULT_TYPE_TABLE_NAME}',
+        '    access_log_stage.datetime,',
+        '    access_log_stage.seq_num,',
+        '    COALESCE(access_log_stage.edge_location_id,',
+        f'     {tables.EDGE_LOCATION_TABLE_NAME}.id),',
+        '    access_log_stage.sc_bytes,',
+        '    access_log_stage.cs_method,',
+        f'   COALESCE(access_log_stage.page_id, {tables.PAGE_TABLE_NAME}.id),',
+        '    access_log_stage.status,',
+        '    COALESCE(access_log_stage.referer_id,',
+        f'     {tables.REFERER_TABLE_NAME}.id),',
+        '    COALESCE(access_log_stage.user_agent_id,',
+        f'     {tables.USER_AGENT_TABLE_NAME}.id),',
+        '    access_log_stage.cs_protocol,',
+        '    access_log_stage.cs_bytes,',
+        '    access_log_stage.time_taken,',
+        '    COALESCE(access_log_stage.result_type_id,',
+        f'     {tables.RESULT_TYPE_TABLE_NAME}.id),',
+        '    access_log_stage.time_to_first_byte,',
+        f'   {distribution}',
+        # joins only values that have no pre-encoded IDs
+        f'  FROM {stage_table_name} AS access_log_stage',
+        f'  LEFT JOIN {tables.EDGE_LOCATION_TABLE_NAME}',
+        '    ON (access_log_stage.edge_location_id IS NULL)',
+        '      AND (access_log_stage.edge_location =',
+        f'       {tables.EDGE_LOCATION_TABLE_NAME}.code)',
+        # compares hashes first and full strings only to resolve collisions
+        f'  LEFT JOIN {tables.PAGE_TABLE_NAME}',
+        '    ON (access_log_stage.page_id IS NULL)',
+        '      AND (access_log_stage.page_hash =',
+        f'       {tables.PAGE_TABLE_NAME}.path_hash)',
+        '      AND (access_log_stage.cs_uri_stem =',
+        f'       {tables.PAGE_TABLE_NAME}.path)',
+        f'  LEFT JOIN {tables.REFERER_TABLE_NAME}',
+        '    ON (access_log_stage.referer_id IS NULL)',
+        '      AND (access_log_stage.referer_hash =',
+        f'       {tables.REFERER_TABLE_NAME}.url_hash)',
+        '      AND (access_log_stage.referer =',
+        f'       {tables.REFERER_TABLE_NAME}.url)',
+        f'  LEFT JOIN {tables.USER_AGENT_TABLE_NAME}',
+        '    ON (access_log_stage.user_agent_id IS NULL)',
+        '      AND (access_log_stage.user_agent_hash =',
+        f'       {tables.USER_AGENT_TABLE_NAME}.user_agent_hash)',
+        '      AND (access_log_stage.user_agent =',
+        f'       {tables.USER_AGENT_TABLE_NAME}.user_agent)',
+        f'  LEFT JOIN {tables.RESULT_TYPE_TABLE_NAME}',
+        '    ON (access_log_stage.result_type_id IS NULL)',
+        '      AND (access_log_stage.edge_response_result_type =',
+        f'       {tables.RESULT_TYPE_TABLE_NAME}.result_type)',
+        # drops rows that have unresolved foreign keys as inner joins did
         '  WHERE',
-        f'   (#access_log_stage.edge_location = {tables.EDGE_LOCATION_TABLE_NAME}.code)',
-        f'   AND (#access_log_stage.cs_uri_stem = {tables.PAGE_TABLE_NAME}.path)',
-        f'   AND (#access_log_stage.referer = {tables.REFERER_TABLE_NAME}.url)',
-        f'   AND (#access_log_stage.user_agent = {tables.USER_AGENT_TABLE_NAME}.user_agent)',
-        '    AND (#access_log_stage.edge_response_result_type =',
-        f'     {tables.RESULT_TYPE_TABLE_NAME}.result_type)',
+        '    COALESCE(access_log_stage.edge_location_id,',
+        f'     {tables.EDGE_LOCATION_TABLE_NAME}.id) IS NOT NULL',
+        '    AND COALESCE(access_log_stage.page_id,',
+        f'     {tables.PAGE_TABLE_NAME}.id) IS NOT NULL',
+        '    AND COALESCE(access_log_stage.referer_id,',
+        f'     {tables.REFERER_TABLE_NAME}.id) IS NOT NULL',
+        '    AND COALESCE(access_log_stage.user_agent_id,',
+        f'     {tables.USER_AGENT_TABLE_NAME}.id) IS NOT NULL',
+        '    AND COALESCE(access_log_stage.result_type_id,',
+        f'     {tables.RESULT_TYPE_TABLE_NAME}.id) IS NOT NULL',
+    ])
+
+
+def get_access_log_months(objects: Sequence[Dict]) -> List[datetime.date]:
+    """Returns the months of access logs in given S3 objects.
+
+    Months cover the range of dates given by ``get_rollup_datetime_range``.
+
+    :returns: first days of the months in ascending order.
+    """
+    start_date, end_date = get_rollup_datetime_range(objects)
+    last_date = end_date - datetime.timedelta(days=1)
+    return [
+        datetime.date(year, month, 1)
+            for year, month in iterate_months(start_date, last_date)
+    ]
+
+
+def get_next_month(month: datetime.date) -> datetime.date:
+    """Returns the first day of the month following a given month.
+    """
+    if month.month == 12:
+        return datetime.date(month.year + 1, 1, 1)
+    return datetime.date(month.year, month.month + 1, 1)
+
+
+def get_create_access_log_month_statement(month: datetime.date) -> str:
+    """Returns an SQL statement that creates the access log table of a given
+    month unless it exists.
+
+    The stored procedure also recreates the access log view if it creates
+    the table; please refer to ``libdatawarehouse.tables``.
+    """
+    return ''.join([
+        f'CALL {tables.CREATE_ACCESS_LOG_MONTH_PROCEDURE}(',
+        f'{month.year:04d}{month.month:02d})',
     ])
 
 
-def get_insert_access_logs_statement() -> str:
-    """Returns an SQL statement that inserts access logs in the temporary second
-    staging table into the access log table.
+def get_insert_access_logs_statement(
+    run_id: str,
+    encoded_table_name: str,
+    month: datetime.date,
+    is_first: bool,
+    is_last: bool,
+) -> str:
+    """Returns an SQL statement that inserts access logs in a given month in
+    a given staging table of encoded access logs into the access log table of
+    the month.
+
+    Inserts nothing if any of S3 objects of a given run has been loaded.
+
+    :param bool is_first: whether ``month`` is the first month of the run.
+    Access logs before ``month`` are also inserted if ``True``.
+
+    :param bool is_last: whether ``month`` is the last month of the run.
+    Access logs after ``month`` are also inserted if ``True``.
     """
+    # access logs out of the months of the run, if any, go to the first or
+    # last month instead of being lost
+    conditions = [
+        get_no_loaded_run_objects_condition(get_run_object_table_name(run_id)),
+    ]
+    if not is_first:
+        conditions.append(f"datetime >= '{format_date(month)}'")
+    if not is_last:
+        conditions.append(
+            f"datetime < '{format_date(get_next_month(month))}'",
+        )
+    table_name = tables.get_monthly_access_log_table_name(
+        month.year,
+        month.month,
+    )
     return ''.join([
-        f'INSERT INTO {tables.ACCESS_LOG_TABLE_NAME}',
-        '  SELECT * FROM #access_log_stage_2',
+        f'INSERT INTO {table_name}',
+        f'  SELECT * FROM {encoded_table_name}',
+        f'  WHERE {" AND ".join(conditions)}',
     ])
 
-def get_drop_access_log_stage_2_table_statement() -> str:
-    """Returns an SQL statement that drops the temporary second staging table
-    for access logs.
+
+def get_drop_access_log_months_statement(first_month: datetime.date) -> str:
+    """Returns an SQL statement that drops the access log tables of months
+    before a given month.
+
+    The stored procedure also recreates the access log view; please refer to
+    ``libdatawarehouse.tables``.
     """
-    return get_drop_table_statement('#access_log_stage_2')
+    return ''.join([
+        f'CALL {tables.DROP_ACCESS_LOG_MONTHS_PROCEDURE}(',
+        f'{first_month.year:04d}{first_month.month:02d})',
+    ])
 
 
-def get_drop_access_log_stage_table_statement() -> str:
-    """Returns an SQL statement that drops the temporary table to select and
-    format access log columns.
+def get_delete_expired_rows_script(first_month: datetime.date) -> List[str]:
+    """Returns SQL statements that delete rows before a given month from the
+    tables derived from access logs.
+
+    Deletes rows from the daily rollup tables, the sample table, and the
+    sketch table, which are not sliced by month.
+    """
+    date_condition = f"date < '{format_date(first_month)}'"
+    return [
+        *(
+            rollups.get_delete_rollup_statement(table, date_condition)
+                for table in tables.DAILY_ROLLUP_TABLES
+        ),
+        approximate.get_delete_sketches_statement(date_condition),
+        approximate.get_delete_sample_statement(
+            f"datetime < '{format_date(first_month)}'",
+        ),
+    ]
+
+
+def drop_expired_access_logs(
+    invocation_date: datetime.datetime,
+) -> Dict[str, int]:
+    """Drops the access log tables of months older than
+    ``RETENTION_MONTHS`` months before a given date, and deletes the rows of
+    the same months from the tables derived from access logs.
+
+    Dropping a monthly table takes constant time, and needs no VACUUM unlike
+    deleting rows.
+    The derived tables are much smaller than the access log tables, so their
+    rows are deleted.
+    Both happen in a single transaction, so the derived tables never outlive
+    nor lose the access logs that they are derived from.
+
+    :returns: numbers of rows deleted per table; please refer to
+    ``get_changed_rows``.
+    """
+    first_month = datetime.date(invocation_date.year, invocation_date.month, 1)
+    for _ in range(RETENTION_MONTHS - 1):
+        first_month = (first_month - datetime.timedelta(days=1)).replace(day=1)
+    LOGGER.debug(
+        'dropping access logs before %04d-%02d',
+        first_month.year,
+        first_month.month,
+    )
+    res = execute_batch([
+        get_drop_access_log_months_statement(first_month),
+        *get_delete_expired_rows_script(first_month),
+    ])
+    return get_changed_rows(res.get('SubStatements', []))
+
+
+def get_insert_loaded_objects_statement(run_object_table_name: str) -> str:
+    """Returns an SQL statement that records S3 objects in a given table of a
+    run as loaded.
+
+    Records nothing if any of S3 objects of the run has been loaded.
     """
-    return get_drop_table_statement('#access_log_stage')
+    condition = get_no_loaded_run_objects_condition(run_object_table_name)
+    return ''.join([
+        f'INSERT INTO {tables.LOADED_OBJECT_TABLE_NAME}',
+        '  (object_key, date, loaded_at)',
+        '  SELECT object_key, date, GETDATE()',
+        f'    FROM {run_object_table_name}',
+        f'    WHERE {condition}',
+    ])
+
+
+def get_create_rollup_date_table_statement(
+    encoded_table_name: str,
+    objects: Sequence[Dict],
+) -> str:
+    """Returns an SQL statement that creates a temporary table of the days of
+    access logs in a given staging table of encoded access logs.
+
+    Days are limited to around the dates of given S3 objects, so that
+    refreshing rollups can scan only those days of the access log table.
+    """
+    start_date, end_date = get_rollup_datetime_range(objects)
+    return ''.join([
+        'CREATE TABLE #rollup_date (date)',
+        '  AS SELECT DISTINCT TRUNC(datetime)',
+        f'  FROM {encoded_table_name}',
+        f"  WHERE datetime >= '{format_date(start_date)}'",
+        f"    AND datetime < '{format_date(end_date)}'",
+    ])
+
+
+def get_refresh_rollups_script(objects: Sequence[Dict]) -> List[str]:
+    """Returns SQL statements that replace rows of the daily rollup tables and
+    the sketch table on the days in the temporary table of days.
+
+    ``objects`` must be the same as the ones given to
+    ``get_create_rollup_date_table_statement``.
+
+    The access log table must have had the encoded access logs inserted.
+    """
+    start_date, end_date = get_rollup_datetime_range(objects)
+    date_condition = 'date IN (SELECT date FROM #rollup_date)'
+    datetime_condition = ''.join([
+        f"datetime >= '{format_date(start_date)}'",
+        f" AND datetime < '{format_date(end_date)}'",
+        ' AND TRUNC(datetime) IN (SELECT date FROM #rollup_date)',
+    ])
+    script = []
+    for table in tables.DAILY_ROLLUP_TABLES:
+        script.append(
+            rollups.get_delete_rollup_statement(table, date_condition),
+        )
+        script.append(
+            rollups.get_insert_rollup_statement(table, datetime_condition),
+        )
+    script.append(approximate.get_delete_sketches_statement(date_condition))
+    script.append(
+        approximate.get_insert_sketches_statement(datetime_condition),
+    )
+    return script
+
+
+def get_rollup_datetime_range(
+    objects: Sequence[Dict],
+) -> Tuple[datetime.date, datetime.date]:
+    """Returns the range of dates of access logs in given S3 objects.
+
+    Each S3 object contains access logs in an hour of the date in its key.
+    Extends the range by a day at both ends to tolerate access logs delivered
+    late or early.
+
+    :returns: tuple of the start date (inclusive) and the end date
+    (exclusive).
+    """
+    dates = [get_date_of_key(obj['Key']) for obj in objects]
+    return (
+        min(dates) - datetime.timedelta(days=1),
+        max(dates) + datetime.timedelta(days=2),
+    )
 
 
 def get_drop_table_statement(table_name: str) -> str:
@@ -504,42 +1948,377 @@ def get_drop_table_statement(table_name: str) -> str:
     return f'DROP TABLE IF EXISTS {table_name}'
 
 
+def get_drop_tables_statement(table_names: Sequence[str]) -> str:
+    """Returns an SQL statement that drops given tables.
+    """
+    return f'DROP TABLE IF EXISTS {", ".join(table_names)}'
+
+
+def escape_string(value: str) -> str:
+    """Escapes a given string to be embedded in a string literal.
+    """
+    return value.replace('\\', '\\\\').replace("'", "''")
+
+
 def parse_time(time_str: str) -> datetime.datetime:
     """Parses a given "time" string.
     """
     return datetime.datetime.strptime(time_str, '%Y-%m-%dT%H:%M:%S%z')
 
 
-def get_access_logs_prefix(date: datetime.datetime) -> str:
-    """Returns the S3 object key prefix of access log files on a given date.
-
-    A returned string contains a trailing slash (/).
+def parse_date(date_str: str) -> datetime.datetime:
+    """Parses a given date string like "2022-10-01".
     """
-    return f'{SOURCE_KEY_PREFIX}{format_date_part(date)}'
-
+    return datetime.datetime.strptime(date_str, '%Y-%m-%d')
 
-def format_date_part(date: datetime.datetime) -> str:
-    """Converts a given date into the date part of an S3 object path.
 
-    A returned string contains a trailing slash (/).
+def format_date(date: datetime.datetime) -> str:
+    """Formats a given date like "2022-10-01".
     """
-    return f'{date.year:04d}/{date.month:02d}/{date.day:02d}/'
+    return f'{date.year:04d}-{date.month:02d}-{date.day:02d}'
+
 
+def start_vacuum(load_results: Dict[str, Any]):
+    """Starts VACUUM and ANALYZE over the updated tables.
 
-def start_vacuum():
-    """Starts VACUUM over the updated tables.
+    Passes ``load_results`` to the workflow so that its output records the
+    time spent on ANALYZE alongside the load metrics.
+    ANALYZE picks tables by the changed rows that ``lambda_handler`` records
+    in ``tables.CHANGED_ROW_COUNT_TABLE_NAME``.
     """
     res = stepfunctions.start_execution(
         stateMachineArn=VACUUM_WORKFLOW_ARN,
         input=json.dumps({
-            # "SORT ONLY" is sufficient because no deletes have been performed
+            # "SORT ONLY" is sufficient because Redshift reclaims rows deleted
+            # by rollup refreshes and retention with automatic VACUUM DELETE
             'mode': 'SORT ONLY',
+            'load': load_results,
         }),
     )
     LOGGER.debug('started VACUUM: %s', str(res))
 
 
-def lambda_handler(event, _):
+def read_dimension_snapshot() -> dimensions.DimensionSnapshot:
+    """Reads the snapshot of the dimension tables.
+
+    :returns: empty snapshot if no snapshot has been saved, or the saved one
+    is broken.
+    """
+    try:
+        res = s3.get_object(
+            Bucket=SOURCE_BUCKET_NAME,
+            Key=DIMENSION_SNAPSHOT_KEY,
+        )
+    except s3.exceptions.NoSuchKey:
+        LOGGER.debug('creating dimension snapshot: %s', DIMENSION_SNAPSHOT_KEY)
+        return dimensions.DimensionSnapshot({})
+    try:
+        return dimensions.load_dimension_snapshot(res['Body'].read())
+    except ValueError as exc:
+        LOGGER.error('recreating broken dimension snapshot: %s', str(exc))
+        return dimensions.DimensionSnapshot({})
+
+
+def refresh_dimension_snapshot():
+    """Adds new values in the dimension tables to the snapshot of the
+    dimension tables.
+
+    Queries only values whose IDs are greater than the maximum ID of each
+    dimension in the snapshot.
+    Exports an entire dimension again if the number of values does not add
+    up, because IDENTITY values may not increase in the order of inserts.
+    """
+    snapshot = read_dimension_snapshot()
+    empty_table = dimensions.create_dimension_table([])
+    current_tables = {
+        dimension.table_name:
+            snapshot.tables.get(dimension.table_name, empty_table)
+                for dimension in dimensions.DIMENSIONS
+    }
+    new_values: Dict[str, List[Tuple[bytes, int]]] = {
+        dimension.table_name: [] for dimension in dimensions.DIMENSIONS
+    }
+    records = execute_query(' UNION ALL '.join(
+        ''.join([
+            f"SELECT '{dimension.table_name}', id, {dimension.value_column}",
+            f'  FROM {dimension.table_name}',
+            f'  WHERE id > {current_tables[dimension.table_name].max_id:d}',
+            f'    AND {dimension.value_column} IS NOT NULL',
+        ]) for dimension in dimensions.DIMENSIONS
+    ))
+    for table_name, value_id, value in records:
+        new_values[table_name].append((value.encode('utf-8'), value_id))
+    records = execute_query(' UNION ALL '.join(
+        ''.join([
+            f"SELECT '{dimension.table_name}',",
+            f'  COUNT(DISTINCT {dimension.value_column})',
+            f'  FROM {dimension.table_name}',
+        ]) for dimension in dimensions.DIMENSIONS
+    ))
+    stale_dimensions = []
+    for table_name, count in records:
+        expected_count = len(current_tables[table_name]) \
+            + len(new_values[table_name])
+        if count != expected_count:
+            LOGGER.warning(
+                'exporting %s again: %d values but %d expected',
+                table_name,
+                count,
+                expected_count,
+            )
+            current_tables[table_name] = empty_table
+            stale_dimensions.append(next(
+                dimension for dimension in dimensions.DIMENSIONS
+                    if dimension.table_name == table_name
+            ))
+    if len(stale_dimensions) > 0:
+        for dimension in stale_dimensions:
+            new_values[dimension.table_name] = []
+        records = execute_query(' UNION ALL '.join(
+            ''.join([
+                f"SELECT '{dimension.table_name}', id,",
+                f'  {dimension.value_column}',
+                f'  FROM {dimension.table_name}',
+                f'  WHERE {dimension.value_column} IS NOT NULL',
+            ]) for dimension in stale_dimensions
+        ))
+        for table_name, value_id, value in records:
+            new_values[table_name].append((value.encode('utf-8'), value_id))
+    snapshot = dimensions.DimensionSnapshot({
+        table_name: dimensions.create_dimension_table(itertools.chain(
+            table.items(),
+            new_values[table_name],
+        )) for table_name, table in current_tables.items()
+    })
+    s3.put_object(
+        Bucket=SOURCE_BUCKET_NAME,
+        Key=DIMENSION_SNAPSHOT_KEY,
+        Body=snapshot.to_bytes(),
+        ContentType='application/octet-stream',
+    )
+    LOGGER.debug(
+        'saved dimension snapshot: %s',
+        ', '.join(
+            f'{table_name} {len(table)}'
+                for table_name, table in snapshot.tables.items()
+        ),
+    )
+
+
+def capture_load_plans(date: datetime.datetime) -> Dict[str, plans.Plan]:
+    """Captures the query plans of the statements loading access logs on a
+    given date.
+
+    Runs the stages of a load of up to ``MAX_OBJECTS_PER_LOAD`` objects of a
+    single CloudFront distribution on ``date`` in a Data API session
+    statement by statement, whether or not the objects have been loaded.
+    Statements that only write staging tables are executed so that the
+    following statements are planned on actual data, and the other
+    statements are only explained; please refer to ``is_staging_statement``.
+    Inserts into monthly access log tables are explained as inserts into the
+    template table; please refer to ``get_plan_statement``.
+    Drops the staging tables at the end.
+
+    :returns: plans keyed by the labels of the statements; please refer to
+    ``libdatawarehouse.plans``.
+    """
+    objects = sorted(
+        list_access_log_objects(date, date),
+        key=lambda obj: obj['Key'],
+    )
+    if len(objects) == 0:
+        raise DataWarehouseException(
+            f'no access logs to explain on {format_date(date)}',
+        )
+    distribution_id = get_distribution_id_of_objects(objects)
+    objects = [
+        obj for obj in objects
+            if get_partition_of_key(obj['Key']).distribution_id ==
+                distribution_id
+    ][:MAX_OBJECTS_PER_LOAD]
+    run_id = uuid.uuid4().hex
+    objects = add_parquet_column_counts(objects)
+    manifest_key = save_copy_manifest(run_id, objects)
+    LOGGER.debug(
+        'explaining load of %d objects in run %s',
+        len(objects),
+        run_id,
+    )
+    session = data_api.Session(
+        redshift_data,
+        REDSHIFT_WORKGROUP_NAME,
+        ACCESS_LOGS_DATABASE_NAME,
+    )
+    captured_plans: Dict[str, plans.Plan] = {}
+    try:
+        for stage in LOAD_STAGES:
+            sqls = [
+                get_plan_statement(sql)
+                    for sql in get_stage_script(
+                        stage,
+                        run_id,
+                        manifest_key,
+                        objects,
+                    )
+            ]
+            labels = plans.label_statements(stage, sqls)
+            for label, sql in zip(labels, sqls):
+                if is_explainable_statement(sql):
+                    explain_lines = [
+                        record[0] for record in
+                            execute_session_query(session, f'EXPLAIN {sql}')
+                    ]
+                    captured_plans[label] = plans.parse_plan(
+                        label,
+                        explain_lines,
+                    )
+                if is_staging_statement(sql):
+                    execute_session_statement(session, sql)
+    finally:
+        execute_session_statement(
+            session,
+            get_drop_tables_statement([
+                get_stage_table_name(run_id),
+                get_encoded_table_name(run_id),
+                get_run_object_table_name(run_id),
+            ]),
+        )
+    return captured_plans
+
+
+def get_plan_statement(sql: str) -> str:
+    """Returns a given SQL statement to be labeled and explained in place of
+    the statement.
+
+    Replaces the monthly access log table that a statement inserts into with
+    the template table, because the monthly table does not exist until the
+    stored procedure creates it, which is never called while capturing
+    plans.
+    Monthly tables are created after the template, so their plans are the
+    same, and the label no longer depends on the month.
+    Other statements are returned as they are.
+    """
+    return MONTHLY_INSERT_PATTERN.sub(
+        f'INSERT INTO {tables.ACCESS_LOG_TEMPLATE_TABLE_NAME}',
+        sql,
+    )
+
+
+def is_explainable_statement(sql: str) -> bool:
+    """Returns whether ``EXPLAIN`` accepts a given SQL statement.
+    """
+    return sql.startswith(('SELECT', 'INSERT', 'DELETE', 'UPDATE')) \
+        or (sql.startswith('CREATE TABLE') and ' AS SELECT' in sql)
+
+
+def is_staging_statement(sql: str) -> bool:
+    """Returns whether a given SQL statement writes only staging tables.
+
+    Staging tables are created and dropped by the scripts themselves, so
+    other tables are never written while capturing plans.
+    """
+    return sql.startswith(('COPY', 'CREATE TABLE', 'DROP TABLE')) \
+        or sql.startswith('DELETE FROM #')
+
+
+def execute_session_statement(session: data_api.Session, sql: str) -> str:
+    """Runs a given SQL statement in a given Data API session.
+
+    :returns: ID of the statement.
+    """
+    statement_id = session.execute_statement(sql)
+    status, res = data_api.wait_for_results(redshift_data, statement_id)
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            LOGGER.error('failed to run statement: %s', str(res))
+        raise DataWarehouseException(
+            f'failed to run statement: {status or "timeout"}',
+        )
+    return statement_id
+
+
+def execute_session_query(
+    session: data_api.Session,
+    sql: str,
+) -> Iterator[Tuple]:
+    """Runs a given query in a given Data API session and iterates over the
+    records in the results.
+    """
+    statement_id = execute_session_statement(session, sql)
+    return data_api.iterate_results(redshift_data, statement_id)
+
+
+def load_new_access_logs(
+    start_date: datetime.datetime,
+    end_date: datetime.datetime,
+    max_concurrency: int,
+    get_remaining_time: Callable[[], float],
+    max_objects: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Loads access logs on dates in a given range that have not been loaded
+    yet.
+
+    Resumes unfinished runs before listing new access logs, and the load
+    metrics include those of the resumed runs.
+
+    :param datetime.datetime start_date: first date in the range.
+
+    :param datetime.datetime end_date: last date in the range (inclusive).
+
+    :param int max_concurrency: maximum number of Data API batches running
+    concurrently.
+
+    :param Callable[[], float] get_remaining_time: returns the remaining time
+    of the Lambda function in seconds.
+
+    :param Optional[int] max_objects: maximum number of S3 objects to load.
+    Oldest objects are loaded first, and the rest are counted in ``pending``.
+    No limit if omitted.
+
+    :returns: ``dict`` of the load metrics; please refer to
+    ``load_access_log_objects``.
+    """
+    res = redshift.get_credentials(
+        workgroupName=REDSHIFT_WORKGROUP_NAME,
+        dbName=ACCESS_LOGS_DATABASE_NAME,
+    )
+    LOGGER.debug('accessing database as %s', res['dbUser'])
+    results = resume_unfinished_runs(get_remaining_time)
+    objects = list_new_access_log_objects(start_date, end_date)
+    if len(objects) == 0:
+        LOGGER.debug(
+            'no new access logs from %s to %s',
+            format_date(start_date),
+            format_date(end_date),
+        )
+        return results
+    num_excess_objects = 0
+    if max_objects is not None and len(objects) > max_objects:
+        objects.sort(key=lambda obj: obj['LastModified'])
+        num_excess_objects = len(objects) - max_objects
+        objects = objects[:max_objects]
+    LOGGER.debug(
+        'loading %d new objects from %s to %s',
+        len(objects),
+        format_date(start_date),
+        format_date(end_date),
+    )
+    new_results = load_access_log_objects(
+        objects,
+        max_concurrency,
+        get_remaining_time,
+    )
+    new_results['pending'] += num_excess_objects
+    merge_load_results(results, new_results)
+    return results
+
+
+@profiling.profile_handler(
+    PROFILE_BUCKET_NAME,
+    PROFILE_KEY_PREFIX,
+    PROFILE_SAMPLE_RATE,
+)
+def lambda_handler(event, context):
     """Loads CloudFront access logs onto the data warehouse.
 
     This function is indented to be invoked by Amazon EventBridge.
@@ -553,24 +2332,141 @@ def lambda_handler(event, _):
 
     Loads CloudFront access logs on the day before the date specified to
     ``time``.
+    Also loads access logs that have arrived late on the ``LATE_ARRIVAL_DAYS``
+    days before the date specified to ``time``.
+    Every S3 object of access logs is loaded only once.
+
+    You can also backfill access logs on dates in a range by specifying
+    ``startDate`` and ``endDate`` (inclusive) instead of ``time``.
+    ``maxConcurrency`` is the maximum number of Data API batches running at
+    once and optional.
+
+    .. code-block:: python
+
+        {
+            'startDate': '2020-04-01',
+            'endDate': '2020-04-27',
+            'maxConcurrency': 2
+        }
+
+    If ``microBatch`` is ``True`` in addition to ``time``, loads new access
+    logs on the date specified to ``time`` and the day before in a single Data
+    API batch of at most ``MAX_OBJECTS_PER_LOAD`` objects.
+    This mode is intended to be scheduled at short intervals to keep the
+    data warehouse fresh.
+
+    .. code-block:: python
+
+        {
+            'time': '2020-04-28T07:20:20Z',
+            'microBatch': True
+        }
+
+    If ``explainDate`` is given instead of ``time``, captures the query plans
+    of a load of access logs on the date without loading them, and returns
+    the plans in ``plans``; please refer to ``capture_load_plans``.
+    ``bin/check-load-plans.py`` compares the plans with recorded ones.
+
+    .. code-block:: python
+
+        {
+            'explainDate': '2020-04-27'
+        }
+
+    If ``profile`` is ``True``, profiles the invocation and saves the profile
+    under ``PROFILE_KEY_PREFIX``; please refer to
+    ``libdatawarehouse.profiling``.
+
+    A daily run drops monthly access log tables older than
+    ``RETENTION_MONTHS`` months unless ``RETENTION_MONTHS`` is ``0``, and
+    deletes the rows of the same months from the rollup, sample, and sketch
+    tables.
+
+    Starts VACUUM after every daily run and after a backfill that has loaded
+    any access logs, but never after a micro-batch run to prevent VACUUM from
+    running over and over.
+
+    Records the numbers of rows changed per table in
+    ``tables.CHANGED_ROW_COUNT_TABLE_NAME`` after every run including a
+    micro-batch run so that the VACUUM workflow can decide which tables to
+    ANALYZE by the rows changed since they were last analyzed.
+
+    Refreshes the snapshot of the dimension tables after any access logs have
+    been loaded unless ``DIMENSION_SNAPSHOT_KEY`` is empty; please refer to
+    ``libdatawarehouse.dimensions``.
+
+    Returns the load metrics; please refer to ``load_access_log_objects`` for
+    details.
+    Objects counted in ``pending`` could not be loaded in time, and they will
+    be loaded in the next run.
     """
     LOGGER.debug('loading access logs: %s', str(event))
-    invocation_date = parse_time(event['time'])
-    target_date = invocation_date - datetime.timedelta(days=1)
-    if has_access_logs(target_date):
-        LOGGER.debug('loading access logs on %s', str(target_date))
-        res = redshift.get_credentials(
-            workgroupName=REDSHIFT_WORKGROUP_NAME,
-            dbName=ACCESS_LOGS_DATABASE_NAME,
+
+    def get_remaining_time() -> float:
+        return context.get_remaining_time_in_millis() * 0.001
+
+    if 'explainDate' in event:
+        captured_plans = capture_load_plans(parse_date(event['explainDate']))
+        return {
+            'plans': [plan.to_dict() for plan in captured_plans.values()],
+        }
+    if 'startDate' in event:
+        results = load_new_access_logs(
+            parse_date(event['startDate']),
+            parse_date(event['endDate']),
+            int(event.get('maxConcurrency', DEFAULT_MAX_CONCURRENCY)),
+            get_remaining_time,
         )
-        LOGGER.debug('accessing database as %s', res['dbUser'])
-        execute_load_script(target_date)
+        should_vacuum = results['loaded'] > 0
+    elif event.get('microBatch', False):
+        invocation_date = parse_time(event['time'])
+        results = load_new_access_logs(
+            invocation_date - datetime.timedelta(days=1),
+            invocation_date,
+            1,
+            get_remaining_time,
+            max_objects=MAX_OBJECTS_PER_LOAD,
+        )
+        should_vacuum = False
+    else:
+        invocation_date = parse_time(event['time'])
+        results = load_new_access_logs(
+            invocation_date - datetime.timedelta(days=LATE_ARRIVAL_DAYS + 1),
+            invocation_date - datetime.timedelta(days=1),
+            int(event.get('maxConcurrency', DEFAULT_MAX_CONCURRENCY)),
+            get_remaining_time,
+        )
+        # micro-batch runs may have loaded access logs since the last VACUUM
+        # even if this run has loaded nothing
+        should_vacuum = True
+        if RETENTION_MONTHS > 0:
+            add_changed_rows(
+                results['changedRows'],
+                drop_expired_access_logs(invocation_date),
+            )
+    if len(results['changedRows']) > 0:
+        # the counts only decide which tables to ANALYZE,
+        # so a failure does not fail the load
+        try:
+            execute_statement(
+                get_insert_changed_rows_statement(results['changedRows']),
+            )
+        except (DataWarehouseException, ClientError) as exc:
+            LOGGER.error('failed to record changed rows: %s', str(exc))
+    if len(DIMENSION_SNAPSHOT_KEY) > 0 and results['loaded'] > 0:
+        # an outdated snapshot only leaves more values to encode in SQL,
+        # so a failure does not fail the load
+        try:
+            refresh_dimension_snapshot()
+        except (DataWarehouseException, ClientError) as exc:
+            LOGGER.error('failed to refresh dimension snapshot: %s', str(exc))
+    if should_vacuum:
         # we need VACUUM to sort the updated tables.
         # runs VACUUM in a different session (e.g., Step Functions) because,
         # - VACUUM needs an owner or superuser privilege
         # - VACUUM is time consuming
         # - only one VACUUM can run at the same time
-        start_vacuum()
-    else:
-        LOGGER.debug('no access logs on %s', str(target_date))
-    return {}
+        # the workflow also runs ANALYZE to update the statistics of the
+        # updated tables, which needs an owner or superuser privilege as well.
+        start_vacuum(results)
+    return results
@@ -9,33 +9,141 @@ You have to specify the following environment variables,
   logs files are to be written.
 * DESTINATION_KEY_PREFIX: prefix to be prepended to the keys of objects in the
   destination bucket.
+* QUARANTINE_KEY_PREFIX: prefix to be prepended to the keys of objects of
+  rejected rows in the destination bucket. Must not overlap
+  DESTINATION_KEY_PREFIX.
+* DUPLICATE_FILTER_KEY_PREFIX: prefix of the keys of objects of the duplicate
+  filters in the destination bucket. Must not overlap DESTINATION_KEY_PREFIX.
+* DUPLICATE_FILTER_CAPACITY: expected maximum number of access log records
+  per day.
+* OUTPUT_FORMAT: format of masked access logs files, ``tsv`` (gzipped TSV) or
+  ``parquet``. ``parquet`` requires pyarrow, which is not bundled with this
+  function but provided by a separate Lambda layer.
+* PARTITION_GRANULARITY: granularity of time buckets into which masked access
+  logs files are partitioned, ``day`` or ``hour``.
+* DUPLICATE_FALSE_POSITIVE_RATE: rate at which the duplicate filter mistakes
+  a unique record for a duplicate when it holds DUPLICATE_FILTER_CAPACITY
+  records.
+* PROFILE_BUCKET_NAME: name of the S3 bucket where profiles of invocations
+  are saved.
+* PROFILE_KEY_PREFIX: prefix of the keys of objects of profiles.
+* PROFILE_SAMPLE_RATE: fraction of invocations to be profiled. ``0`` disables
+  profiling.
+* DIMENSION_SNAPSHOT_KEY: key of the object of the snapshot of the dimension
+  tables in the destination bucket. An empty string disables pre-encoding.
 """
 
 import array
 import csv
+import datetime
 import gzip
 import io
 import ipaddress
 import json
 import logging
 import os
+import struct
 import time
+import zlib
 from contextlib import contextmanager
-from typing import Dict, Iterable, Iterator, Sequence, TextIO
-import boto3
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Union,
+)
 from botocore.exceptions import ClientError
+from libdatawarehouse import (
+    bloom,
+    clients,
+    columnar,
+    dimensions,
+    integrity,
+    partitions,
+    profiling,
+    tables,
+)
 
 
 SOURCE_BUCKET_NAME = os.environ['SOURCE_BUCKET_NAME']
 DESTINATION_BUCKET_NAME = os.environ['DESTINATION_BUCKET_NAME']
 DESTINATION_KEY_PREFIX = os.environ['DESTINATION_KEY_PREFIX']
+QUARANTINE_KEY_PREFIX = os.environ['QUARANTINE_KEY_PREFIX']
+OUTPUT_FORMAT = os.environ['OUTPUT_FORMAT']
+PARTITION_GRANULARITY = os.environ['PARTITION_GRANULARITY']
+DUPLICATE_FILTER_KEY_PREFIX = os.environ['DUPLICATE_FILTER_KEY_PREFIX']
+DUPLICATE_FILTER_CAPACITY = int(os.environ['DUPLICATE_FILTER_CAPACITY'])
+DUPLICATE_FALSE_POSITIVE_RATE = float(
+    os.environ['DUPLICATE_FALSE_POSITIVE_RATE'],
+)
+PROFILE_BUCKET_NAME = os.environ['PROFILE_BUCKET_NAME']
+PROFILE_KEY_PREFIX = os.environ['PROFILE_KEY_PREFIX']
+PROFILE_SAMPLE_RATE = float(os.environ['PROFILE_SAMPLE_RATE'])
+DIMENSION_SNAPSHOT_KEY = os.environ['DIMENSION_SNAPSHOT_KEY']
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
-s3 = boto3.resource('s3')
-source_bucket = s3.Bucket(SOURCE_BUCKET_NAME)
-destination_bucket = s3.Bucket(DESTINATION_BUCKET_NAME)
+s3 = clients.LazyClient('s3')
+
+# formats of masked access logs files.
+TSV_FORMAT = 'tsv'
+PARQUET_FORMAT = 'parquet'
+OUTPUT_FORMATS = [TSV_FORMAT, PARQUET_FORMAT]
+if OUTPUT_FORMAT not in OUTPUT_FORMATS:
+    raise ValueError(f'invalid OUTPUT_FORMAT: {OUTPUT_FORMAT}')
+if PARTITION_GRANULARITY not in partitions.GRANULARITIES:
+    raise ValueError(f'invalid PARTITION_GRANULARITY: {PARTITION_GRANULARITY}')
+
+# reason codes of rejected rows.
+REJECT_MISSING_DATE = 'MISSING_DATE'
+REJECT_INVALID_DATE = 'INVALID_DATE'
+REJECT_INVALID_TIME = 'INVALID_TIME'
+REJECT_INVALID_C_IP = 'INVALID_C_IP'
+REJECT_INVALID_X_FORWARDED_FOR = 'INVALID_X_FORWARDED_FOR'
+REJECT_EXTRA_FIELDS = 'EXTRA_FIELDS'
+REJECT_DUPLICATE = 'DUPLICATE'
+REJECT_INVALID_VALUE = 'INVALID_VALUE'
+
+# column of the unique ID of a request.
+REQUEST_ID_COLUMN = 'x-edge-request-id'
+
+# fields of values to be pre-encoded, and their dimensions.
+DIMENSION_FIELDS = [
+    ('x-edge-location', dimensions.EDGE_LOCATION_DIMENSION),
+    ('cs-uri-stem', dimensions.PAGE_DIMENSION),
+    ('cs(Referer)', dimensions.REFERER_DIMENSION),
+    ('cs(User-Agent)', dimensions.USER_AGENT_DIMENSION),
+    ('x-edge-response-result-type', dimensions.RESULT_TYPE_DIMENSION),
+]
+
+# characters that make the TSV writer quote a value, which COPY does not
+# unquote. values containing them are left to load-access-logs.
+QUOTED_CHARACTERS = ['"', '\t', '\r', '\n']
+
+# seconds between checks for an update of the dimension snapshot.
+DIMENSION_SNAPSHOT_CHECK_INTERVAL = 60.0
+
+# columns of IP addresses to be masked, and the reason codes of rejected rows
+# in which they are invalid.
+IP_ADDRESS_COLUMNS = [
+    ('c-ip', REJECT_INVALID_C_IP),
+    ('x-forwarded-for', REJECT_INVALID_X_FORWARDED_FOR),
+]
+
+
+class RowRejected(Exception):
+    """Raised when a row in CloudFront access logs is rejected.
+    """
+    def __init__(self, reason: str):
+        """Initializes with the reason code.
+        """
+        super().__init__(reason)
+        self.reason = reason
 
 
 def translate_logs(logs_in: Iterable[str]) -> Iterator[str]:
@@ -65,13 +173,23 @@ def translate_logs(logs_in: Iterable[str]) -> Iterator[str]:
 
 def mask_row(row: Dict[str, str]) -> Dict[str, str]:
     """Masks a given row in CloudFront access logs.
+
+    An invalid IP address is replaced with ``-`` so that ``row`` never
+    retains an unmasked IP address even if it is rejected.
+
+    :raises RowRejected: if any of the IP addresses is invalid.
     """
-    addr = row['c-ip']
-    if addr != '-':
-        row['c-ip'] = mask_ip_address(addr)
-    addr = row['x-forwarded-for']
-    if addr != '-':
-        row['x-forwarded-for'] = mask_ip_address(addr)
+    reason = None
+    for column, invalid_reason in IP_ADDRESS_COLUMNS:
+        addr = row[column]
+        if addr != '-':
+            try:
+                row[column] = mask_ip_address(addr)
+            except ValueError:
+                row[column] = '-'
+                reason = reason or invalid_reason
+    if reason is not None:
+        raise RowRejected(reason)
     return row
 
 
@@ -120,12 +238,34 @@ def process_logs(src_key: str, logs_in: Iterator[str]):
     column_names = tsv_in.fieldnames
     if column_names is None:
         raise ValueError('no field names are specified in the input')
-    with LogDispatcher(src_key, column_names) as dispatcher:
+    with LogDispatcher(
+        src_key,
+        column_names,
+        dimension_snapshot_cache.get(),
+    ) as dispatcher:
         for row in tsv_in:
-            row = mask_row(row)
+            # DictReader puts extra fields in a list at None
+            if None in row:
+                del row[None]
+                extra_fields = True
+            else:
+                extra_fields = False
+            try:
+                row = mask_row(row)
+            except RowRejected as exc:
+                dispatcher.reject(row, exc.reason)
+                continue
+            if extra_fields:
+                dispatcher.reject(row, REJECT_EXTRA_FIELDS)
+                continue
             dispatcher.writerow(row)
 
 
+@profiling.profile_handler(
+    PROFILE_BUCKET_NAME,
+    PROFILE_KEY_PREFIX,
+    PROFILE_SAMPLE_RATE,
+)
 def lambda_handler(event, _):
     """Masks information in given CloudFront access logs files on S3.
 
@@ -137,12 +277,16 @@ def lambda_handler(event, _):
 
     This handler masks information in the given S3 objects and stores masked
     results into the S3 bucket specified by ``DESTINATION_BUCKET_NAME`` with
-    the same object key but with ``DESTINATION_KEY_PREFIX``, year, month, and
-    date prefixed.
+    the same object key but with ``DESTINATION_KEY_PREFIX``, CloudFront
+    distribution ID, year, month, and date prefixed.
 
-    ``{DESTINATION_KEY_PREFIX}{year}/{month}/{date}/{key}``
+    ``{DESTINATION_KEY_PREFIX}{distribution_id}/{year}/{month}/{date}/{key}``
 
-    where ``year``, ``month``, and ``date`` are the timestamp of a log record.
+    where ``distribution_id`` is parsed out of ``key``, and ``year``,
+    ``month``, and ``date`` are the timestamp of a log record.
+    ``{distribution_id}/`` is omitted if ``key`` has no distribution ID.
+    If ``PARTITION_GRANULARITY`` is ``hour``, the hour of a log record is also
+    prefixed; i.e., ``{date}/{hour}/{key}``.
     """
     for record in event['Records']:
         try:
@@ -197,10 +341,9 @@ def process_s3_object(s3_object):
     if key is None:
         LOGGER.error('no object key in S3 object event: %s', str(s3_object))
         return
-    src = source_bucket.Object(key)
     try:
-        results = src.get()
-    except s3.meta.client.exceptions.NoSuchKey:
+        results = s3.get_object(Bucket=SOURCE_BUCKET_NAME, Key=key)
+    except s3.exceptions.NoSuchKey:
         LOGGER.debug('object "%s" no longer exists', key)
         return
     with open_body(results) as body:
@@ -210,18 +353,33 @@ def process_s3_object(s3_object):
 
 class S3OutputStream(io.RawIOBase):
     """File object that can write an S3 object.
+
+    Computes the CRC32 checksums of every part and the entire object while
+    writing, and sends them to S3 as additional checksums.
+    An object that fits in a single part is put in a single request on
+    ``close``, and a larger object is uploaded in multiple parts.
+    ``close`` records ``row_count`` and the checksum of the entire object in
+    the metadata; please refer to ``libdatawarehouse.integrity``.
     """
 
     MIN_PART_SIZE_IN_BYTES = 5 * 1024 * 1024 # 5MB
 
-    def __init__(self, dest_object):
-        self.dest_object = dest_object
-        # initiates the multipart upload
-        self.multipart_upload = self.dest_object.initiate_multipart_upload(
-            ServerSideEncryption='AES256',
-        )
-        self.uploaded_part_etags = []
+    row_count: int
+    """Number of rows written; writers have to update this."""
+
+
+    def __init__(self, bucket_name: str, key: str):
+        self.bucket_name = bucket_name
+        self.key = key
+        # initiates a multipart upload when the first part is full
+        self.upload_id = None
+        self.uploaded_parts = []
         self.part_buffer = array.array('B')
+        self.part_crc32 = 0
+        self.crc32 = 0
+        self.position = 0
+        self.row_count = 0
+        self.finished = False
 
 
     def writable(self):
@@ -229,78 +387,177 @@ class S3OutputStream(io.RawIOBase):
 
 
     def write(self, b):
-        # appends to the part buffer
+        # appends to the part buffer, and updates the checksums on the way so
+        # that no second pass over the data is necessary
         self.part_buffer.extend(b)
+        self.part_crc32 = zlib.crc32(b, self.part_crc32)
+        self.crc32 = zlib.crc32(b, self.crc32)
+        self.position += len(b)
         if len(self.part_buffer) >= S3OutputStream.MIN_PART_SIZE_IN_BYTES:
             self.upload_part()
         return len(b)
 
 
+    def tell(self):
+        """Returns the number of bytes written so far.
+
+        Parquet writers need this.
+        """
+        return self.position
+
+
     def upload_part(self):
         """Uploads the buffered part and flushes the buffer.
+
+        Initiates the multipart upload if it has not been initiated yet.
         """
+        if self.upload_id is None:
+            res = s3.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                ServerSideEncryption='AES256',
+                ChecksumAlgorithm='CRC32',
+                Metadata={
+                    integrity.ROWS_METADATA_KEY: integrity.PENDING_ROWS,
+                },
+            )
+            self.upload_id = res['UploadId']
         part_number = self.next_part_number
         LOGGER.debug(
             'multipart upload [%d]: size=%d',
             part_number,
             len(self.part_buffer),
         )
-        # according to the boto3 documentation,
-        # Part requires an str for its parameter, but actually an int.
-        part = self.multipart_upload.Part(part_number)
-        res = part.upload(Body=self.part_buffer.tobytes())
-        self.uploaded_part_etags.append(res['ETag'])
+        checksum = integrity.encode_crc32(self.part_crc32)
+        res = s3.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=self.part_buffer.tobytes(),
+            ChecksumAlgorithm='CRC32',
+            ChecksumCRC32=checksum,
+        )
+        self.uploaded_parts.append({
+            'ETag': res['ETag'],
+            'ChecksumCRC32': checksum,
+        })
         # resets the part buffer
         self.part_buffer = array.array('B')
+        self.part_crc32 = 0
 
 
     @property
     def next_part_number(self):
         """Next part number.
         """
-        return len(self.uploaded_part_etags) + 1 # part number from 1
+        return len(self.uploaded_parts) + 1 # part number from 1
 
 
     def close(self):
-        """Completes the multipart upload.
+        """Completes the upload.
         """
-        if self.multipart_upload is not None:
-            LOGGER.debug('closing the multipart upload')
-            try:
-                # uploads the last part if it remains
-                if len(self.part_buffer) > 0:
-                    self.upload_part()
-                # lists parts and completes
-                part_list = [
-                    {
-                        'ETag': etag,
-                        'PartNumber': i + 1,
-                    } for (i, etag) in enumerate(self.uploaded_part_etags)
-                ]
-                self.multipart_upload.complete(
-                    MultipartUpload={
-                        'Parts': part_list,
-                    },
-                )
-            except:
-                LOGGER.warning(
-                    'aborting the multipart upload (as close failed)',
-                )
-                self.multipart_upload.abort()
-                raise
-            finally:
-                self.multipart_upload = None
+        if self.finished:
+            return
+        LOGGER.debug('closing the upload')
+        metadata = integrity.get_masked_object_metadata(
+            self.row_count,
+            self.crc32,
+        )
+        try:
+            if self.upload_id is None:
+                self.put_object(metadata)
+            else:
+                self.complete_multipart_upload(metadata)
+        finally:
+            self.finished = True
+
+
+    def put_object(self, metadata: Dict[str, str]):
+        """Puts the buffered object in a single request.
+        """
+        s3.put_object(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            Body=self.part_buffer.tobytes(),
+            ServerSideEncryption='AES256',
+            ChecksumAlgorithm='CRC32',
+            ChecksumCRC32=integrity.encode_crc32(self.crc32),
+            Metadata=metadata,
+        )
+
+
+    def complete_multipart_upload(self, metadata: Dict[str, str]):
+        """Completes the multipart upload and records given metadata.
+
+        S3 cannot change the metadata of an existing object, so copies the
+        object onto itself with the metadata.
+        The copy also makes S3 compute the checksum of the entire object
+        instead of the checksum of the checksums of the parts.
+        The copy requires read permission on the key in addition to put
+        permission, including keys of quarantine files.
+        """
+        try:
+            # uploads the last part if it remains
+            if len(self.part_buffer) > 0:
+                self.upload_part()
+            # lists parts and completes
+            part_list = [
+                {
+                    'ETag': part['ETag'],
+                    'ChecksumCRC32': part['ChecksumCRC32'],
+                    'PartNumber': i + 1,
+                } for (i, part) in enumerate(self.uploaded_parts)
+            ]
+            s3.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={
+                    'Parts': part_list,
+                },
+            )
+        except:
+            LOGGER.warning(
+                'aborting the multipart upload (as close failed)',
+            )
+            self.abort_multipart_upload()
+            raise
+        s3.copy_object(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            CopySource={
+                'Bucket': self.bucket_name,
+                'Key': self.key,
+            },
+            MetadataDirective='REPLACE',
+            Metadata=metadata,
+            ServerSideEncryption='AES256',
+            ChecksumAlgorithm='CRC32',
+        )
 
 
     def abort(self):
-        """Aborts the multipart upload.
+        """Aborts the upload.
         """
-        if self.multipart_upload is not None:
-            LOGGER.debug('aborting the multipart upload')
-            try:
-                self.multipart_upload.abort()
-            finally:
-                self.multipart_upload = None
+        if self.finished:
+            return
+        try:
+            if self.upload_id is not None:
+                LOGGER.debug('aborting the multipart upload')
+                self.abort_multipart_upload()
+        finally:
+            self.finished = True
+
+
+    def abort_multipart_upload(self):
+        """Requests S3 to abort the multipart upload.
+        """
+        s3.abort_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+        )
 
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -316,7 +573,7 @@ class S3OutputStream(io.RawIOBase):
         """Calls ``abort``.
 
         You have to use ``with`` statement or explicitly call ``close`` to
-        complete the multipart upload.
+        complete the upload.
         """
         self.abort()
 
@@ -353,6 +610,13 @@ class GzippedTsvOnS3:
         return row_number
 
 
+    def writerow(self, row: Dict[str, str]):
+        """Writes a given row.
+        """
+        self.tsv_writer.writerow(row)
+        self.underlying.row_count += 1
+
+
     def close(self):
         """Completes the upload of the CSV file.
         """
@@ -388,81 +652,359 @@ class GzippedTsvOnS3:
             )
 
 
+class ParquetOnS3:
+    """Parquet file in an S3 bucket.
+
+    Converts text values into typed columns of
+    ``tables.RAW_ACCESS_LOG_TABLE`` once, and writes them in row groups, so
+    that COPY can load the file into the table without parsing text.
+    """
+
+    ROW_GROUP_SIZE = 50000
+
+    underlying: S3OutputStream
+    buffer: columnar.RowGroupBuffer
+    _next_row_number: int
+
+
+    def __init__(
+        self,
+        underlying: S3OutputStream,
+        column_names: Sequence[str],
+    ):
+        """Initializes with the underlying stream and the names of the
+        fields of rows in the order of the columns of
+        ``tables.RAW_ACCESS_LOG_TABLE``.
+        """
+        import pyarrow.parquet
+        self.underlying = underlying
+        self.column_names = column_names
+        self.buffer = columnar.RowGroupBuffer(tables.RAW_ACCESS_LOG_TABLE)
+        self.parquet_writer = pyarrow.parquet.ParquetWriter(
+            underlying,
+            self.buffer.schema,
+            compression='snappy',
+        )
+        self._next_row_number = 1
+
+
+    def next_row_number(self) -> int:
+        """Returns the next row number.
+
+        Every call of this method increments the row number.
+        """
+        row_number = self._next_row_number
+        self._next_row_number += 1
+        return row_number
+
+
+    def writerow(self, row: Dict[str, str]):
+        """Writes a given row.
+
+        :raises ValueError: if any of the values is invalid for its column.
+        """
+        self.buffer.append([row.get(name) for name in self.column_names])
+        self.underlying.row_count += 1
+        if len(self.buffer) >= ParquetOnS3.ROW_GROUP_SIZE:
+            self.parquet_writer.write_table(self.buffer.flush())
+
+
+    def close(self):
+        """Writes the remaining rows and completes the upload of the Parquet
+        file.
+        """
+        try:
+            if len(self.buffer) > 0:
+                self.parquet_writer.write_table(self.buffer.flush())
+            self.parquet_writer.close()
+        except (IOError, ValueError) as exc:
+            LOGGER.error('failed to write a Parquet file: %s', str(exc))
+            self.underlying.abort()
+        else:
+            try:
+                self.underlying.close()
+            except ClientError as exc:
+                LOGGER.error(
+                    'failed to finish an S3 object upload: %s',
+                    str(exc),
+                )
+
+
+    def abort(self):
+        """Aborts the upload of the Parquet file.
+        """
+        try:
+            self.underlying.abort()
+        except ClientError as exc:
+            LOGGER.error(
+                'failed to abort an S3 object upload: %s',
+                str(exc),
+            )
+
+
 class LogDispatcher:
     """Distributes access log records to S3 objects corresponding to their
-    dates.
+    CloudFront distribution and time buckets.
+
+    Rejected rows are written to a single quarantine object with their reason
+    codes.
 
     You should wrap this object in a ``with`` statement.
     """
 
     LOG_DATE_FORMAT = '%Y-%m-%d'
 
+    LOG_TIME_FORMAT = '%H:%M:%S'
+
     ROW_NUMBER_COLUMN = 'row_num'
 
-    dest_map: Dict[time.struct_time, GzippedTsvOnS3]
+    REJECT_REASON_COLUMN = 'reject_reason'
+
+    dest_map: Dict[partitions.Partition, Union[GzippedTsvOnS3, ParquetOnS3]]
+    quarantine: Optional[GzippedTsvOnS3]
+    rejection_counts: Dict[str, int]
+    seen_request_ids: Set[str]
+    duplicate_filters: Dict[time.struct_time, 'DuplicateFilter']
 
 
-    def __init__(self, src_key: str, column_names: Sequence[str]):
+    def __init__(
+        self,
+        src_key: str,
+        column_names: Sequence[str],
+        dimension_snapshot: Optional[dimensions.DimensionSnapshot],
+    ):
         """Initializes with the column names.
 
-        Prepends a column for row numbers to ``column_names``.
+        Prepends a column for row numbers to ``column_names``, and appends
+        columns of pre-encoded IDs.
+
+        :param Optional[dimensions.DimensionSnapshot] dimension_snapshot:
+        snapshot to pre-encode values with. ``None`` pre-encodes no values.
         """
         self.src_key = src_key
-        self.column_names = [LogDispatcher.ROW_NUMBER_COLUMN] + column_names
+        self.distribution_id = partitions.parse_distribution_id(src_key)
+        if self.distribution_id is None:
+            LOGGER.warning('no distribution ID in %s', src_key)
+        self.dimension_snapshot = dimension_snapshot
+        self.quarantine_column_names = [
+            LogDispatcher.REJECT_REASON_COLUMN,
+            LogDispatcher.ROW_NUMBER_COLUMN,
+            *column_names,
+        ]
+        self.column_names = [
+            LogDispatcher.ROW_NUMBER_COLUMN,
+            *column_names,
+            *(dimension.id_column for dimension in dimensions.DIMENSIONS),
+        ]
+        self.output_format = OUTPUT_FORMAT
+        raw_columns = tables.RAW_ACCESS_LOG_TABLE.columns
+        if self.output_format == PARQUET_FORMAT \
+            and len(self.column_names) != len(raw_columns):
+            LOGGER.warning(
+                'writing %s in TSV because its columns do not match %s',
+                src_key,
+                tables.RAW_ACCESS_LOG_TABLE.name,
+            )
+            self.output_format = TSV_FORMAT
         self.dest_map = {}
+        self.quarantine = None
+        self.rejection_counts = {}
+        self.seen_request_ids = set()
+        self.duplicate_filters = {}
 
 
     def writerow(self, row: Dict[str, str]):
         """Writes a given row into a matching S3 object.
 
-        Ignores an invalid row.
+        Rejects a row without a valid date, a row without a valid time if
+        partitioned by hour, a duplicate row, and a row that has an invalid
+        value for the Parquet format.
 
         Prepends a row number column to ``row``.
         """
+        date_str = row.get('date')
+        if date_str is None:
+            self.reject(row, REJECT_MISSING_DATE)
+            return
         try:
-            date = time.strptime(row['date'], LogDispatcher.LOG_DATE_FORMAT)
-        except KeyError:
-            LOGGER.warning('log record must have date: %s', str(row))
+            date = time.strptime(date_str, LogDispatcher.LOG_DATE_FORMAT)
         except ValueError:
-            LOGGER.warning('invalid date format: %s', row['date'])
+            self.reject(row, REJECT_INVALID_DATE)
         else:
-            dest = self.get_destination(date)
+            hour = 0
+            if PARTITION_GRANULARITY == partitions.HOUR_GRANULARITY:
+                hour = parse_hour(row.get('time'))
+                if hour is None:
+                    self.reject(row, REJECT_INVALID_TIME)
+                    return
+            if self.is_duplicate(date, row):
+                self.reject(row, REJECT_DUPLICATE)
+                return
+            dest = self.get_destination(partitions.get_partition(
+                datetime.date(date.tm_year, date.tm_mon, date.tm_mday),
+                hour,
+                PARTITION_GRANULARITY,
+                self.distribution_id,
+            ))
             ext_row = row.copy()
             ext_row.update({
                 LogDispatcher.ROW_NUMBER_COLUMN: f'{dest.next_row_number():d}',
             })
-            dest.tsv_writer.writerow(ext_row)
+            self.encode_dimensions(ext_row)
+            try:
+                dest.writerow(ext_row)
+            except ValueError:
+                self.reject(row, REJECT_INVALID_VALUE)
+
+
+    def is_duplicate(
+        self,
+        date: time.struct_time,
+        row: Dict[str, str],
+    ) -> bool:
+        """Returns whether a given row duplicates a row that has been
+        written.
+
+        Checks rows in the same file exactly, and rows in other files by the
+        duplicate filter of ``date``, which may give a false positive.
+        A row without a request ID is never a duplicate.
+        """
+        request_id = row.get(REQUEST_ID_COLUMN)
+        if request_id is None or request_id == '-':
+            return False
+        if request_id in self.seen_request_ids:
+            return True
+        self.seen_request_ids.add(request_id)
+        duplicate_filter = self.get_duplicate_filter(date)
+        if self.src_key in duplicate_filter.processed_keys:
+            # the same file is processed again; e.g., an SQS redelivery.
+            # the filter has its rows, so reproduces the same output
+            return False
+        if request_id in duplicate_filter.bloom_filter:
+            return True
+        duplicate_filter.bloom_filter.add(request_id)
+        return False
 
 
-    def get_destination(self, date: time.struct_time) -> GzippedTsvOnS3:
-        """Obtains the output stream corresponding to a given date.
+    def encode_dimensions(self, row: Dict[str, str]):
+        """Adds the pre-encoded IDs of values in a given row.
+
+        An ID is ``-`` (NULL) if the value is not in the dimension snapshot.
+        """
+        for field_name, dimension in DIMENSION_FIELDS:
+            value = row.get(field_name)
+            value_id = None
+            if self.dimension_snapshot is not None \
+                and value is not None \
+                and not any(c in value for c in QUOTED_CHARACTERS):
+                value_id = self.dimension_snapshot.lookup(
+                    dimension.table_name,
+                    value,
+                )
+            row[dimension.id_column] = \
+                columnar.NULL_VALUE if value_id is None else str(value_id)
+
+
+    def reject(self, row: Dict[str, str], reason: str):
+        """Writes a given row into the quarantine object.
+
+        Prepends a reason code column and a row number column to ``row``.
+        """
+        self.rejection_counts[reason] = \
+            self.rejection_counts.get(reason, 0) + 1
+        quarantine = self.get_quarantine()
+        ext_row = row.copy()
+        ext_row.update({
+            LogDispatcher.REJECT_REASON_COLUMN: reason,
+            LogDispatcher.ROW_NUMBER_COLUMN:
+                f'{quarantine.next_row_number():d}',
+        })
+        quarantine.writerow(ext_row)
+
+
+    def get_destination(
+        self,
+        partition: partitions.Partition,
+    ) -> Union[GzippedTsvOnS3, ParquetOnS3]:
+        """Obtains the output stream corresponding to a given time bucket.
 
         Opens a new ``S3OutputStream`` if none has been opened yet.
         """
-        if date in self.dest_map:
-            return self.dest_map[date]
-        year = f'{date.tm_year:04d}'
-        month = f'{date.tm_mon:02d}'
-        mday = f'{date.tm_mday:02d}'
-        key = f'{DESTINATION_KEY_PREFIX}{year}/{month}/{mday}/{self.src_key}'
-        dest_stream = S3OutputStream(destination_bucket.Object(key))
-        dest_gzip = gzip.open(dest_stream, mode='wt')
-        dest_tsv = csv.DictWriter(
-            dest_gzip,
-            fieldnames=self.column_names,
-            delimiter='\t',
-        )
-        dest = GzippedTsvOnS3(dest_stream, dest_gzip, dest_tsv)
-        self.dest_map[date] = dest
-        dest_tsv.writeheader()
+        if partition in self.dest_map:
+            return self.dest_map[partition]
+        key = ''.join([
+            DESTINATION_KEY_PREFIX,
+            partition.get_prefix(),
+            self.src_key,
+        ])
+        if self.output_format == PARQUET_FORMAT:
+            dest = ParquetOnS3(
+                S3OutputStream(
+                    DESTINATION_BUCKET_NAME,
+                    f'{key}{columnar.PARQUET_SUFFIX}',
+                ),
+                self.column_names,
+            )
+        else:
+            dest = open_gzipped_tsv(key, self.column_names)
+        self.dest_map[partition] = dest
         return dest
 
 
+    def get_quarantine(self) -> GzippedTsvOnS3:
+        """Obtains the output stream of rejected rows.
+
+        Opens a new ``S3OutputStream`` if none has been opened yet.
+        """
+        if self.quarantine is None:
+            self.quarantine = open_gzipped_tsv(
+                f'{QUARANTINE_KEY_PREFIX}{self.src_key}',
+                self.quarantine_column_names,
+            )
+        return self.quarantine
+
+
+    def get_duplicate_filter(
+        self,
+        date: time.struct_time,
+    ) -> 'DuplicateFilter':
+        """Obtains the duplicate filter of a given date.
+
+        Loads the filter if it has not been loaded yet.
+        """
+        if date not in self.duplicate_filters:
+            self.duplicate_filters[date] = load_duplicate_filter(date)
+        return self.duplicate_filters[date]
+
+
     def close(self):
         """Completes log dispatch and S3 object uploads.
+
+        Saves the duplicate filters after the uploads.
         """
         for dest in self.dest_map.values():
             dest.close()
+        for duplicate_filter in self.duplicate_filters.values():
+            if self.src_key in duplicate_filter.processed_keys:
+                continue
+            duplicate_filter.processed_keys.add(self.src_key)
+            try:
+                duplicate_filter.save()
+            except ClientError as exc:
+                # only lets duplicates through next time
+                LOGGER.error(
+                    'failed to save the duplicate filter %s: %s',
+                    duplicate_filter.key,
+                    str(exc),
+                )
+        if self.quarantine is not None:
+            self.quarantine.close()
+            LOGGER.warning(
+                'rejected %d rows in %s: %s',
+                sum(self.rejection_counts.values()),
+                self.src_key,
+                str(self.rejection_counts),
+            )
 
 
     def abort(self):
@@ -470,6 +1012,8 @@ class LogDispatcher:
         """
         for dest in self.dest_map.values():
             dest.abort()
+        if self.quarantine is not None:
+            self.quarantine.abort()
 
 
     def __enter__(self):
@@ -484,6 +1028,213 @@ class LogDispatcher:
         return False
 
 
+class DuplicateFilter:
+    """Bloom filter of request IDs of access log records on a date, and the
+    keys of the files whose records have been added to it.
+
+    Saved as a single S3 object in the destination bucket.
+    Concurrent invocations processing the same date may overwrite each
+    other's updates, which only lets duplicates through but never drops a
+    unique record.
+    """
+
+    # header of a saved object; the length of the JSON list of processed keys.
+    # the Bloom filter follows the JSON list.
+    HEADER_FORMAT = '>I'
+
+    bloom_filter: bloom.BloomFilter
+    processed_keys: Set[str]
+
+
+    def __init__(
+        self,
+        key: str,
+        bloom_filter: bloom.BloomFilter,
+        processed_keys: Set[str],
+    ):
+        """Initializes with the S3 object key and the contents.
+        """
+        self.key = key
+        self.bloom_filter = bloom_filter
+        self.processed_keys = processed_keys
+
+
+    def save(self):
+        """Saves the filter in the destination bucket.
+        """
+        if self.bloom_filter.estimate_false_positive_rate() \
+            > DUPLICATE_FALSE_POSITIVE_RATE:
+            LOGGER.warning(
+                'duplicate filter %s holds %d records beyond the capacity',
+                self.key,
+                self.bloom_filter.count,
+            )
+        processed_keys = json.dumps(sorted(self.processed_keys))\
+            .encode('utf-8')
+        s3.put_object(
+            Bucket=DESTINATION_BUCKET_NAME,
+            Key=self.key,
+            Body=b''.join([
+                struct.pack(
+                    DuplicateFilter.HEADER_FORMAT,
+                    len(processed_keys),
+                ),
+                processed_keys,
+                self.bloom_filter.to_bytes(),
+            ]),
+            ContentType='application/octet-stream',
+        )
+
+
+class DimensionSnapshotCache:
+    """Snapshot of the dimension tables kept across invocations.
+
+    Checks for an update at most every
+    ``DIMENSION_SNAPSHOT_CHECK_INTERVAL`` seconds, and downloads the snapshot
+    only if it has been updated.
+    An outdated snapshot is still valid because values in the dimension
+    tables never change their IDs.
+    """
+
+    snapshot: Optional[dimensions.DimensionSnapshot]
+    etag: Optional[str]
+    checked_at: Optional[float]
+
+
+    def __init__(self, key: str):
+        """Initializes with the key of the snapshot in the destination
+        bucket.
+
+        An empty ``key`` disables the snapshot.
+        """
+        self.key = key
+        self.snapshot = None
+        self.etag = None
+        self.checked_at = None
+
+
+    def get(self) -> Optional[dimensions.DimensionSnapshot]:
+        """Returns the snapshot.
+
+        :returns: ``None`` if the snapshot is disabled or unavailable.
+        """
+        if len(self.key) == 0:
+            return None
+        now = time.monotonic()
+        if self.checked_at is not None \
+            and now - self.checked_at < DIMENSION_SNAPSHOT_CHECK_INTERVAL:
+            return self.snapshot
+        self.checked_at = now
+        params = {}
+        if self.etag is not None:
+            params['IfNoneMatch'] = self.etag
+        try:
+            res = s3.get_object(
+                Bucket=DESTINATION_BUCKET_NAME,
+                Key=self.key,
+                **params,
+            )
+        except s3.exceptions.NoSuchKey:
+            LOGGER.debug('no dimension snapshot: %s', self.key)
+            return self.snapshot
+        except ClientError as exc:
+            if exc.response.get('Error', {}).get('Code') != '304':
+                LOGGER.error(
+                    'failed to get the dimension snapshot: %s',
+                    str(exc),
+                )
+            return self.snapshot
+        with open_body(res) as body:
+            data = body.read()
+        try:
+            self.snapshot = dimensions.load_dimension_snapshot(data)
+        except ValueError as exc:
+            LOGGER.error('broken dimension snapshot: %s', str(exc))
+            return self.snapshot
+        self.etag = res['ETag']
+        LOGGER.debug('loaded dimension snapshot: %s', self.etag)
+        return self.snapshot
+
+
+dimension_snapshot_cache = DimensionSnapshotCache(DIMENSION_SNAPSHOT_KEY)
+
+
+def load_duplicate_filter(date: time.struct_time) -> DuplicateFilter:
+    """Loads the duplicate filter of a given date from the destination
+    bucket.
+
+    Creates an empty filter if none has been saved, or the saved one is
+    broken.
+    """
+    year = f'{date.tm_year:04d}'
+    month = f'{date.tm_mon:02d}'
+    mday = f'{date.tm_mday:02d}'
+    key = f'{DUPLICATE_FILTER_KEY_PREFIX}{year}/{month}/{mday}'
+    try:
+        res = s3.get_object(Bucket=DESTINATION_BUCKET_NAME, Key=key)
+    except s3.exceptions.NoSuchKey:
+        LOGGER.debug('creating duplicate filter: %s', key)
+    else:
+        with open_body(res) as body:
+            data = body.read()
+        header_size = struct.calcsize(DuplicateFilter.HEADER_FORMAT)
+        try:
+            keys_size, = struct.unpack(
+                DuplicateFilter.HEADER_FORMAT,
+                data[:header_size],
+            )
+            processed_keys = json.loads(
+                data[header_size:header_size + keys_size].decode('utf-8'),
+            )
+            bloom_filter = bloom.load_bloom_filter(
+                data[header_size + keys_size:],
+            )
+        except (struct.error, ValueError) as exc:
+            LOGGER.error('broken duplicate filter %s: %s', key, str(exc))
+        else:
+            return DuplicateFilter(key, bloom_filter, set(processed_keys))
+    return DuplicateFilter(
+        key,
+        bloom.create_bloom_filter(
+            DUPLICATE_FILTER_CAPACITY,
+            DUPLICATE_FALSE_POSITIVE_RATE,
+        ),
+        set(),
+    )
+
+
+def parse_hour(time_str: Optional[str]) -> Optional[int]:
+    """Parses the hour of a given time like ``HH:MM:SS``.
+
+    :returns: ``None`` if ``time_str`` is ``None`` or invalid.
+    """
+    if time_str is None:
+        return None
+    try:
+        parsed = time.strptime(time_str, LogDispatcher.LOG_TIME_FORMAT)
+    except ValueError:
+        return None
+    return parsed.tm_hour
+
+
+def open_gzipped_tsv(key: str, column_names: Sequence[str]) -> GzippedTsvOnS3:
+    """Opens a gzipped TSV file to be written to a given key in the
+    destination bucket.
+
+    Writes the header line.
+    """
+    dest_stream = S3OutputStream(DESTINATION_BUCKET_NAME, key)
+    dest_gzip = gzip.open(dest_stream, mode='wt')
+    dest_tsv = csv.DictWriter(
+        dest_gzip,
+        fieldnames=column_names,
+        delimiter='\t',
+    )
+    dest = GzippedTsvOnS3(dest_stream, dest_gzip, dest_tsv)
+    dest_tsv.writeheader()
+    return dest
+
+
 @contextmanager
 def open_body(s3_get_results):
     """Enables ``with`` statement for a body got from an S3 bucket.
@@ -6,13 +6,28 @@ You have to configure the following environment variables,
 - ``WORKGROUP_NAME``: name of the Redshift Serverless workgroup to connect to
 - ``ADMIN_SECRET_ARN``: ARN of the admin secret
 - ``ADMIN_DATABASE_NAME``: name of the admin database
+
+If the input event has ``compareCompression`` set to ``true``, this function
+does not populate anything but compares the compression encodings of the
+tables against the ones suggested by ``ANALYZE COMPRESSION``.
+
+This function also creates the stored procedures that maintain monthly access
+log tables, and the access log table of the current month; please refer to
+``libdatawarehouse.tables``.
 """
 
+import datetime
 import logging
 import os
-from typing import Sequence
-import boto3
-from libdatawarehouse import ACCESS_LOGS_DATABASE_NAME, data_api, tables
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from libdatawarehouse import (
+    ACCESS_LOGS_DATABASE_NAME,
+    approximate,
+    clients,
+    data_api,
+    rollups,
+    tables,
+)
 from libdatawarehouse.exceptions import DataWarehouseException
 
 
@@ -20,10 +35,26 @@ WORKGROUP_NAME = os.environ['WORKGROUP_NAME']
 ADMIN_SECRET_ARN = os.environ['ADMIN_SECRET_ARN']
 ADMIN_DATABASE_NAME = os.environ['ADMIN_DATABASE_NAME']
 
+# dimension tables that have a hash column.
+# (table name, hashed column, hash column, whether the hash is the dist key)
+HASHED_DIMENSIONS = [
+    (tables.REFERER_TABLE_NAME, 'url', 'url_hash', False),
+    (tables.PAGE_TABLE_NAME, 'path', 'path_hash', True),
+    (tables.USER_AGENT_TABLE_NAME, 'user_agent', 'user_agent_hash', True),
+]
+
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
-redshift_data = boto3.client('redshift-data')
+redshift_data = clients.LazyClient('redshift-data')
+
+# shares a single session among statements over the access logs database.
+admin_session = data_api.Session(
+    redshift_data,
+    WORKGROUP_NAME,
+    ACCESS_LOGS_DATABASE_NAME,
+    secret_arn=ADMIN_SECRET_ARN,
+)
 
 
 def get_create_database_statement() -> str:
@@ -34,117 +65,536 @@ def get_create_database_statement() -> str:
 
 def get_create_tables_script() -> Sequence[str]:
     """Returns SQL statements to create tables.
+
+    DDL statements are generated from the schema defined in
+    ``libdatawarehouse.tables``.
     """
-    return [
-        get_create_referer_table_statement(),
-        get_grant_public_table_access_statement(tables.REFERER_TABLE_NAME),
-        get_create_page_table_statement(),
-        get_grant_public_table_access_statement(tables.PAGE_TABLE_NAME),
-        get_create_edge_location_table_statement(),
-        get_grant_public_table_access_statement(
-            tables.EDGE_LOCATION_TABLE_NAME,
-        ),
-        get_create_user_agent_table_statement(),
-        get_grant_public_table_access_statement(tables.USER_AGENT_TABLE_NAME),
-        get_create_result_type_table_statement(),
-        get_grant_public_table_access_statement(tables.RESULT_TYPE_TABLE_NAME),
-        get_create_access_log_table_statement(),
-        get_grant_public_table_access_statement(tables.ACCESS_LOG_TABLE_NAME),
-    ]
+    script = []
+    for table in tables.TABLES:
+        script.append(tables.get_create_table_statement(table))
+        script.append(get_grant_public_table_access_statement(table.name))
+    return script
+
 
+def get_add_hash_column_statement(table_name: str, hash_column: str) -> str:
+    """Returns an SQL statement to add a hash column to a given existing
+    table.
 
-def get_create_referer_table_statement() -> str:
-    """Returns an SQL statement to create the table for referers.
+    The added column is nullable because existing rows have no hash values.
     """
     return ''.join([
-        f'CREATE TABLE IF NOT EXISTS {tables.REFERER_TABLE_NAME} (',
-        '  id BIGINT IDENTITY(1, 1) DISTKEY,',
-        '  url VARCHAR(2048) NOT NULL SORTKEY UNIQUE,',
-        '  PRIMARY KEY (id)',
-        ')',
+        f'ALTER TABLE {table_name}',
+        f'  ADD COLUMN {hash_column} BIGINT DEFAULT NULL',
     ])
 
 
-def get_create_page_table_statement() -> str:
-    """Returns an SQL statement to create the table for pages.
+def get_add_distribution_column_statement() -> str:
+    """Returns an SQL statement to add the distribution column to an existing
+    access log table.
+
+    The added column is nullable because existing rows have no
+    distributions.
     """
+    column = next(
+        column for column in tables.ACCESS_LOG_TABLE.columns
+            if column.name == 'distribution'
+    )
     return ''.join([
-        f'CREATE TABLE IF NOT EXISTS {tables.PAGE_TABLE_NAME} (',
-        '  id INT IDENTITY(1, 1),',
-        '  path VARCHAR(2048) NOT NULL SORTKEY UNIQUE,'
-        '  PRIMARY KEY (id)',
-        ')',
+        f'ALTER TABLE {tables.ACCESS_LOG_TABLE_NAME}',
+        f'  ADD COLUMN {column.name} {column.data_type} DEFAULT NULL',
+        f'  ENCODE {column.encoding}',
     ])
 
 
-def get_create_edge_location_table_statement() -> str:
-    """Returns an SQL statement to create the table for edge locations.
+def get_fill_hash_column_statement(
+    table_name: str,
+    column: str,
+    hash_column: str,
+) -> str:
+    """Returns an SQL statement to fill a hash column of a given table.
+
+    Fills only rows whose hash is missing.
     """
     return ''.join([
-        f'CREATE TABLE IF NOT EXISTS {tables.EDGE_LOCATION_TABLE_NAME} (',
-        '  id INT IDENTITY(1, 1),',
-        '  code VARCHAR NOT NULL SORTKEY UNIQUE,',
-        '  PRIMARY KEY (id)',
-        ')'
+        f'UPDATE {table_name}',
+        f'  SET {hash_column} = FNV_HASH({column})',
+        f'  WHERE {hash_column} IS NULL',
     ])
 
 
-def get_create_user_agent_table_statement() -> str:
-    """Returns an SQL statement to create the table for user agents.
+def get_table_keys_statement(table_name: str) -> str:
+    """Returns an SQL statement that queries the sort key and distribution
+    key columns of a given table.
     """
     return ''.join([
-        f'CREATE TABLE IF NOT EXISTS {tables.USER_AGENT_TABLE_NAME} ('
-        '  id BIGINT IDENTITY(1, 1),',
-        '  user_agent VARCHAR(2048) NOT NULL SORTKEY UNIQUE,',
-        '  PRIMARY KEY (id)',
-        ')',
+        'SELECT "column", sortkey, distkey',
+        '  FROM pg_table_def',
+        "  WHERE schemaname = 'public'",
+        f"    AND tablename = '{table_name}'",
+        '    AND (sortkey <> 0 OR distkey)',
+        '  ORDER BY sortkey',
     ])
 
 
-def get_create_result_type_table_statement() -> str:
-    """Returns an SQL statement to create the table for result types.
+def get_table_keys(table_name: str) -> Tuple[List[str], Optional[str]]:
+    """Returns the sort key and distribution key columns of a given table.
+
+    :returns: tuple of the sort key columns in order, and the distribution
+    key column. The distribution key column is ``None`` if the table has no
+    distribution key.
+    """
+    sort_keys = []
+    dist_key = None
+    records = execute_admin_query(get_table_keys_statement(table_name))
+    for column, sortkey, distkey in records:
+        if sortkey != 0:
+            sort_keys.append(column)
+        if distkey:
+            dist_key = column
+    return sort_keys, dist_key
+
+
+def get_alter_sort_key_statement(table_name: str, column: str) -> str:
+    """Returns an SQL statement to change the sort key of a given table.
+    """
+    return f'ALTER TABLE {table_name} ALTER SORTKEY ({column})'
+
+
+def get_alter_dist_key_statement(table_name: str, column: str) -> str:
+    """Returns an SQL statement to change the distribution key of a given
+    table.
+    """
+    return f'ALTER TABLE {table_name} ALTER DISTKEY {column}'
+
+
+def get_grant_public_table_access_statement(table_name: str) -> str:
+    """Returns an SQL statement to grant access on a given table to public.
+    """
+    return f'GRANT SELECT,INSERT,UPDATE,DELETE ON {table_name} TO PUBLIC'
+
+
+def get_create_refresh_access_log_view_procedure_statement() -> str:
+    """Returns an SQL statement to create the stored procedure that
+    recreates the access log view over the monthly and legacy access log
+    tables.
+
+    The view is late-binding (``WITH NO SCHEMA BINDING``), so a monthly table
+    can be dropped without dropping the view.
+    The view always includes the empty template so that it is valid even if
+    there are no monthly tables.
     """
     return ''.join([
-        f'CREATE TABLE IF NOT EXISTS {tables.RESULT_TYPE_TABLE_NAME} ('
-        '  id INT IDENTITY(1, 1),',
-        '  result_type VARCHAR NOT NULL SORTKEY UNIQUE,',
-        '  PRIMARY KEY (id)',
-        ')',
+        'CREATE OR REPLACE PROCEDURE',
+        f' {tables.REFRESH_ACCESS_LOG_VIEW_PROCEDURE}()',
+        ' AS $$',
+        ' DECLARE',
+        '   rec RECORD;',
+        '   query VARCHAR(65535);',
+        ' BEGIN',
+        "   query := 'SELECT * FROM public.",
+        f"{tables.ACCESS_LOG_TEMPLATE_TABLE_NAME}';",
+        '   FOR rec IN SELECT tablename FROM pg_tables',
+        "     WHERE schemaname = 'public'",
+        f"       AND tablename ~ '{tables.ACCESS_LOG_SLICE_TABLE_PATTERN}'",
+        '     ORDER BY tablename',
+        '   LOOP',
+        "     query := query || ' UNION ALL SELECT * FROM public.'",
+        '       || rec.tablename;',
+        '   END LOOP;',
+        "   EXECUTE 'CREATE OR REPLACE VIEW public.",
+        f"{tables.ACCESS_LOG_TABLE_NAME} AS '",
+        "     || query || ' WITH NO SCHEMA BINDING';",
+        "   EXECUTE 'GRANT SELECT ON public.",
+        f"{tables.ACCESS_LOG_TABLE_NAME} TO PUBLIC';",
+        ' END;',
+        ' $$ LANGUAGE plpgsql SECURITY DEFINER',
     ])
 
 
-def get_create_access_log_table_statement() -> str:
-    """Returns an SQL statement to create the table for access logs.
+def get_create_access_log_month_procedure_statement() -> str:
+    """Returns an SQL statement to create the stored procedure that creates
+    the access log table of a given month unless it exists.
+
+    The procedure takes the month as an integer ``YYYYMM``, and recreates the
+    access log view if it creates a table.
+    It runs as the admin so that the admin owns every monthly table.
     """
     return ''.join([
-        f'CREATE TABLE IF NOT EXISTS {tables.ACCESS_LOG_TABLE_NAME} (',
-        '  datetime TIMESTAMP NOT NULL,',
-        '  seq_num INT NOT NULL,',
-        '  edge_location INT NOT NULL,',
-        '  sc_bytes BIGINT NOT NULL,',
-        '  cs_method VARCHAR NOT NULL,',
-        '  page INT NOT NULL,',
-        '  status SMALLINT NOT NULL,',
-        '  referer BIGINT DISTKEY,',
-        '  user_agent BIGINT NOT NULL,',
-        '  cs_protocol VARCHAR NOT NULL,',
-        '  cs_bytes BIGINT NOT NULL,',
-        '  time_taken FLOAT4 NOT NULL,',
-        '  edge_response_result_type INT NOT NULL,',
-        '  time_to_first_byte FLOAT4 NOT NULL,',
-        f' FOREIGN KEY (edge_location) REFERENCES {tables.EDGE_LOCATION_TABLE_NAME},'
-        f' FOREIGN KEY (page) REFERENCES {tables.PAGE_TABLE_NAME},'
-        f' FOREIGN KEY (referer) REFERENCES {tables.REFERER_TABLE_NAME},'
-        f' FOREIGN KEY (user_agent) REFERENCES {tables.USER_AGENT_TABLE_NAME},'
-        f' FOREIGN KEY (edge_response_result_type) REFERENCES {tables.RESULT_TYPE_TABLE_NAME}'
-        ') SORTKEY (datetime, seq_num)',
+        'CREATE OR REPLACE PROCEDURE',
+        f' {tables.CREATE_ACCESS_LOG_MONTH_PROCEDURE}(',
+        '   target_month INT',
+        ' )',
+        ' AS $$',
+        ' DECLARE',
+        '   target_table VARCHAR(64);',
+        '   num_tables INT;',
+        ' BEGIN',
+        '   IF target_month < 100001 OR target_month > 999912',
+        '     OR target_month % 100 NOT BETWEEN 1 AND 12 THEN',
+        "     RAISE EXCEPTION 'invalid month: %', target_month;",
+        '   END IF;',
+        "   target_table := '",
+        f"{tables.MONTHLY_ACCESS_LOG_TABLE_PREFIX}'",
+        '     || target_month::VARCHAR;',
+        '   SELECT INTO num_tables COUNT(*) FROM pg_tables',
+        "     WHERE schemaname = 'public' AND tablename = target_table;",
+        '   IF num_tables = 0 THEN',
+        "     EXECUTE 'CREATE TABLE public.' || target_table",
+        "       || ' (LIKE public.",
+        f"{tables.ACCESS_LOG_TEMPLATE_TABLE_NAME})';",
+        "     EXECUTE 'GRANT SELECT,INSERT,UPDATE,DELETE ON public.'",
+        "       || target_table || ' TO PUBLIC';",
+        f'     CALL {tables.REFRESH_ACCESS_LOG_VIEW_PROCEDURE}();',
+        '   END IF;',
+        ' END;',
+        ' $$ LANGUAGE plpgsql SECURITY DEFINER',
     ])
 
 
-def get_grant_public_table_access_statement(table_name: str) -> str:
-    """Returns an SQL statement to grant access on a given table to public.
+def get_create_drop_access_log_months_procedure_statement() -> str:
+    """Returns an SQL statement to create the stored procedure that drops
+    the access log tables of months before a given month.
+
+    The procedure takes the first month to keep as an integer ``YYYYMM``.
+    It also drops the legacy access log table if the table has no access
+    logs in or after the month.
+    Recreates the access log view in the same transaction.
     """
-    return f'GRANT SELECT,INSERT,UPDATE,DELETE ON {table_name} TO PUBLIC'
+    return ''.join([
+        'CREATE OR REPLACE PROCEDURE',
+        f' {tables.DROP_ACCESS_LOG_MONTHS_PROCEDURE}(',
+        '   first_month INT',
+        ' )',
+        ' AS $$',
+        ' DECLARE',
+        '   rec RECORD;',
+        '   num_tables INT;',
+        '   latest TIMESTAMP;',
+        ' BEGIN',
+        # compares names as strings because months have six digits
+        '   FOR rec IN SELECT tablename FROM pg_tables',
+        "     WHERE schemaname = 'public'",
+        "       AND tablename ~ '^",
+        f"{tables.MONTHLY_ACCESS_LOG_TABLE_PREFIX}[0-9]{{6}}$'",
+        "       AND tablename::VARCHAR < '",
+        f"{tables.MONTHLY_ACCESS_LOG_TABLE_PREFIX}'",
+        '         || first_month::VARCHAR',
+        '   LOOP',
+        "     EXECUTE 'DROP TABLE public.' || rec.tablename;",
+        '   END LOOP;',
+        '   SELECT INTO num_tables COUNT(*) FROM pg_tables',
+        "     WHERE schemaname = 'public'",
+        f"       AND tablename = '{tables.LEGACY_ACCESS_LOG_TABLE_NAME}';",
+        '   IF num_tables > 0 THEN',
+        "     EXECUTE 'SELECT MAX(datetime) FROM public.",
+        f"{tables.LEGACY_ACCESS_LOG_TABLE_NAME}'",
+        '       INTO latest;',
+        '     IF latest IS NULL',
+        "       OR TO_CHAR(latest, 'YYYYMM')::INT < first_month THEN",
+        "       EXECUTE 'DROP TABLE public.",
+        f"{tables.LEGACY_ACCESS_LOG_TABLE_NAME}';",
+        '     END IF;',
+        '   END IF;',
+        f'   CALL {tables.REFRESH_ACCESS_LOG_VIEW_PROCEDURE}();',
+        ' END;',
+        ' $$ LANGUAGE plpgsql SECURITY DEFINER',
+    ])
+
+
+def get_rename_legacy_access_log_table_statement() -> str:
+    """Returns an SQL statement to rename the access log table created before
+    monthly tables were introduced to the legacy access log table.
+    """
+    return ''.join([
+        f'ALTER TABLE {tables.ACCESS_LOG_TABLE_NAME}',
+        f'  RENAME TO {tables.LEGACY_ACCESS_LOG_TABLE_NAME}',
+    ])
+
+
+def get_create_access_log_month_statement(date: datetime.datetime) -> str:
+    """Returns an SQL statement to create the access log table of the month
+    of a given date.
+    """
+    return ''.join([
+        f'CALL {tables.CREATE_ACCESS_LOG_MONTH_PROCEDURE}(',
+        f'{date.year:04d}{date.month:02d})',
+    ])
+
+
+def get_access_log_table_count_statement() -> str:
+    """Returns an SQL statement that counts tables (not views) named after
+    the access log view; i.e., the access log table created before monthly
+    tables were introduced.
+    """
+    return ''.join([
+        'SELECT COUNT(*) FROM pg_tables',
+        "  WHERE schemaname = 'public'",
+        f"    AND tablename = '{tables.ACCESS_LOG_TABLE_NAME}'",
+    ])
+
+
+def execute_admin_statement(sql: str) -> Tuple[Optional[str], Dict]:
+    """Executes a given SQL statement as the admin over the access logs
+    database and waits for the results.
+
+    Runs in ``admin_session``.
+    """
+    statement_id = admin_session.execute_statement(sql)
+    return data_api.wait_for_results(redshift_data, statement_id)
+
+
+def get_current_encodings_statement() -> str:
+    """Returns an SQL statement that queries the current compression encodings
+    of the columns of the tables.
+    """
+    table_names = ', '.join(f"'{table.name}'" for table in tables.TABLES)
+    return ''.join([
+        'SELECT tablename, "column", encoding',
+        '  FROM pg_table_def',
+        "  WHERE schemaname = 'public'",
+        f'    AND tablename IN ({table_names})',
+    ])
+
+
+def get_analyze_compression_statement(table_name: str) -> str:
+    """Returns an SQL statement that analyzes the compression of a given
+    table.
+    """
+    return f'ANALYZE COMPRESSION {table_name}'
+
+
+def execute_admin_query(sql: str) -> Iterator[Tuple]:
+    """Runs a given query as the admin and iterates over the records in the
+    results.
+
+    :returns: iterator of records decoded by ``data_api.decode_field``.
+    """
+    status, res = execute_admin_statement(sql)
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            LOGGER.error('failed to run query: %s', str(res))
+        raise DataWarehouseException(
+            f'failed to run query: {status or "timeout"}',
+        )
+    return data_api.iterate_results(redshift_data, res['Id'])
+
+
+def normalize_encoding(encoding: Optional[str]) -> Optional[str]:
+    """Normalizes a given encoding name.
+
+    ``pg_table_def`` reports ``none`` for ``RAW``.
+    """
+    if encoding is None:
+        return None
+    encoding = encoding.upper()
+    return 'RAW' if encoding == 'NONE' else encoding
+
+
+def compare_compression() -> List[Dict]:
+    """Compares the compression encodings of the tables against the ones
+    suggested by ``ANALYZE COMPRESSION``.
+
+    ``ANALYZE COMPRESSION`` acquires an exclusive lock on each table, so you
+    should not run this while access logs are being loaded.
+
+    :returns: list of ``dict`` with the following fields for every column,
+    ``tableName``, ``column``, ``defined`` (encoding defined in the schema),
+    ``current`` (encoding of the existing column), ``suggested`` (encoding
+    suggested by ``ANALYZE COMPRESSION``), ``estimatedReduction`` (percentage
+    of the estimated storage reduction with the suggested encoding), and
+    ``mismatched`` (whether any of the encodings differ).
+    """
+    current_encodings = {}
+    records = execute_admin_query(get_current_encodings_statement())
+    for table_name, column, encoding in records:
+        current_encodings[(table_name, column)] = normalize_encoding(encoding)
+    comparisons = []
+    for table in tables.TABLES:
+        # ANALYZE COMPRESSION cannot run in a transaction block
+        records = execute_admin_query(
+            get_analyze_compression_statement(table.name),
+        )
+        # Table, Column, Encoding, Est_reduction_pct
+        suggestions = {
+            column: (normalize_encoding(encoding), float(reduction))
+                for _, column, encoding, reduction in records
+        }
+        for column in table.columns:
+            current = current_encodings.get((table.name, column.name))
+            suggested, reduction = suggestions.get(column.name, (None, None))
+            comparisons.append({
+                'tableName': table.name,
+                'column': column.name,
+                'defined': column.encoding,
+                'current': current,
+                'suggested': suggested,
+                'estimatedReduction': reduction,
+                'mismatched': len(set([
+                    column.encoding,
+                    current,
+                    suggested or column.encoding,
+                ])) > 1,
+            })
+    return comparisons
+
+
+def migrate_dimension_hashes():
+    """Adds hash columns to dimension tables created before hash columns
+    were introduced.
+
+    Every step is idempotent on its own, so a migration that failed halfway
+    is completed by the next run,
+    1. adds the hash column unless it exists.
+    2. fills hashes of rows whose hash is missing.
+    3. makes the hash column the sort key unless it is.
+    4. makes the hash column the distribution key unless it is, if the hash
+       column has to be the distribution key.
+
+    ``ALTER SORTKEY`` and ``ALTER DISTKEY`` cannot run in a transaction block,
+    so runs every statement separately.
+    """
+    for table_name, column, hash_column, is_dist_key in HASHED_DIMENSIONS:
+        status, res = execute_admin_statement(
+            get_add_hash_column_statement(table_name, hash_column),
+        )
+        if status == 'FAILED' \
+            and res.get('Error', '').lower().endswith('already exists'):
+            LOGGER.debug('%s already has %s', table_name, hash_column)
+        else:
+            check_migration_status(table_name, status, res)
+            LOGGER.debug('added %s to %s', hash_column, table_name)
+        status, res = execute_admin_statement(
+            get_fill_hash_column_statement(table_name, column, hash_column),
+        )
+        check_migration_status(table_name, status, res)
+        sort_keys, dist_key = get_table_keys(table_name)
+        sqls = []
+        if sort_keys != [hash_column]:
+            sqls.append(get_alter_sort_key_statement(table_name, hash_column))
+        if is_dist_key and dist_key != hash_column:
+            sqls.append(get_alter_dist_key_statement(table_name, hash_column))
+        for sql in sqls:
+            status, res = execute_admin_statement(sql)
+            check_migration_status(table_name, status, res)
+            LOGGER.debug('altered keys of %s: %s', table_name, sql)
+
+
+def check_migration_status(
+    table_name: str,
+    status: Optional[str],
+    res: Dict,
+):
+    """Checks the status of a statement that migrates a given table.
+
+    :raises DataWarehouseException: if the statement has not finished.
+    """
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            raise DataWarehouseException(
+                f'failed to migrate {table_name}: {res.get("Error")}',
+            )
+        raise DataWarehouseException(
+            f'failed to migrate {table_name}: {status or "timeout"}',
+        )
+
+
+def migrate_access_log_distribution():
+    """Adds the distribution column to the access log table created before
+    CloudFront distributions were introduced.
+
+    Does nothing if the access log table already has the column.
+    """
+    table_name = tables.ACCESS_LOG_TABLE_NAME
+    status, res = execute_admin_statement(
+        get_add_distribution_column_statement(),
+    )
+    if status == 'FAILED' \
+        and res.get('Error', '').lower().endswith('already exists'):
+        LOGGER.debug('%s already has distribution', table_name)
+        return
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            raise DataWarehouseException(
+                f'failed to migrate {table_name}: {res.get("Error")}',
+            )
+        raise DataWarehouseException(
+            f'failed to migrate {table_name}: {status or "timeout"}',
+        )
+    LOGGER.debug('added distribution to %s', table_name)
+
+
+def migrate_monthly_access_logs():
+    """Creates the stored procedures that maintain monthly access log tables
+    and the access log table of the current month.
+
+    If the access log table created before monthly tables were introduced
+    exists, renames it to the legacy access log table in the same
+    transaction as creating the access log view, so that queries over
+    ``access_log`` never fail.
+    """
+    records = execute_admin_query(get_access_log_table_count_statement())
+    has_legacy_table = next(records)[0] > 0
+    if has_legacy_table:
+        # the legacy table may predate distributions as well
+        migrate_access_log_distribution()
+    batch_id = admin_session.batch_execute_statement([
+        *(
+            [get_rename_legacy_access_log_table_statement()]
+                if has_legacy_table else []
+        ),
+        get_create_refresh_access_log_view_procedure_statement(),
+        get_create_access_log_month_procedure_statement(),
+        get_create_drop_access_log_months_procedure_statement(),
+        get_create_access_log_month_statement(datetime.datetime.utcnow()),
+        # the view does not exist yet if the table of the current month has
+        # existed
+        f'CALL {tables.REFRESH_ACCESS_LOG_VIEW_PROCEDURE}()',
+    ])
+    status, res = data_api.wait_for_results(redshift_data, batch_id)
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            raise DataWarehouseException(
+                f'failed to migrate monthly access logs: {res.get("Error")}',
+            )
+        raise DataWarehouseException(
+            f'failed to migrate monthly access logs: {status or "timeout"}',
+        )
+    if has_legacy_table:
+        LOGGER.debug(
+            'renamed %s to %s',
+            tables.ACCESS_LOG_TABLE_NAME,
+            tables.LEGACY_ACCESS_LOG_TABLE_NAME,
+        )
+
+
+def backfill_rollups():
+    """Fills the daily rollup tables, the sample table, and the sketch table
+    with access logs on days missing in them; e.g., days loaded before those
+    tables were introduced.
+
+    Does nothing for a table that covers all the days.
+    """
+    batch_id = admin_session.batch_execute_statement([
+        *(
+            rollups.get_backfill_rollup_statement(table)
+                for table in tables.DAILY_ROLLUP_TABLES
+        ),
+        approximate.get_backfill_sample_statement(),
+        approximate.get_backfill_sketches_statement(),
+    ])
+    status, res = data_api.wait_for_results(redshift_data, batch_id)
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            raise DataWarehouseException(
+                f'failed to backfill rollups: {res.get("Error")}',
+            )
+        raise DataWarehouseException(
+            f'failed to backfill rollups: {status or "timeout"}',
+        )
+    LOGGER.debug(
+        'backfilled rollups in %.3f ms',
+        res.get('Duration', 0) * 0.001 * 0.001, # ns → ms
+    )
 
 
 def lambda_handler(event, _):
@@ -154,7 +604,17 @@ def lambda_handler(event, _):
         'populating data warehouse database and tables: %s',
         str(event),
     )
+    if event.get('compareCompression', False):
+        comparisons = compare_compression()
+        for comparison in comparisons:
+            if comparison['mismatched']:
+                LOGGER.warning('encoding mismatch: %s', str(comparison))
+        return {
+            'statusCode': 200,
+            'comparisons': comparisons,
+        }
     # populates the database
+    # a session is bound to a database, so this runs outside admin_session
     res = redshift_data.execute_statement(
         WorkgroupName=WORKGROUP_NAME,
         SecretArn=ADMIN_SECRET_ARN,
@@ -180,13 +640,10 @@ def lambda_handler(event, _):
         res.get('Duration', 0) * 0.001 * 0.001, # ns → ms
     )
     # populates the tables
-    res = redshift_data.batch_execute_statement(
-        WorkgroupName=WORKGROUP_NAME,
-        SecretArn=ADMIN_SECRET_ARN,
-        Database=ACCESS_LOGS_DATABASE_NAME,
-        Sqls=get_create_tables_script(),
+    batch_id = admin_session.batch_execute_statement(
+        get_create_tables_script(),
     )
-    status, res = data_api.wait_for_results(redshift_data, res['Id'])
+    status, res = data_api.wait_for_results(redshift_data, batch_id)
     if status != 'FINISHED':
         if status == 'FAILED':
             raise DataWarehouseException(
@@ -199,6 +656,10 @@ def lambda_handler(event, _):
         'populated tables in %.3f ms',
         res.get('Duration') * 0.001 * 0.001, # ns → ms
     )
+    # migrates tables populated by an older version
+    migrate_dimension_hashes()
+    migrate_monthly_access_logs()
+    backfill_rollups()
     return {
         'statusCode': 200,
     }
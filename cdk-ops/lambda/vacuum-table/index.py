@@ -1,28 +1,356 @@
 # -*- coding: utf-8 -*-
 
-"""Runs VACUUM over a given table.
+"""Plans and runs VACUUM and ANALYZE over tables.
 
 You have to specify the following environment variables.
 * ``WORKGROUP_NAME``: name of the Redshift Serverless workgroup.
 * ``ADMIN_SECRET_ARN``: ARN of the secret containing the admin password.
+* ``UNSORTED_THRESHOLD``: default percentage of unsorted (or deleted) rows
+  below which a table is not vacuumed.
+* ``TIME_BUDGET_SECONDS``: default time budget in seconds for VACUUM over all
+  the tables.
+* ``VACUUM_ROWS_PER_SECOND``: number of rows that VACUUM is supposed to
+  process in a second, which is used to estimate the time for VACUUM.
+* ``MAX_VACUUM_SECONDS``: maximum time in seconds that a single invocation
+  can wait for VACUUM over a table, which should be shorter than the timeout
+  of the Lambda function.
+* ``ANALYZE_THRESHOLD``: default percentage of rows changed since the last
+  ANALYZE below which a table is not analyzed.
 """
 
 import logging
 import os
-import boto3
-from libdatawarehouse import ACCESS_LOGS_DATABASE_NAME, data_api
+import time
+from typing import Dict, List, Optional, Tuple
+from libdatawarehouse import (
+    ACCESS_LOGS_DATABASE_NAME,
+    clients,
+    data_api,
+    tables,
+)
+from libdatawarehouse.exceptions import DataWarehouseException
 
 
 WORKGROUP_NAME = os.environ['WORKGROUP_NAME']
 ADMIN_SECRET_ARN = os.environ['ADMIN_SECRET_ARN']
+UNSORTED_THRESHOLD = float(os.environ['UNSORTED_THRESHOLD'])
+TIME_BUDGET_SECONDS = float(os.environ['TIME_BUDGET_SECONDS'])
+VACUUM_ROWS_PER_SECOND = float(os.environ['VACUUM_ROWS_PER_SECOND'])
+MAX_VACUUM_SECONDS = float(os.environ['MAX_VACUUM_SECONDS'])
+ANALYZE_THRESHOLD = float(os.environ['ANALYZE_THRESHOLD'])
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
-redshift_data = boto3.client('redshift-data')
+redshift_data = clients.LazyClient('redshift-data')
 
+# VACUUM modes allowed.
+VACUUM_MODES = ['FULL', 'SORT ONLY', 'DELETE ONLY', 'REINDEX']
 
-def lambda_handler(event, _):
+# overhead in seconds of a single VACUUM.
+VACUUM_OVERHEAD_SECONDS = 5.0
+
+# interval in seconds between two consecutive pollings of VACUUM and
+# ANALYZE.
+POLLING_INTERVAL = 1.0
+
+# time in seconds left to cancel VACUUM or ANALYZE and return before the
+# Lambda function times out.
+CANCEL_MARGIN_SECONDS = 10.0
+
+
+def get_table_info_statement() -> str:
+    """Returns an SQL statement that queries the statistics of the tables.
+
+    Includes monthly access log tables, so VACUUM sorts only the tables of
+    months that have been loaded recently.
+    """
+    table_names = ', '.join(f"'{name}'" for name in tables.TABLE_NAMES)
+    return ''.join([
+        'SELECT "table", unsorted, tbl_rows, estimated_visible_rows',
+        '  FROM svv_table_info',
+        f"  WHERE \"database\" = '{ACCESS_LOGS_DATABASE_NAME}'",
+        "    AND \"schema\" = 'public'",
+        f'    AND ("table" IN ({table_names})',
+        f"      OR \"table\" ~ '{tables.ACCESS_LOG_SLICE_TABLE_PATTERN}')",
+    ])
+
+
+def open_session(session_id: Optional[str] = None) -> data_api.Session:
+    """Opens a Data API session as the admin.
+
+    :param Optional[str] session_id: ID of a session opened by a previous
+    step of the workflow. A new session is opened if the session has expired.
+    """
+    return data_api.Session(
+        redshift_data,
+        WORKGROUP_NAME,
+        ACCESS_LOGS_DATABASE_NAME,
+        secret_arn=ADMIN_SECRET_ARN,
+        session_id=session_id,
+    )
+
+
+def query_table_info(session: data_api.Session) -> List[Dict]:
+    """Queries the statistics of the tables.
+
+    :returns: list of ``dict`` with the following fields,
+    ``tableName``, ``unsorted`` (percentage of unsorted rows),
+    ``tblRows`` (number of rows including ones marked for deletion),
+    and ``deleted`` (percentage of rows marked for deletion).
+    """
+    statement_id = session.execute_statement(get_table_info_statement())
+    status, res = data_api.wait_for_results(redshift_data, statement_id)
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            LOGGER.error('failed to query table info: %s', str(res))
+        raise DataWarehouseException(
+            f'failed to query table info: {status or "timeout"}',
+        )
+    infos = []
+    records = data_api.iterate_results(redshift_data, statement_id)
+    for table_name, unsorted, tbl_rows, visible_rows in records:
+        tbl_rows = float(tbl_rows or 0)
+        if tbl_rows > 0 and visible_rows is not None:
+            deleted = 100.0 * (tbl_rows - float(visible_rows)) / tbl_rows
+        else:
+            deleted = 0.0
+        infos.append({
+            'tableName': table_name,
+            # unsorted is NULL if the table has no sort key
+            'unsorted': float(unsorted or 0),
+            'tblRows': tbl_rows,
+            'deleted': deleted,
+        })
+    return infos
+
+
+def get_changed_rows_statement() -> str:
+    """Returns an SQL statement that sums the numbers of rows changed per
+    table since the table was last analyzed.
+    """
+    return ''.join([
+        'SELECT table_name, SUM(changed_rows), MAX(recorded_at)',
+        f'  FROM {tables.CHANGED_ROW_COUNT_TABLE_NAME}',
+        '  GROUP BY table_name',
+    ])
+
+
+def query_changed_rows(session: data_api.Session) -> Dict[str, Dict]:
+    """Queries the numbers of rows changed per table since the table was
+    last analyzed.
+
+    :returns: ``dict`` that maps a table name to a ``dict`` with the
+    following fields, ``changedRows`` (number of rows changed by loads), and
+    ``recordedAt`` (when the last load was recorded).
+    """
+    statement_id = session.execute_statement(get_changed_rows_statement())
+    status, res = data_api.wait_for_results(redshift_data, statement_id)
+    if status != 'FINISHED':
+        if status == 'FAILED':
+            LOGGER.error('failed to query changed rows: %s', str(res))
+        raise DataWarehouseException(
+            f'failed to query changed rows: {status or "timeout"}',
+        )
+    changed_rows = {}
+    records = data_api.iterate_results(redshift_data, statement_id)
+    for table_name, num_changed, recorded_at in records:
+        changed_rows[table_name] = {
+            'changedRows': int(num_changed or 0),
+            'recordedAt': str(recorded_at),
+        }
+    return changed_rows
+
+
+def get_delete_changed_rows_statement(
+    changed_rows: Dict[str, Dict],
+) -> str:
+    """Returns an SQL statement that deletes the numbers of changed rows
+    given by ``query_changed_rows``.
+
+    Rows recorded after ``query_changed_rows`` are left to the next ANALYZE.
+    """
+    conditions = ' OR '.join(
+        ''.join([
+            f"(table_name = '{table_name}'",
+            f" AND recorded_at <= '{changed['recordedAt']}')",
+        ]) for table_name, changed in sorted(changed_rows.items())
+    )
+    return ''.join([
+        f'DELETE FROM {tables.CHANGED_ROW_COUNT_TABLE_NAME}',
+        f'  WHERE {conditions}',
+    ])
+
+
+def estimate_benefit(info: Dict, mode: str) -> Tuple[float, float]:
+    """Estimates the benefit of VACUUM over a given table.
+
+    :returns: tuple of the percentage and number of rows that VACUUM in
+    ``mode`` would sort or reclaim.
+    """
+    if mode == 'SORT ONLY':
+        ratio = info['unsorted']
+    elif mode == 'DELETE ONLY':
+        ratio = info['deleted']
+    else:
+        ratio = max(info['unsorted'], info['deleted'])
+    return ratio, info['tblRows'] * ratio * 0.01
+
+
+def plan_vacuum(
+    infos: List[Dict],
+    mode: str,
+    unsorted_threshold: float,
+    time_budget: float,
+    max_seconds: float = MAX_VACUUM_SECONDS,
+) -> Tuple[List[Dict], List[Dict]]:
+    """Decides which tables to vacuum.
+
+    Skips tables below ``unsorted_threshold``, orders the rest by the number
+    of rows that VACUUM would sort or reclaim, and skips tables that would
+    not finish in ``time_budget``.
+    Also skips tables that would not finish in ``max_seconds``, because
+    ``lambda_handler`` would cancel VACUUM over them.
+
+    :returns: tuple of tables to vacuum and decisions over all the tables.
+    """
+    candidates = []
+    decisions = []
+    for info in infos:
+        ratio, num_rows = estimate_benefit(info, mode)
+        if ratio < unsorted_threshold:
+            decisions.append({
+                'tableName': info['tableName'],
+                'decision': 'SKIP',
+                'reason': f'{ratio:.2f}% is below {unsorted_threshold:.2f}%',
+            })
+        else:
+            candidates.append((num_rows, info['tableName']))
+    candidates.sort(reverse=True)
+    plan = []
+    total_seconds = 0.0
+    for num_rows, table_name in candidates:
+        estimated_seconds = \
+            VACUUM_OVERHEAD_SECONDS + num_rows / VACUUM_ROWS_PER_SECOND
+        if estimated_seconds > max_seconds:
+            decisions.append({
+                'tableName': table_name,
+                'decision': 'SKIP',
+                'reason': ''.join([
+                    f'{estimated_seconds:.0f} s exceeds {max_seconds:.0f} s',
+                    ' of a single VACUUM',
+                ]),
+            })
+            continue
+        if total_seconds + estimated_seconds > time_budget:
+            decisions.append({
+                'tableName': table_name,
+                'decision': 'SKIP',
+                'reason': f'{estimated_seconds:.0f} s exceeds the time budget',
+            })
+            continue
+        total_seconds += estimated_seconds
+        plan.append({
+            'tableName': table_name,
+            'mode': mode,
+            'estimatedSeconds': estimated_seconds,
+        })
+        decisions.append({
+            'tableName': table_name,
+            'decision': 'VACUUM',
+            'reason': f'{num_rows:.0f} rows to process',
+        })
+    return plan, decisions
+
+
+def plan_handler(event, _):
+    """Plans VACUUM over the tables.
+
+    ``event`` must be a ``dict`` similar to the following,
+
+    .. code-block:: python
+
+        {
+            'mode': 'SORT ONLY',
+            'unsortedThreshold': 5.0, # optional
+            'timeBudgetSeconds': 3000 # optional
+        }
+
+    Returns a ``dict`` similar to the following,
+
+    .. code-block:: python
+
+        {
+            'deadline': 1666000000.0, # epoch seconds
+            'sessionId': '<session-id>',
+            'tables': [
+                {
+                    'tableName': 'access_log_202210',
+                    'mode': 'SORT ONLY',
+                    'estimatedSeconds': 12.5
+                }
+            ],
+            'decisions': [
+                {
+                    'tableName': 'access_log_202210',
+                    'decision': 'VACUUM',
+                    'reason': '7500000 rows to process'
+                },
+                {
+                    'tableName': 'page',
+                    'decision': 'SKIP',
+                    'reason': '0.10% is below 5.00%'
+                }
+            ]
+        }
+
+    If ``mode`` is not one of ``VACUUM_MODES``, plans no VACUUM and records
+    an ``INVALID`` decision over every table so that the workflow still
+    proceeds to ANALYZE.
+    """
+    LOGGER.debug('planning VACUUM: %s', str(event))
+    mode = event['mode']
+    unsorted_threshold = float(
+        event.get('unsortedThreshold', UNSORTED_THRESHOLD),
+    )
+    time_budget = float(event.get('timeBudgetSeconds', TIME_BUDGET_SECONDS))
+    start_time = time.time()
+    session = open_session()
+    infos = query_table_info(session)
+    if mode in VACUUM_MODES:
+        plan, decisions = plan_vacuum(
+            infos,
+            mode,
+            unsorted_threshold,
+            time_budget,
+        )
+    else:
+        LOGGER.error('invalid VACUUM mode: %s', mode)
+        plan = []
+        decisions = [
+            {
+                'tableName': info['tableName'],
+                'decision': 'INVALID',
+                'reason': f'invalid VACUUM mode: {mode}',
+            } for info in infos
+        ]
+    for decision in decisions:
+        LOGGER.debug(
+            '%s %s: %s',
+            decision['decision'],
+            decision['tableName'],
+            decision['reason'],
+        )
+    return {
+        'deadline': start_time + time_budget,
+        # shared with the following steps of the workflow
+        'sessionId': session.session_id,
+        'tables': plan,
+        'decisions': decisions,
+    }
+
+
+def lambda_handler(event, context):
     """Runs VACUUM over a given table.
 
     ``event`` must be a ``dict`` similar to the following,
@@ -31,21 +359,60 @@ def lambda_handler(event, _):
 
         {
             'tableName': '<table-name>',
-            'mode': 'SORT ONLY'
+            'mode': 'SORT ONLY',
+            'deadline': 1666000000.0, # optional
+            'estimatedSeconds': 12.5, # optional
+            'sessionId': '<session-id>' # optional
         }
+
+    ``tableName`` must be one of the tables in the data warehouse, or a
+    monthly access log table.
+    ``mode`` must be one of ``VACUUM_MODES``.
+    Skips VACUUM if it is not estimated to finish before ``deadline``.
+    Cancels VACUUM that has not finished by ``deadline`` or shortly before
+    the Lambda function times out, and returns the ``TIMEOUT`` status.
+    Reuses the session of ``sessionId`` if it is alive.
     """
     LOGGER.debug('running VACUUM: %s', str(event))
     table_name = event['tableName']
-    # TODO: verify table_name
+    if table_name not in tables.TABLE_NAMES \
+        and not tables.is_access_log_slice_table_name(table_name):
+        LOGGER.error('invalid table name: %s', table_name)
+        return {
+            'tableName': table_name,
+            'status': 'INVALID',
+        }
     mode = event['mode']
-    # TODO: verify mode
-    queue_res = redshift_data.execute_statement(
-        WorkgroupName=WORKGROUP_NAME,
-        SecretArn=ADMIN_SECRET_ARN,
-        Database=ACCESS_LOGS_DATABASE_NAME,
-        Sql=f'VACUUM {mode} {table_name}',
+    if mode not in VACUUM_MODES:
+        LOGGER.error('invalid VACUUM mode: %s', mode)
+        return {
+            'tableName': table_name,
+            'status': 'INVALID',
+        }
+    deadline = event.get('deadline')
+    if deadline is not None:
+        estimated_seconds = event.get('estimatedSeconds', 0.0)
+        if time.time() + estimated_seconds > deadline:
+            LOGGER.warning(
+                'skipping VACUUM over %s to meet the deadline',
+                table_name,
+            )
+            return {
+                'tableName': table_name,
+                'status': 'SKIPPED',
+            }
+    timeout = context.get_remaining_time_in_millis() * 0.001 \
+        - CANCEL_MARGIN_SECONDS
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.time())
+    session = open_session(event.get('sessionId'))
+    statement_id = session.execute_statement(f'VACUUM {mode} {table_name}')
+    status, res = data_api.wait_for_results(
+        redshift_data,
+        statement_id,
+        polling_interval=POLLING_INTERVAL,
+        timeout=timeout,
     )
-    status, res = data_api.wait_for_results(redshift_data, queue_res['Id'])
     if status == 'FAILED':
         LOGGER.error('VACUUM over %s failed: %s', table_name, str(res))
     elif status is None:
@@ -59,6 +426,235 @@ def lambda_handler(event, _):
         )
     else:
         LOGGER.error('VACUUM over %s failed: %s', table_name, status)
+    return {
+        'tableName': table_name,
+        'status': status,
+        'sessionId': session.session_id,
+    }
+
+
+def next_table_handler(event, context):
+    """Runs VACUUM over the next table in a loop of the workflow.
+
+    ``event`` must be a ``dict`` similar to the following,
+
+    .. code-block:: python
+
+        {
+            'deadline': 1666000000.0, # optional
+            'vacuum': {
+                'sessionId': '<session-id>', # optional
+                'remaining': [
+                    {
+                        'tableName': 'access_log_202210',
+                        'mode': 'SORT ONLY',
+                        'estimatedSeconds': 12.5
+                    }
+                ],
+                'results': []
+            }
+        }
+
+    ``remaining`` starts with ``tables`` given by ``plan_handler``, and
+    ``sessionId`` with ``sessionId`` given by ``plan_handler``.
+    Runs ``lambda_handler`` over the first table in ``remaining``, and
+    returns ``vacuum`` with the table moved to ``results``.
+    ``sessionId`` in the returned ``vacuum`` is replaced with the session
+    that VACUUM has used, so that the next table reuses the latest session
+    rather than the one opened by ``plan_handler``, which may have expired
+    during a long VACUUM.
+
+    Returns a ``dict`` similar to the following,
+
+    .. code-block:: python
+
+        {
+            'sessionId': '<session-id>',
+            'remaining': [],
+            'results': [
+                {
+                    'tableName': 'access_log_202210',
+                    'status': 'FINISHED',
+                    'sessionId': '<session-id>'
+                }
+            ]
+        }
+    """
+    loop = event['vacuum']
+    remaining = loop['remaining']
+    if len(remaining) == 0:
+        return loop
+    table = remaining[0]
+    result = lambda_handler({
+        'tableName': table['tableName'],
+        'mode': table['mode'],
+        'deadline': event.get('deadline'),
+        'estimatedSeconds': table.get('estimatedSeconds', 0.0),
+        'sessionId': loop.get('sessionId'),
+    }, context)
+    return {
+        # skipped and invalid tables do not open a session
+        'sessionId': result.get('sessionId', loop.get('sessionId')),
+        'remaining': remaining[1:],
+        'results': loop.get('results', []) + [result],
+    }
+
+
+def decide_analyze(
+    info: Dict,
+    changed_rows: Dict[str, Dict],
+    threshold: float,
+) -> Dict:
+    """Decides whether to analyze a given table.
+
+    :param Dict info: statistics of the table given by ``query_table_info``.
+
+    :param Dict[str, Dict] changed_rows: numbers of rows changed per table
+    since the last ANALYZE given by ``query_changed_rows``.
+
+    :param float threshold: percentage of changed rows below which the table
+    is not analyzed.
+
+    :returns: ``dict`` of ``tableName``, ``decision`` (``ANALYZE`` or
+    ``SKIP``), and ``reason``.
+    """
+    table_name = info['tableName']
+    num_changed = changed_rows.get(table_name, {}).get('changedRows', 0)
+    if num_changed <= 0:
+        return {
+            'tableName': table_name,
+            'decision': 'SKIP',
+            'reason': 'not changed since the last ANALYZE',
+        }
+    tbl_rows = info['tblRows']
+    if tbl_rows > 0:
+        ratio = 100.0 * num_changed / tbl_rows
+    else:
+        ratio = 100.0
+    return {
+        'tableName': table_name,
+        'decision': 'ANALYZE' if ratio >= threshold else 'SKIP',
+        'reason': ''.join([
+            f'{num_changed} of {tbl_rows:.0f} rows changed',
+            f' ({ratio:.2f}%)',
+        ]),
+    }
+
+
+def analyze_handler(event, context):
+    """Runs ANALYZE over predicate columns of tables that loads have changed.
+
+    ``event`` must be a ``dict`` similar to the following,
+
+    .. code-block:: python
+
+        {
+            'analyzeThreshold': 10.0, # optional
+            'plan': {
+                'sessionId': '<session-id>' # optional
+            },
+            'vacuum': {
+                'sessionId': '<session-id>' # optional
+            }
+        }
+
+    Sums the numbers of rows that loads including micro-batch loads have
+    inserted, deleted, or updated per table since the table was last
+    analyzed, which ``LoadAccessLogs`` records in
+    ``tables.CHANGED_ROW_COUNT_TABLE_NAME``.
+    Skips tables that no load has changed, and tables whose changed rows are
+    less than ``analyzeThreshold`` percent of their rows.
+    ``stats_off`` in ``SVV_TABLE_INFO`` is not used, because Redshift updates
+    it lazily.
+    Deletes the numbers of the analyzed tables, and those of tables that no
+    longer exist or are empty, in the same transaction as ANALYZE.
+    Reuses the session of ``sessionId`` in ``vacuum`` given by
+    ``next_table_handler`` if it is alive, or otherwise that of ``sessionId``
+    in ``plan`` given by ``plan_handler``.
+    Cancels ANALYZE shortly before the Lambda function times out, and returns
+    the ``TIMEOUT`` status.
+
+    Returns a ``dict`` similar to the following,
+
+    .. code-block:: python
+
+        {
+            'status': 'FINISHED',
+            'durationMs': 1234.5,
+            'decisions': [
+                {
+                    'tableName': 'access_log_202210',
+                    'decision': 'ANALYZE',
+                    'reason': '12345 of 35000 rows changed (35.27%)',
+                    'durationMs': 1000.0
+                },
+                {
+                    'tableName': 'page',
+                    'decision': 'SKIP',
+                    'reason': 'not changed since the last ANALYZE'
+                }
+            ]
+        }
+    """
+    LOGGER.debug('running ANALYZE: %s', str(event))
+    threshold = float(event.get('analyzeThreshold', ANALYZE_THRESHOLD))
+    session_id = event.get('vacuum', {}).get('sessionId') \
+        or event.get('plan', {}).get('sessionId')
+    session = open_session(session_id)
+    changed_rows = query_changed_rows(session)
+    infos = query_table_info(session)
+    decisions = [
+        decide_analyze(info, changed_rows, threshold) for info in infos
+    ]
+    analyzed = [d for d in decisions if d['decision'] == 'ANALYZE']
+    # SVV_TABLE_INFO omits dropped and empty tables
+    table_names = set(info['tableName'] for info in infos)
+    counted = {
+        table_name: changed
+            for table_name, changed in changed_rows.items()
+            if table_name not in table_names
+    }
+    counted.update(
+        (d['tableName'], changed_rows[d['tableName']]) for d in analyzed
+    )
+    if len(analyzed) == 0:
+        LOGGER.debug('no tables to analyze')
+        return {
+            'status': 'FINISHED',
+            'durationMs': 0.0,
+            'decisions': decisions,
+        }
+    batch_id = session.batch_execute_statement([
+        # the changed rows have been checked above
+        'SET analyze_threshold_percent TO 0',
+    ] + [
+        f'ANALYZE {d["tableName"]} PREDICATE COLUMNS' for d in analyzed
+    ] + [
+        get_delete_changed_rows_statement(counted),
+        # the session may be reused
+        'RESET analyze_threshold_percent',
+    ])
+    status, res = data_api.wait_for_results(
+        redshift_data,
+        batch_id,
+        polling_interval=POLLING_INTERVAL,
+        timeout=context.get_remaining_time_in_millis() * 0.001
+            - CANCEL_MARGIN_SECONDS,
+    )
+    if status == 'FAILED':
+        LOGGER.error('ANALYZE failed: %s', str(res))
+    elif status is None:
+        LOGGER.error('ANALYZE timed out')
+        status = 'TIMEOUT'
+    elif status == 'FINISHED':
+        # the first sub-statement is SET
+        for decision, sub in zip(analyzed, res.get('SubStatements', [])[1:]):
+            decision['durationMs'] = \
+                sub.get('Duration', 0) * 0.001 * 0.001 # ns → ms
+    duration = res.get('Duration', 0) * 0.001 * 0.001 # ns → ms
+    LOGGER.debug('ANALYZE finished in %.3f ms', duration)
     return {
         'status': status,
+        'durationMs': duration,
+        'decisions': decisions,
     }
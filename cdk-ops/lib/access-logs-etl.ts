@@ -20,6 +20,7 @@ import type { DeploymentStage } from 'cdk-common';
 import { DataWarehouse } from './data-warehouse';
 import { LatestBoto3Layer } from './latest-boto3-layer';
 import { LibdatawarehouseLayer } from './libdatawarehouse-layer';
+import { PyarrowLayer } from './pyarrow-layer';
 
 export interface Props {
   /** S3 bucket that stores CloudFront access logs. */
@@ -57,6 +58,11 @@ export class AccessLogsETL extends Construct {
     } = props;
 
     // S3 bucket for processed access logs.
+    const copyManifestKeyPrefix = 'manifests/';
+    // profiles of Lambda invocations; see libdatawarehouse.profiling
+    const profileKeyPrefix = 'profiles/';
+    // snapshot of the dimension tables; see libdatawarehouse.dimensions
+    const dimensionSnapshotKey = 'dimension-snapshot';
     this.outputAccessLogsBucket = new s3.Bucket(
       this,
       'MaskedAccessLogsBucket',
@@ -70,6 +76,16 @@ export class AccessLogsETL extends Construct {
             // minimum resoluation is one day.
             abortIncompleteMultipartUploadAfter: Duration.days(1),
           },
+          {
+            // COPY manifests are no longer necessary after loading.
+            prefix: copyManifestKeyPrefix,
+            expiration: Duration.days(7),
+          },
+          {
+            // profiles are only for investigations.
+            prefix: profileKeyPrefix,
+            expiration: Duration.days(30),
+          },
         ],
         removalPolicy: RemovalPolicy.RETAIN,
       },
@@ -81,7 +97,16 @@ export class AccessLogsETL extends Construct {
     // masks newly created CloudFront access logs
     // - Lambda function
     const maskedAccessLogsKeyPrefix = 'masked/';
+    // must not overlap maskedAccessLogsKeyPrefix, otherwise rejected rows
+    // would trigger DeleteAccessLogs and be loaded onto the data warehouse.
+    const quarantinedAccessLogsKeyPrefix = 'quarantine/';
+    // duplicate filters of request IDs per date
+    const duplicateFilterKeyPrefix = 'duplicate-filters/';
     const maskAccessLogsLambdaTimeout = Duration.seconds(30);
+    // 'parquet' writes Parquet files instead of gzipped TSV files.
+    // see bin/benchmark-masked-formats.py
+    const maskedAccessLogsFormat: string = 'tsv';
+    const isParquetOutput = maskedAccessLogsFormat === 'parquet';
     const maskAccessLogsLambda = new PythonFunction(
       this,
       'MaskAccessLogsLambda',
@@ -91,16 +116,60 @@ export class AccessLogsETL extends Construct {
         entry: path.join('lambda', 'mask-access-logs'),
         index: 'index.py',
         handler: 'lambda_handler',
+        // pyarrow is bundled only for Parquet, because pyarrow and numpy
+        // enlarge the deployment and slow down cold starts.
+        layers: isParquetOutput
+          ? [libdatawarehouse.layer, new PyarrowLayer(this, 'Pyarrow').layer]
+          : [libdatawarehouse.layer],
         environment: {
           SOURCE_BUCKET_NAME: accessLogsBucket.bucketName,
           DESTINATION_BUCKET_NAME: this.outputAccessLogsBucket.bucketName,
           DESTINATION_KEY_PREFIX: maskedAccessLogsKeyPrefix,
+          QUARANTINE_KEY_PREFIX: quarantinedAccessLogsKeyPrefix,
+          DUPLICATE_FILTER_KEY_PREFIX: duplicateFilterKeyPrefix,
+          // a filter takes about 176 KiB with these parameters.
+          // see bin/measure-duplicate-filter.py
+          DUPLICATE_FILTER_CAPACITY: '100000',
+          DUPLICATE_FALSE_POSITIVE_RATE: '0.001',
+          OUTPUT_FORMAT: maskedAccessLogsFormat,
+          // 'hour' partitions masked access logs files by hour in addition to
+          // date; e.g., masked/2022/10/01/00/
+          PARTITION_GRANULARITY: 'day',
+          PROFILE_BUCKET_NAME: this.outputAccessLogsBucket.bucketName,
+          PROFILE_KEY_PREFIX: profileKeyPrefix,
+          // raise to profile a fraction of invocations
+          PROFILE_SAMPLE_RATE: '0',
+          // set to dimensionSnapshotKey to pre-encode dimension IDs.
+          // a snapshot grows with distinct referers and user agents, so
+          // check the memory usage before enabling it.
+          DIMENSION_SNAPSHOT_KEY: '',
         },
+        // importing pyarrow.parquet adds about 55 MB to the resident memory,
+        // which does not fit in the default 128 MB with a Parquet writer.
+        memorySize: isParquetOutput ? 512 : 128,
         timeout: maskAccessLogsLambdaTimeout,
       },
     );
     accessLogsBucket.grantRead(maskAccessLogsLambda);
     this.outputAccessLogsBucket.grantPut(maskAccessLogsLambda);
+    this.outputAccessLogsBucket.grantRead(
+      maskAccessLogsLambda,
+      `${duplicateFilterKeyPrefix}*`,
+    );
+    // copies a large masked or quarantine file onto itself to record its
+    // metadata
+    this.outputAccessLogsBucket.grantRead(
+      maskAccessLogsLambda,
+      `${maskedAccessLogsKeyPrefix}*`,
+    );
+    this.outputAccessLogsBucket.grantRead(
+      maskAccessLogsLambda,
+      `${quarantinedAccessLogsKeyPrefix}*`,
+    );
+    this.outputAccessLogsBucket.grantRead(
+      maskAccessLogsLambda,
+      dimensionSnapshotKey,
+    );
     // - SQS queue to capture creation of access logs files, which triggers
     //   the above Lambda function
     const maxBatchingWindow = Duration.minutes(5); // least frequency
@@ -147,6 +216,7 @@ export class AccessLogsETL extends Construct {
         entry: path.join('lambda', 'delete-access-logs'),
         index: 'index.py',
         handler: 'lambda_handler',
+        layers: [libdatawarehouse.layer],
         environment: {
           SOURCE_BUCKET_NAME: accessLogsBucket.bucketName,
           // bucket name for masked logs is necessary to verify input events.
@@ -157,6 +227,11 @@ export class AccessLogsETL extends Construct {
       },
     );
     accessLogsBucket.grantDelete(deleteAccessLogsLambda);
+    // verifies the metadata of masked access logs before deleting originals
+    this.outputAccessLogsBucket.grantRead(
+      deleteAccessLogsLambda,
+      `${maskedAccessLogsKeyPrefix}*`,
+    );
     // - SQS queue to capture creation of masked access logs files, which
     //   triggers the above Lambda function
     const maskedLogsQueue = new sqs.Queue(this, 'MaskedLogsQueue', {
@@ -194,17 +269,46 @@ export class AccessLogsETL extends Construct {
         environment: {
           SOURCE_BUCKET_NAME: this.outputAccessLogsBucket.bucketName,
           SOURCE_KEY_PREFIX: maskedAccessLogsKeyPrefix,
+          MANIFEST_KEY_PREFIX: copyManifestKeyPrefix,
+          LATE_ARRIVAL_DAYS: '3',
           REDSHIFT_WORKGROUP_NAME: dataWarehouse.workgroupName,
           COPY_ROLE_ARN: dataWarehouse.namespaceRole.roleArn,
           VACUUM_WORKFLOW_ARN: dataWarehouse.vacuumWorkflow.stateMachineArn,
+          QUERY_CACHE_BUCKET_NAME: dataWarehouse.queryCacheBucket.bucketName,
+          PROFILE_BUCKET_NAME: this.outputAccessLogsBucket.bucketName,
+          PROFILE_KEY_PREFIX: profileKeyPrefix,
+          // an invocation with `"profile": true` is profiled regardless
+          PROFILE_SAMPLE_RATE: '0',
+          // number of months of access logs to retain; '0' retains all.
+          // a daily run drops monthly access log tables of older months, and
+          // deletes their rows from the rollup, sample, and sketch tables.
+          RETENTION_MONTHS: '0',
+          // refreshed after every load even if MaskAccessLogs does not use it
+          DIMENSION_SNAPSHOT_KEY: dimensionSnapshotKey,
         },
         timeout: Duration.minutes(15),
         memorySize: 256,
+        // runs are serialized so that the daily and micro-batch runs never
+        // list and load the same new access logs at the same time.
+        reservedConcurrentExecutions: 1,
       },
     );
     this.outputAccessLogsBucket.grantRead(loadAccessLogsLambda);
+    this.outputAccessLogsBucket.grantPut(
+      loadAccessLogsLambda,
+      `${copyManifestKeyPrefix}*`,
+    );
+    this.outputAccessLogsBucket.grantPut(
+      loadAccessLogsLambda,
+      `${profileKeyPrefix}*`,
+    );
+    this.outputAccessLogsBucket.grantPut(
+      loadAccessLogsLambda,
+      dimensionSnapshotKey,
+    );
     dataWarehouse.grantQuery(loadAccessLogsLambda);
     dataWarehouse.vacuumWorkflow.grantStartExecution(loadAccessLogsLambda);
+    dataWarehouse.grantBumpDataVersion(loadAccessLogsLambda);
     // - schedules running loadAccessLogsLambda
     const loadSchedule = new events.Rule(this, 'LoadAccessLogsSchedule', {
       description: `Periodically loads access logs (${deploymentStage})`,
@@ -228,5 +332,27 @@ export class AccessLogsETL extends Construct {
         }),
       ],
     });
+    // - schedules micro-batch loading for fresher data (optional)
+    const microBatchLoadSchedule = new events.Rule(
+      this,
+      'MicroBatchLoadAccessLogsSchedule',
+      {
+        description: `Loads new access logs in micro-batches (${deploymentStage})`,
+        // enable the rule only if you need fresher data
+        enabled: false,
+        schedule: events.Schedule.rate(Duration.minutes(15)),
+        targets: [
+          new events_targets.LambdaFunction(loadAccessLogsLambda, {
+            event: events.RuleTargetInput.fromObject({
+              time: events.EventField.time,
+              microBatch: true,
+            }),
+            // the next run will catch up
+            maxEventAge: Duration.minutes(15),
+            retryAttempts: 0,
+          }),
+        ],
+      },
+    );
   }
 }
@@ -3,11 +3,13 @@ import * as path from 'path';
 import {
   Arn,
   Duration,
+  RemovalPolicy,
   Stack,
   aws_ec2 as ec2,
   aws_iam as iam,
   aws_lambda as lambda,
   aws_redshiftserverless as redshift,
+  aws_s3 as s3,
   aws_secretsmanager as secrets,
   aws_stepfunctions as sfn,
   aws_stepfunctions_tasks as sfn_tasks,
@@ -26,6 +28,12 @@ export const ADMIN_USER_NAME = 'dwadmin';
 /** Subnet group name of the cluster for Redshift Serverless. */
 export const CLUSTER_SUBNET_GROUP_NAME = 'dw-cluster';
 
+/** Prefix of the S3 object keys of cached query results. */
+export const QUERY_CACHE_KEY_PREFIX = 'results/';
+
+/** S3 object key of the data version token of the query cache. */
+export const DATA_VERSION_KEY = 'data-version';
+
 export interface Props {
   /** Lambda layer containing the latest boto3. */
   latestBoto3: LatestBoto3Layer;
@@ -52,6 +60,8 @@ export class DataWarehouse extends Construct {
   readonly populateDwDatabaseLambda: lambda.IFunction;
   /** Step Functions to run VACUUM over tables. */
   readonly vacuumWorkflow: sfn.IStateMachine;
+  /** S3 bucket of cached query results and the data version token. */
+  readonly queryCacheBucket: s3.IBucket;
 
   constructor(scope: Construct, id: string, props: Props) {
     super(scope, id);
@@ -147,6 +157,26 @@ export class DataWarehouse extends Construct {
     });
     this.workgroup.addDependsOn(dwNamespace);
 
+    // S3 bucket of cached query results
+    this.queryCacheBucket = new s3.Bucket(this, 'QueryCacheBucket', {
+      blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+      encryption: s3.BucketEncryption.S3_MANAGED,
+      enforceSSL: true,
+      lifecycleRules: [
+        {
+          // safeguard for incomplete multipart uploads.
+          // minimum resoluation is one day.
+          abortIncompleteMultipartUploadAfter: Duration.days(1),
+        },
+        {
+          // safeguard for results that no query cache has evicted.
+          prefix: QUERY_CACHE_KEY_PREFIX,
+          expiration: Duration.days(7),
+        },
+      ],
+      removalPolicy: RemovalPolicy.RETAIN,
+    });
+
     // Lambda function that populates the database and tables.
     this.populateDwDatabaseLambda = new PythonFunction(
       this,
@@ -182,60 +212,145 @@ export class DataWarehouse extends Construct {
     this.populateDwDatabaseLambda.role?.addManagedPolicy(iam.ManagedPolicy.fromAwsManagedPolicyName('AmazonRedshiftDataFullAccess'));
 
     // Step Functions that perform VACUUM over tables.
-    // - Lambda function that runs VACUUM over a given table
+    const vacuumWorkflowTimeout = Duration.hours(1);
+    // - maximum timeout of a Lambda function, which limits a single VACUUM
+    const vacuumTableTimeout = Duration.minutes(15);
+    // - environment common to the Lambda functions planning and running VACUUM
+    const vacuumEnvironment = {
+      WORKGROUP_NAME: this.workgroupName,
+      ADMIN_SECRET_ARN: this.adminSecret.secretArn,
+      UNSORTED_THRESHOLD: '5',
+      // leaves a margin for the workflow timeout
+      TIME_BUDGET_SECONDS: `${vacuumWorkflowTimeout.toSeconds() - 600}`,
+      VACUUM_ROWS_PER_SECOND: '1000000',
+      // leaves a margin for the timeout of VacuumTableLambda
+      MAX_VACUUM_SECONDS: `${vacuumTableTimeout.toSeconds() - 60}`,
+      // percentage of rows changed since the last ANALYZE
+      // same as the default of `analyze_threshold_percent`
+      ANALYZE_THRESHOLD: '10',
+    };
+    // - Lambda function that runs VACUUM over the next table in the loop
     const vacuumTableLambda = new PythonFunction(this, 'VacuumTableLambda', {
       description: `Runs VACUUM over a table (${deploymentStage})`,
       runtime: lambda.Runtime.PYTHON_3_8,
       architecture: lambda.Architecture.ARM_64,
       entry: path.join('lambda', 'vacuum-table'),
       index: 'index.py',
-      handler: 'lambda_handler',
+      handler: 'next_table_handler',
       layers: [latestBoto3.layer, libdatawarehouse.layer],
-      environment: {
-        WORKGROUP_NAME: this.workgroupName,
-        ADMIN_SECRET_ARN: this.adminSecret.secretArn,
-      },
-      timeout: Duration.minutes(15),
+      environment: vacuumEnvironment,
+      timeout: vacuumTableTimeout,
     });
     this.adminSecret.grantRead(vacuumTableLambda);
     this.grantQuery(vacuumTableLambda);
+    // - Lambda function that decides which tables to vacuum
+    const planVacuumLambda = new PythonFunction(this, 'PlanVacuumLambda', {
+      description: `Plans VACUUM over tables (${deploymentStage})`,
+      runtime: lambda.Runtime.PYTHON_3_8,
+      architecture: lambda.Architecture.ARM_64,
+      entry: path.join('lambda', 'vacuum-table'),
+      index: 'index.py',
+      handler: 'plan_handler',
+      layers: [latestBoto3.layer, libdatawarehouse.layer],
+      environment: vacuumEnvironment,
+      timeout: Duration.minutes(5),
+    });
+    this.adminSecret.grantRead(planVacuumLambda);
+    this.grantQuery(planVacuumLambda);
+    // - Lambda function that runs ANALYZE over tables changed by loads
+    const analyzeTablesLambda = new PythonFunction(
+      this,
+      'AnalyzeTablesLambda',
+      {
+        description: `Runs ANALYZE over tables (${deploymentStage})`,
+        runtime: lambda.Runtime.PYTHON_3_8,
+        architecture: lambda.Architecture.ARM_64,
+        entry: path.join('lambda', 'vacuum-table'),
+        index: 'index.py',
+        handler: 'analyze_handler',
+        layers: [latestBoto3.layer, libdatawarehouse.layer],
+        environment: vacuumEnvironment,
+        timeout: Duration.minutes(15),
+      },
+    );
+    this.adminSecret.grantRead(analyzeTablesLambda);
+    this.grantQuery(analyzeTablesLambda);
     // - state machine
-    //   - lists table names
-    const listTableNamesState = new sfn.Pass(this, 'ListTables', {
-      comment: 'Lists table names',
-      result: sfn.Result.fromArray([
-        'access_log',
-        'referer',
-        'page',
-        'edge_location',
-        'user_agent',
-        'result_type',
-      ]),
-      resultPath: '$.tables',
+    //   - plans VACUUM
+    const planVacuumState = new sfn_tasks.LambdaInvoke(this, 'PlanVacuum', {
+      comment: 'Decides which tables to vacuum',
+      lambdaFunction: planVacuumLambda,
+      payloadResponseOnly: true,
+      resultPath: '$.plan',
       // produces something like
       // {
       //   mode: 'SORT ONLY',
-      //   tableNames: ['access_log', ...]
+      //   // metrics given by LoadAccessLogs
+      //   load: { loaded: 10, changedRows: { page: 3, ... }, ... },
+      //   plan: {
+      //     deadline: 1666000000.0,
+      //     sessionId: '<session-id>', // reused by the first VACUUM
+      //     tables: [{ tableName: 'access_log_202210', ... }, ...],
+      //     decisions: [{ tableName: 'page', decision: 'SKIP', ... }, ...]
+      //   }
+      // }
+    });
+    //   - runs ANALYZE after VACUUM so that statistics reflect sorted tables
+    const analyzeTablesState = new sfn_tasks.LambdaInvoke(
+      this,
+      'AnalyzeTables',
+      {
+        comment: 'Runs ANALYZE over tables changed by loads',
+        lambdaFunction: analyzeTablesLambda,
+        payloadResponseOnly: true,
+        // records ANALYZE metrics alongside the load metrics
+        resultPath: '$.analyze',
+      },
+    );
+    //   - runs VACUUM over the planned tables one by one.
+    //     a loop instead of a Map state carries the session ID returned by
+    //     each VACUUM over to the next table and ANALYZE, because a Map state
+    //     cannot pass an output of an iteration to the next iteration.
+    const vacuumTableState = new sfn_tasks.LambdaInvoke(this, 'VacuumTable', {
+      comment: 'Runs VACUUM over the next table',
+      lambdaFunction: vacuumTableLambda,
+      payloadResponseOnly: true,
+      payload: sfn.TaskInput.fromObject({
+        'deadline.$': '$.plan.deadline',
+        'vacuum.$': '$.vacuum',
+      }),
+      // produces something like
+      // {
+      //   sessionId: '<session-id>', // latest session
+      //   remaining: [{ tableName: 'page', ... }, ...],
+      //   results: [{ tableName: 'access_log_202210', ... }, ...]
       // }
+      resultPath: '$.vacuum',
     });
+    const hasMoreTablesState = new sfn.Choice(this, 'HasMoreTables', {
+      comment: 'Checks if any tables remain to vacuum',
+    })
+      .when(
+        sfn.Condition.isPresent('$.vacuum.remaining[0]'),
+        vacuumTableState,
+      )
+      .otherwise(analyzeTablesState);
+    vacuumTableState.next(hasMoreTablesState);
     this.vacuumWorkflow = new sfn.StateMachine(this, 'VacuumWorkflow', {
       definition:
-        listTableNamesState.next(
-          new sfn.Map(this, 'MapTables', {
-            comment: 'Iterates over tables',
-            maxConcurrency: 1, // sequential
-            itemsPath: '$.tables',
+        planVacuumState
+          .next(new sfn.Pass(this, 'StartVacuumLoop', {
+            comment: 'Initializes the loop over tables to vacuum',
             parameters: {
-              'tableName.$': '$$.Map.Item.Value',
-              'mode.$': '$.mode',
+              'sessionId.$': '$.plan.sessionId',
+              'remaining.$': '$.plan.tables',
+              'results': [],
             },
-          }).iterator(
-            new sfn_tasks.LambdaInvoke(this, 'VacuumTable', {
-              lambdaFunction: vacuumTableLambda,
-            }),
-          ),
-        ),
-      timeout: Duration.hours(1),
+            // keeps the plan in the output
+            resultPath: '$.vacuum',
+          }))
+          .next(hasMoreTablesState),
+      timeout: vacuumWorkflowTimeout,
     });
   }
 
@@ -246,6 +361,25 @@ export class DataWarehouse extends Construct {
     }).subnetIds;
   }
 
+  /**
+   * Grants permissions to use the query cache.
+   *
+   * Allows `grantee` to read the data version token, and to read, write, and
+   * delete cached query results.
+   */
+  grantQueryCache(grantee: iam.IGrantable) {
+    this.queryCacheBucket.grantRead(grantee);
+    this.queryCacheBucket.grantPut(grantee, `${QUERY_CACHE_KEY_PREFIX}*`);
+    this.queryCacheBucket.grantDelete(grantee, `${QUERY_CACHE_KEY_PREFIX}*`);
+  }
+
+  /**
+   * Grants permissions to bump the data version token of the query cache.
+   */
+  grantBumpDataVersion(grantee: iam.IGrantable): iam.Grant {
+    return this.queryCacheBucket.grantPut(grantee, DATA_VERSION_KEY);
+  }
+
   /**
    * Grants permissions to query this data warehouse via the Redshift Data API.
    *
@@ -0,0 +1,22 @@
+import * as path from 'path';
+
+import { aws_lambda as lambda } from 'aws-cdk-lib';
+import { Construct } from 'constructs';
+import { PythonLayerVersion } from '@aws-cdk/aws-lambda-python-alpha';
+
+/** CDK construct that provisions a Lambda layer containing pyarrow. */
+export class PyarrowLayer extends Construct {
+  /** Lambda layer containing pyarrow and numpy. */
+  readonly layer: lambda.ILayerVersion;
+
+  constructor(scope: Construct, id: string) {
+    super(scope, id);
+
+    this.layer = new PythonLayerVersion(this, 'LambdaLayer', {
+      description: 'Lambda layer containing pyarrow',
+      entry: path.join('lambda', 'pyarrow'),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_8],
+      compatibleArchitectures: [lambda.Architecture.X86_64],
+    });
+  }
+}